@@ -0,0 +1,87 @@
+// Binary framing for the realtime stream to and from realtime_analysis.py
+// --binary. See ml-services/frame_protocol.py for the layout; everything is
+// little-endian.
+
+const FRAME_MAGIC = Buffer.from('SIHF');
+const RESULT_MAGIC = Buffer.from('SIHR');
+const FRAME_HEADER_SIZE = 26;
+const RESULT_HEADER_SIZE = 20;
+const MAX_PAYLOAD = 32 * 1024 * 1024;
+
+const ENCODINGS = { jpeg: 0, bgr: 1, i420: 2, control: 255 };
+
+// Header + payload for one frame. `data` is a Buffer, ArrayBuffer or typed
+// array with the encoded image; `timestamp` is the client's capture time in
+// ms since the epoch.
+function encodeFrame({ data, encoding = 'jpeg', width = 0, height = 0, session = 0, timestamp = 0 }) {
+  const payload = Buffer.isBuffer(data) ? data : Buffer.from(data.buffer || data, data.byteOffset || 0, data.byteLength);
+  const header = Buffer.alloc(FRAME_HEADER_SIZE);
+  FRAME_MAGIC.copy(header, 0);
+  header.writeUInt8(ENCODINGS[encoding] ?? ENCODINGS.jpeg, 4);
+  header.writeUInt8(0, 5);
+  header.writeUInt16LE(width, 6);
+  header.writeUInt16LE(height, 8);
+  header.writeUInt32LE(session, 10);
+  header.writeDoubleLE(timestamp, 14);
+  header.writeUInt32LE(payload.length, 22);
+  return [header, payload];
+}
+
+// Control message for the multi-session service (realtime_server.py), e.g.
+// { type: 'start', testType } or { type: 'end' }.
+function encodeControl(session, message) {
+  return encodeFrame({ data: Buffer.from(JSON.stringify(message)), encoding: 'control', session });
+}
+
+// Frame payload for whatever a client sent on 'video-stream': binary
+// frames ({ data, encoding, width, height, timestamp }) pass through, and
+// legacy { frame: <base64 JPEG> } messages (objects or JSON lines) are
+// decoded to raw JPEG bytes.
+function frameFromMessage(message) {
+  if (typeof message === 'string') {
+    try {
+      message = JSON.parse(message);
+    } catch (e) {
+      return null;
+    }
+  }
+  if (!message) return null;
+  if (message.data) return message.encoding === 'control' ? null : message;
+  if (typeof message.frame === 'string') {
+    return { data: Buffer.from(message.frame, 'base64'), encoding: 'jpeg', timestamp: message.timestamp || 0 };
+  }
+  return null;
+}
+
+// Splits a stdout byte stream into result messages and calls
+// onResult(result, { session, timestamp }) for each.
+function createResultParser(onResult, onError) {
+  let pending = Buffer.alloc(0);
+  return (chunk) => {
+    pending = pending.length ? Buffer.concat([pending, chunk]) : chunk;
+    while (pending.length >= RESULT_HEADER_SIZE) {
+      if (!pending.subarray(0, 4).equals(RESULT_MAGIC)) {
+        onError(new Error('Bad result header from the analysis process.'));
+        pending = Buffer.alloc(0);
+        return;
+      }
+      const length = pending.readUInt32LE(16);
+      if (length > MAX_PAYLOAD) {
+        onError(new Error(`Result of ${length} bytes is too large.`));
+        pending = Buffer.alloc(0);
+        return;
+      }
+      if (pending.length < RESULT_HEADER_SIZE + length) return;
+      const meta = { session: pending.readUInt32LE(4), timestamp: pending.readDoubleLE(8) };
+      const payload = pending.subarray(RESULT_HEADER_SIZE, RESULT_HEADER_SIZE + length);
+      pending = pending.subarray(RESULT_HEADER_SIZE + length);
+      try {
+        onResult(JSON.parse(payload.toString('utf8')), meta);
+      } catch (e) {
+        onError(e);
+      }
+    }
+  };
+}
+
+module.exports = { ENCODINGS, encodeFrame, encodeControl, frameFromMessage, createResultParser };
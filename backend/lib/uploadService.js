@@ -0,0 +1,55 @@
+// The long-lived upload service (ml-services/uploader.py serve). Analyses
+// return as soon as their annotated video is handed to it, with a pending
+// "analyzedVideo" handle; the service writes the upload's progress to the
+// handle's status file, which waitForUpload() polls.
+
+const { spawn } = require('child_process');
+const fs = require('fs/promises');
+
+const POLL_INTERVAL_MS = 2000;
+// Retries with backoff can take a while on a large video
+const UPLOAD_TIMEOUT_MS = 30 * 60 * 1000;
+
+let uploadProcess = null;
+
+function startUploadService() {
+  if (uploadProcess) return uploadProcess;
+  uploadProcess = spawn('python', ['ml-services/uploader.py', 'serve']);
+  uploadProcess.stderr.on('data', (data) => console.error(`Upload service: ${data.toString()}`));
+  uploadProcess.on('close', (code) => {
+    // Analyses upload in their own process until it is back
+    console.log(`Upload service closed with code ${code}.`);
+    uploadProcess = null;
+  });
+  return uploadProcess;
+}
+
+function isAlive(pid) {
+  try {
+    process.kill(pid, 0);
+    return true;
+  } catch (e) {
+    return e.code === 'EPERM';
+  }
+}
+
+// Resolves with the upload's final status ({ status: 'done', url } or
+// { status: 'failed', error }), or null if its status file or the process
+// uploading it went away, or it took longer than UPLOAD_TIMEOUT_MS.
+async function waitForUpload(handle) {
+  const deadline = Date.now() + UPLOAD_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    let status;
+    try {
+      status = JSON.parse(await fs.readFile(handle.statusFile, 'utf8'));
+    } catch (e) {
+      return null;
+    }
+    if (status.status === 'done' || status.status === 'failed') return status;
+    if (status.pid && !isAlive(status.pid)) return null;
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+  return null;
+}
+
+module.exports = { startUploadService, waitForUpload };
@@ -0,0 +1,268 @@
+"""Content-addressed on-disk cache of pose tracks and analysis results.
+
+Two kinds of entries live under ANALYSIS_CACHE_DIR:
+
+    tracks/<key>.npz    Extracted PoseTracks, keyed by the video's content hash
+                        plus the pose model and extraction settings (sampling
+                        policy etc.) they were extracted with.
+    results/<key>.json  Final result JSON, keyed by the track key plus the test
+                        type and that test's analyzer version.
+
+Re-submitting the same clip is answered straight from results/. Bumping a
+test's 'version' in registry.py (e.g. after changing a threshold) misses the
+result cache but still hits the track cache, so only scoring is redone.
+
+The cache is bounded by ANALYSIS_CACHE_MAX_BYTES; entries are touched on every
+hit and the least recently used ones are evicted first.
+
+    python analysis_cache.py stats
+    python analysis_cache.py list [--kind tracks|results]
+    python analysis_cache.py purge [--kind tracks|results] [--older-than DAYS]
+"""
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import sys
+import tempfile
+import time
+
+from registry import extraction_settings, get_test
+
+CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'sih2025-analysis'))
+MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+ENABLED = os.environ.get('ANALYSIS_CACHE', '1') != '0'
+
+KINDS = {'tracks': '.npz', 'results': '.json'}
+# Bumped when extraction yields different tracks under the same settings
+# (2: sampling, keyframes and motion gate refreshes on a frame index grid)
+TRACK_VERSION = 2
+
+# --- Keys ---
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _hash_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _mediapipe_version():
+    try:
+        return importlib.metadata.version('mediapipe')
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def track_key(video_digest, settings):
+    """Key for a video's track under the given registry.extraction_settings().
+
+    'chunking' is left out: a chunked extraction stitches into the same track
+    as a sequential one (see chunking.py), and whether a video is split
+    depends on where it is extracted (pool workers never split, nor does a
+    streamed download).
+    """
+    settings = {name: value for name, value in settings.items() if name != 'chunking'}
+    return _hash_key('track', video_digest, settings, _mediapipe_version(), TRACK_VERSION)
+
+def result_key(track_key_, test_type, render=True, overlay=False):
+    """Key for a test's result; score-only and overlay results are kept apart."""
+    test = get_test(test_type)
+    parts = ('result', track_key_, test_type, test['version'] if test else None)
+    if not render:
+        parts += ('score-only',)
+    if overlay:
+        parts += ('overlay',)
+    return _hash_key(*parts)
+
+# --- Storage ---
+def _entry_path(kind, key):
+    return os.path.join(CACHE_DIR, kind, key + KINDS[kind])
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _atomic_write(path, write):
+    """Writes via a temp file in the same directory so readers never see partial entries."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def get_result(key):
+    if not ENABLED:
+        return None
+    path = _entry_path('results', key)
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    _touch(path)
+    return result
+
+def put_result(key, result):
+    if not ENABLED or 'error' in result:
+        return
+    _atomic_write(_entry_path('results', key), lambda f: f.write(json.dumps(result).encode('utf-8')))
+    evict()
+
+def load_track(path):
+    """Reads a PoseTrack saved with save_track(), or None if it can't be read."""
+    import numpy as np
+    from pose_track import PoseTrack
+
+    try:
+        with np.load(path) as data:
+            return PoseTrack(
+                landmarks=data['landmarks'],
+                timestamps=data['timestamps'],
+                present=data['present'],
+                inferred=data['inferred'] if 'inferred' in data else None,
+                fps=float(data['fps']),
+                width=int(data['width']),
+                height=int(data['height']),
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_track(path, track):
+    """Writes a PoseTrack to an .npz file, atomically."""
+    import numpy as np
+
+    _atomic_write(path, lambda f: np.savez_compressed(
+        f,
+        landmarks=track.landmarks,
+        timestamps=track.timestamps,
+        present=track.present,
+        inferred=track.inferred,
+        fps=track.fps,
+        width=track.width,
+        height=track.height,
+    ))
+
+def get_track(key):
+    if not ENABLED:
+        return None
+    path = _entry_path('tracks', key)
+    track = load_track(path)
+    if track is not None:
+        _touch(path)
+    return track
+
+def put_track(key, track):
+    if not ENABLED:
+        return
+    save_track(_entry_path('tracks', key), track)
+    evict()
+
+def cached_extract_track(video_path, pose=None, settings=None):
+    """Returns the PoseTrack for a video, extracting (and caching) it only on a miss."""
+    from pose_track import extract_track
+
+    if settings is None:
+        settings = extraction_settings([])
+    if not ENABLED:
+        return extract_track(video_path, pose=pose, settings=settings)
+
+    key = track_key(file_digest(video_path), settings)
+    track = get_track(key)
+    if track is not None:
+        print(f"Pose track cache hit for {video_path}", file=sys.stderr)
+        return track
+
+    track = extract_track(video_path, pose=pose, settings=settings)
+    if track is not None:
+        put_track(key, track)
+    return track
+
+# --- Eviction and Inspection ---
+def list_entries(kind=None):
+    """Returns (kind, key, size_bytes, last_used) for every entry, oldest first."""
+    entries = []
+    for entry_kind, suffix in KINDS.items():
+        if kind and entry_kind != kind:
+            continue
+        directory = os.path.join(CACHE_DIR, entry_kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.endswith(suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue  # Removed by another process
+            entries.append((entry_kind, name[:-len(suffix)], stat.st_size, stat.st_mtime))
+    entries.sort(key=lambda e: e[3])
+    return entries
+
+def remove_entry(kind, key):
+    try:
+        os.remove(_entry_path(kind, key))
+    except FileNotFoundError:
+        pass
+
+def evict(max_bytes=None):
+    """Deletes least recently used entries until the cache fits in max_bytes."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = list_entries()
+    total = sum(e[2] for e in entries)
+    removed = 0
+    for kind, key, size, _ in entries:
+        if total <= max_bytes:
+            break
+        remove_entry(kind, key)
+        total -= size
+        removed += 1
+    return removed
+
+def purge(kind=None, older_than_seconds=None):
+    now = time.time()
+    removed = 0
+    for entry_kind, key, _, last_used in list_entries(kind):
+        if older_than_seconds is not None and now - last_used < older_than_seconds:
+            continue
+        remove_entry(entry_kind, key)
+        removed += 1
+    return removed
+
+def stats():
+    summary = {"cache_dir": CACHE_DIR, "max_bytes": MAX_BYTES, "enabled": ENABLED}
+    for kind in KINDS:
+        entries = list_entries(kind)
+        summary[kind] = {"entries": len(entries), "bytes": sum(e[2] for e in entries)}
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or purge the pose track / result cache.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show entry counts and sizes.")
+    list_parser = subparsers.add_parser('list', help="List entries, least recently used first.")
+    list_parser.add_argument('--kind', choices=list(KINDS))
+    purge_parser = subparsers.add_parser('purge', help="Delete entries.")
+    purge_parser.add_argument('--kind', choices=list(KINDS))
+    purge_parser.add_argument('--older-than', type=float, metavar='DAYS',
+                              help="Only delete entries not used in this many days.")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(json.dumps(stats(), indent=2))
+    elif args.command == 'list':
+        for kind, key, size, last_used in list_entries(args.kind):
+            print(f"{kind:8} {key} {size:>12} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_used))}")
+    else:
+        older_than = args.older_than * 86400 if args.older_than is not None else None
+        print(json.dumps({"removed": purge(args.kind, older_than)}))
@@ -0,0 +1,286 @@
+"""Long-lived analysis worker pool.
+
+Instead of starting a fresh interpreter (and a fresh MediaPipe Pose graph) for
+every uploaded video, this keeps a pool of warm worker processes around. Each
+worker imports cv2/mediapipe and every analyzer module once, builds its Pose
+model once, and then serves jobs until it is shut down.
+
+Two local job APIs are offered:
+
+    python analysis_worker.py serve [--socket PATH] [--workers N]
+        Unix socket server. A client connects, writes one JSON job line and
+        reads back one JSON result line (see submit_job()).
+
+    python analysis_worker.py stdio [--workers N]
+        Reads JSON job lines from stdin and writes JSON result lines to stdout
+        as jobs finish (results may come back out of order; match them by id).
+
+    python analysis_worker.py run VIDEO TEST_TYPE [TEST_TYPE ...] [--score-only] [--overlay]
+        One-off: analyses a single video in this process, without a pool, and
+        prints a JSON list with one result per test type.
+
+A job looks like {"id": "...", "video_path": "...", "test_type": "Sit Ups"} and
+the result is the same JSON the per-test scripts print, wrapped as
+{"id": "...", "result": {...}}. A job may instead list several tests, as in
+{"test_types": ["Sit Ups", "Vertical Jump"]}; they all share one decode and
+pose inference pass, and "result" is then a list in the same order. Jobs with
+"render": false are score-only: no annotated video is rendered or uploaded.
+Otherwise the annotated video uploads in the background after the result is
+returned; its "analyzedVideo" handle says where to look (see uploader.py).
+Jobs with "overlay": true add a compact overlay track (see overlay_track.py).
+Jobs with "extract_to": PATH only extract the video's pose track and save
+it there, and jobs with "track_path": PATH are scored from such a track;
+analyze_video.py uses the two for downloads it streams to a named pipe.
+Jobs with "probe": true return the clip's pre-flight probe report (see
+probe.py), so the dispatcher doesn't load a Pose model of its own.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+from registry import extraction_settings, get_test, load_entry_point, preload_all
+
+DEFAULT_SOCKET_PATH = os.environ.get('ANALYSIS_WORKER_SOCKET', '/tmp/sih2025-analysis.sock')
+DEFAULT_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+
+# --- Worker Process State ---
+# Populated once per worker process by _init_worker().
+_pose = None
+
+def reset_pose(pose):
+    """Clears tracking state so landmarks from one video don't leak into the next."""
+    pose.reset()
+
+def _init_worker():
+    global _pose
+    from pose_track import create_pose
+    from probe import _get_pose
+    preload_all()
+    _pose = create_pose()
+    _get_pose()
+    print(f"Analysis worker {os.getpid()} ready.", file=sys.stderr)
+
+def run_tests(video_path, test_types, pose=None, render=True, overlay=False, track=None):
+    """Runs several analyzers against a single decode/inference pass of one video.
+
+    Returns one result object per requested test type, in order. With
+    render=False the annotated videos are skipped (score-only); with
+    overlay=True each result carries an overlay track. A PoseTrack that was
+    already extracted can be passed as `track`.
+    """
+    from analysis_cache import cached_extract_track
+
+    results = []
+    for test_type in test_types:
+        if get_test(test_type) is None:
+            results.append({"error": f"Invalid test type: {test_type}."})
+            continue
+        try:
+            if track is None:
+                if pose is not None:
+                    reset_pose(pose)
+                settings = extraction_settings([t for t in test_types if get_test(t)])
+                track = cached_extract_track(video_path, pose=pose, settings=settings)
+                if track is None:
+                    return [{"error": f"Could not open video file: {video_path}"} for _ in test_types]
+            analyze = load_entry_point(test_type)
+            results.append(analyze(video_path, pose=pose, track=track, render=render, overlay=overlay))
+        except Exception:
+            results.append({"error": f"Analysis failed: {traceback.format_exc()}"})
+    return results
+
+def extract_to(video_path, test_types, track_path, pose=None):
+    """Extracts a video's pose track for test_types and saves it to track_path.
+
+    Used for streamed downloads (see analyze_video.stream_analyses()): the
+    named pipe is read once, here, and the track is handed back as a file.
+    Returns {"track_path": ...} or an error.
+    """
+    from analysis_cache import save_track
+    from pose_track import extract_track
+
+    if pose is not None:
+        reset_pose(pose)
+    track = extract_track(video_path, pose=pose, settings=extraction_settings([t for t in test_types if get_test(t)]))
+    if track is None:
+        return {"error": f"Could not open video file: {video_path}"}
+    save_track(track_path, track)
+    return {"track_path": track_path}
+
+def run_job(job):
+    """Runs a single job inside a warm worker process and returns (id, result).
+
+    Jobs with "test_types" (a list) get a list of results back; jobs with a
+    single "test_type" get a single result object. Jobs with "extract_to"
+    only extract the track to that path (see extract_to()); jobs with
+    "track_path" are scored from the track saved there, and "probe" jobs
+    get the clip's probe report.
+    """
+    job_id = job.get('id')
+    if job.get('probe'):
+        from probe import probe_video
+        return job_id, probe_video(job['video_path'])
+    test_types = job['test_types'] if 'test_types' in job else [job.get('test_type')]
+    if job.get('extract_to'):
+        return job_id, extract_to(job['video_path'], test_types, job['extract_to'], _pose)
+    track = None
+    if job.get('track_path'):
+        from analysis_cache import load_track
+        track = load_track(job['track_path'])
+    results = run_tests(job['video_path'], test_types, _pose, render=job.get('render', True),
+                        overlay=job.get('overlay', False), track=track)
+    return job_id, results if 'test_types' in job else results[0]
+
+def create_pool(workers=DEFAULT_WORKERS, max_jobs_per_worker=None):
+    """Starts `workers` warm processes, each with its own pre-loaded Pose model."""
+    return multiprocessing.Pool(
+        processes=max(1, workers),
+        initializer=_init_worker,
+        maxtasksperchild=max_jobs_per_worker,
+    )
+
+# --- Unix Socket API ---
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+            _, result = self.server.pool.apply(run_job, (job,))
+        except json.JSONDecodeError:
+            result = {"error": "Invalid job: expected one JSON object per line."}
+        except Exception:
+            # Answer anyway: a client that gets no line runs the job again itself
+            result = {"error": f"Analysis worker failed: {traceback.format_exc()}"}
+            print(result["error"], file=sys.stderr)
+        self.wfile.write((json.dumps(result) + '\n').encode('utf-8'))
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool):
+        self.pool = pool
+        super().__init__(socket_path, _JobHandler)
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, workers=DEFAULT_WORKERS, max_jobs_per_worker=None):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Stale socket from a previous run
+
+    pool = create_pool(workers, max_jobs_per_worker)
+    server = JobServer(socket_path, pool)
+    print(f"Analysis worker pool ({workers} workers) listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.terminate()
+        pool.join()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def submit_job(video_path, test_types, socket_path=DEFAULT_SOCKET_PATH, timeout=None, render=True, overlay=False,
+               track_path=None):
+    """Sends one job to a running `serve` pool and returns one result per test type.
+
+    With `track_path`, the tests are scored from the track saved there
+    instead of extracting one. If the job failed in the pool, every test
+    gets its error.
+    """
+    job = {"video_path": os.path.abspath(video_path), "test_types": list(test_types),
+           "render": render, "overlay": overlay}
+    if track_path:
+        job["track_path"] = track_path
+    results = _send_job(job, socket_path, timeout)
+    if isinstance(results, dict):
+        return [results for _ in test_types]
+    return results
+
+def submit_extraction(video_path, test_types, track_path, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+    """Has a running `serve` pool extract a video's track to track_path (see extract_to())."""
+    job = {"video_path": os.path.abspath(video_path), "test_types": list(test_types), "extract_to": track_path}
+    return _send_job(job, socket_path, timeout)
+
+def submit_probe(video_path, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+    """Has a running `serve` pool probe a clip; returns its report (see probe.probe_video())."""
+    report = _send_job({"video_path": os.path.abspath(video_path), "probe": True}, socket_path, timeout)
+    if 'error' in report:
+        raise ValueError(report['error'])
+    return report
+
+def _send_job(job, socket_path, timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as response:
+            line = response.readline()
+    if not line:
+        raise ConnectionError("Analysis worker closed the connection without a result.")
+    return json.loads(line)
+
+# --- stdin/stdout JSONL API ---
+def serve_stdio(workers=DEFAULT_WORKERS, max_jobs_per_worker=None):
+    pool = create_pool(workers, max_jobs_per_worker)
+    write_lock = threading.Lock()
+
+    def emit(payload):
+        with write_lock:
+            sys.stdout.write(json.dumps(payload) + '\n')
+            sys.stdout.flush()
+
+    def on_done(job_result):
+        job_id, result = job_result
+        emit({"id": job_id, "result": result})
+
+    pending = []
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError:
+                emit({"id": None, "result": {"error": f"Invalid job line: {line}"}})
+                continue
+            def on_error(e, job_id=job.get('id')):
+                emit({"id": job_id, "result": {"error": f"Analysis worker failed: {e!r}"}})
+            pending.append(pool.apply_async(run_job, (job,), callback=on_done, error_callback=on_error))
+        for job in pending:
+            job.wait()
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm MediaPipe analysis worker pool.")
+    parser.add_argument('mode', choices=['serve', 'stdio', 'run'])
+    parser.add_argument('video_path', nargs='?', help="Video to analyse (run mode).")
+    parser.add_argument('test_types', nargs='*', help="Test types to run on the video (run mode).")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help="Unix socket path (serve mode).")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of warm worker processes.")
+    parser.add_argument('--max-jobs-per-worker', type=int, default=None,
+                        help="Recycle a worker after this many jobs (guards against leaks).")
+    parser.add_argument('--score-only', action='store_true',
+                        help="Skip rendering and uploading annotated videos (run mode).")
+    parser.add_argument('--overlay', action='store_true',
+                        help="Add a compact overlay track to each result (run mode).")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args.socket, args.workers, args.max_jobs_per_worker)
+    elif args.mode == 'stdio':
+        serve_stdio(args.workers, args.max_jobs_per_worker)
+    else:
+        if not args.video_path or not args.test_types:
+            parser.error("run mode needs a video path and at least one test type")
+        print(json.dumps(run_tests(args.video_path, args.test_types, render=not args.score_only, overlay=args.overlay)))
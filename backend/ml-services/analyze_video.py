@@ -2,11 +2,17 @@ import sys
 import json
 import os
 import subprocess
-import requests
-import tempfile
 import urllib.parse
 import traceback
 
+import analysis_cache
+import artifact_store
+import uploader
+from analysis_worker import DEFAULT_SOCKET_PATH, run_tests, submit_extraction, submit_job, submit_probe
+from probe import preflight, probe_video
+from registry import extraction_settings, get_test
+from source_cache import fetch
+
 def is_url(path):
     """Checks if the given string is a valid URL."""
     try:
@@ -15,76 +21,227 @@ def is_url(path):
     except ValueError:
         return False
 
-def download_video(video_url):
-    """Downloads a video from a URL to a temporary file."""
-    try:
-        print(f"Attempting to download video from URL: {video_url}", file=sys.stderr)
-        response = requests.get(video_url, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        
-        # Use tempfile to create a temporary video file
-        temp_video = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        for chunk in response.iter_content(chunk_size=8192):
-            temp_video.write(chunk)
-        temp_video.close()
-        print(f"Video downloaded to temporary file: {temp_video.name}", file=sys.stderr)
-        return temp_video.name
-    except Exception as e:
-        raise RuntimeError(f"Failed to download video from URL: {e}")
-
-def dispatch_analysis(video_path, test_type):
-    """Dispatches the analysis to the correct sub-script."""
-    test_scripts = {
-        'Sit Ups': 'situps.py',
-        'Vertical Jump': 'verticaljump.py',
-        'Shuttle Run': 'shuttlerun.py',
-        'Endurance Run': 'endurancerun.py',
-        'Broad Jump': 'broadjump.py' # ✅ The newly added test
-    }
-
-    script_name = test_scripts.get(test_type)
-    if not script_name:
-        return {"error": f"Invalid test type: {test_type}."}
-
-    script_path = os.path.join(os.path.dirname(__file__), script_name)
-    
+def dispatch_analysis(video_path, test_type, render=True, overlay=False):
+    """Dispatches a single test's analysis; see dispatch_analyses()."""
+    return dispatch_analyses(video_path, [test_type], render=render, overlay=overlay)[0]
+
+def dispatch_analyses(video_path, test_types, run=None, render=True, overlay=False, settings=None, digest=None,
+                      track=None):
+    """Runs one or more tests on a video, sharing one decode/inference pass.
+
+    Returns one result object per requested test type, in the same order.
+    `run(video_path, test_types, render, overlay)` does the actual analysis of
+    cache misses; by default it goes to a worker pool or a subprocess
+    (_run_analyses). Cache misses are probed first (see probe.py), on the
+    pool too when it is running, and tests the clip can't be scored for get
+    a rejection instead of being run; an already extracted `track` is
+    judged instead of sampling the file again.
+    With render=False no annotated video is produced; it can be rendered
+    later with render_video.py. With overlay=True each result carries a
+    compact overlay track for client-side drawing instead.
+    `settings` and `digest` (the extraction settings and the file's SHA-256)
+    are worked out from the tests and the file when not given.
+
+    A cached result whose annotated video was still uploading is settled
+    first (see uploader.settle()): it is stored again with the final URL, or
+    analysed again if the upload failed.
+    """
+    results = {}
+    cache_keys = {}
+    pending = []
+
+    # Same clip, same extraction settings, same analyzer version: reuse the stored
+    # result without decoding a single frame.
+    track_key = None
+    if analysis_cache.ENABLED:
+        settings = settings or extraction_settings([t for t in dict.fromkeys(test_types) if get_test(t)])
+        track_key = analysis_cache.track_key(digest or analysis_cache.file_digest(video_path), settings)
+
+    for test_type in test_types:
+        if test_type in results or test_type in pending:
+            continue
+        if not get_test(test_type):
+            results[test_type] = {"error": f"Invalid test type: {test_type}."}
+            continue
+        if track_key:
+            cache_keys[test_type] = analysis_cache.result_key(track_key, test_type, render, overlay)
+            cached = analysis_cache.get_result(cache_keys[test_type])
+            settled = cached and uploader.settle(cached)
+            if settled is not cached and settled is not None:
+                analysis_cache.put_result(cache_keys[test_type], settled)
+            cached = settled
+            if cached is not None:
+                print(f"Result cache hit for {video_path} ({test_type})", file=sys.stderr)
+                results[test_type] = cached
+                continue
+        pending.append(test_type)
+
+    if pending:
+        # Rejections aren't cached, so a clip is re-probed under new limits
+        results.update(preflight(video_path, pending, track=track, probe=_probe))
+        pending = [test_type for test_type in pending if test_type not in results]
+
+    if pending:
+        for test_type, result in zip(pending, (run or _run_analyses)(video_path, pending, render, overlay)):
+            results[test_type] = result
+            if test_type in cache_keys:
+                analysis_cache.put_result(cache_keys[test_type], result)
+
+    return [results[test_type] for test_type in test_types]
+
+def _probe(video_path):
+    """The clip's probe report, from a warm worker if available, else from this process."""
+    socket_path = DEFAULT_SOCKET_PATH
+    if os.path.exists(socket_path):
+        try:
+            return submit_probe(video_path, socket_path=socket_path)
+        except (OSError, ValueError) as e:
+            print(f"Worker pool unavailable ({e}), probing in this process.", file=sys.stderr)
+    return probe_video(video_path)
+
+def _run_analyses(video_path, test_types, render=True, overlay=False):
+    """Runs the analyses on a warm worker if available, else in a subprocess."""
+    # Prefer a running worker pool (analysis_worker.py serve): its processes
+    # already have cv2/mediapipe imported and a Pose model loaded.
+    socket_path = DEFAULT_SOCKET_PATH
+    if os.path.exists(socket_path):
+        try:
+            print(f"Submitting analysis to worker pool at {socket_path} for video: {video_path}", file=sys.stderr)
+            return submit_job(video_path, test_types, socket_path=socket_path, render=render, overlay=overlay)
+        except (OSError, ValueError) as e:
+            print(f"Worker pool unavailable ({e}), falling back to subprocess.", file=sys.stderr)
+
+    # A single test runs its own script; several tests run together in one
+    # process so they can share the decode/inference pass.
+    if len(test_types) == 1:
+        script_args = [os.path.join(os.path.dirname(__file__), get_test(test_types[0])['script']), video_path]
+    else:
+        script_args = [os.path.join(os.path.dirname(__file__), 'analysis_worker.py'), 'run', video_path, *test_types]
+    if not render:
+        script_args.append('--score-only')
+    if overlay:
+        script_args.append('--overlay')
+
     try:
-        # Call the specific test script as a subprocess
-        print(f"Dispatching analysis to: {script_path} for video: {video_path}", file=sys.stderr)
+        # Call the analysis script as a subprocess
+        print(f"Dispatching analysis to: {script_args[0]} for video: {video_path}", file=sys.stderr)
         process = subprocess.run(
-            ['python', script_path, video_path],
+            ['python', *script_args],
             capture_output=True,
             text=True,
             check=True
         )
         print(f"Subprocess stdout: {process.stdout}", file=sys.stderr)
         print(f"Subprocess stderr: {process.stderr}", file=sys.stderr)
-        return json.loads(process.stdout)
+        output = json.loads(process.stdout)
+        return [output] if len(test_types) == 1 else output
     except subprocess.CalledProcessError as e:
-        return {"error": f"Analysis script failed with exit code {e.returncode}: {e.stderr}"}
+        error = {"error": f"Analysis script failed with exit code {e.returncode}: {e.stderr}"}
     except json.JSONDecodeError:
-        return {"error": f"Invalid JSON output from script: {process.stdout}"}
+        error = {"error": f"Invalid JSON output from script: {process.stdout}"}
+    return [error for _ in test_types]
+
+def stream_analyses(download, test_types, render=True, overlay=False):
+    """dispatch_analyses() for a fetched source, decoding it while it downloads.
+
+    The pose track is extracted from the download's stream (see
+    stream_ingest.py), so time to first frame doesn't depend on the file
+    size; the track is probed, scored and rendered once the download is
+    complete. With a worker pool running, both steps go to its warm workers
+    (see _extract_stream()); otherwise they run in this process. Files that
+    can't be streamed, videos already in the source cache (see
+    source_cache.py) and streams whose extraction fails are dispatched as
+    usual once complete.
+    """
+    if not download.streamable:
+        return dispatch_analyses(download.wait(), test_types, render=render, overlay=overlay,
+                                 digest=download.hexdigest())
+
+    # The same settings as a file on disk, so a later submission of the same
+    # clip (e.g. from the source cache) hits the track and result caches; the
+    # pipe just isn't split into chunks (see chunking.should_chunk())
+    valid_types = [t for t in dict.fromkeys(test_types) if get_test(t)]
+    settings = extraction_settings(valid_types)
+    track_path = artifact_store.create('.npz')
+    try:
+        try:
+            track = _extract_stream(download, valid_types, settings, track_path)
+        except (OSError, ValueError) as e:
+            # The pipe may be half read; fall back to the complete file
+            print(f"Worker pool unavailable ({e}), analysing the complete download instead.", file=sys.stderr)
+            return dispatch_analyses(download.wait(), test_types, render=render, overlay=overlay,
+                                     digest=download.hexdigest())
+        video_path = download.wait()
+        if track is None:
+            # Decoding the pipe failed; the complete file may still open
+            # (e.g. a container the stream couldn't be parsed from)
+            print("Streamed extraction failed, analysing the complete download instead.", file=sys.stderr)
+            return dispatch_analyses(video_path, test_types, render=render, overlay=overlay,
+                                     digest=download.hexdigest())
+        digest = download.hexdigest()
+        if analysis_cache.ENABLED:
+            analysis_cache.put_track(analysis_cache.track_key(digest, settings), track)
+
+        def run(video_path, pending, render, overlay):
+            if os.path.exists(track_path):
+                try:
+                    return submit_job(video_path, pending, socket_path=DEFAULT_SOCKET_PATH, render=render,
+                                      overlay=overlay, track_path=track_path)
+                except (OSError, ValueError) as e:
+                    print(f"Worker pool unavailable ({e}), scoring in this process.", file=sys.stderr)
+            return run_tests(video_path, pending, render=render, overlay=overlay, track=track)
+        return dispatch_analyses(video_path, test_types, run=run, render=render, overlay=overlay,
+                                 settings=settings, digest=digest, track=track)
+    finally:
+        artifact_store.release(track_path)
+
+def _extract_stream(download, test_types, settings, track_path):
+    """The pose track of a streaming download, or None if it couldn't be extracted.
+
+    With a worker pool running, a warm worker reads the pipe (it is on the
+    same host) and saves the track to track_path, where the scoring job picks
+    it up again; otherwise the track is extracted in this process and
+    track_path is left empty. Raises OSError or ValueError if the pool fails.
+    """
+    if os.path.exists(DEFAULT_SOCKET_PATH):
+        print(f"Submitting streamed extraction to worker pool at {DEFAULT_SOCKET_PATH}", file=sys.stderr)
+        result = submit_extraction(download.open_stream(), test_types, track_path)
+        if 'error' in result:
+            print(f"Streamed extraction failed: {result['error']}", file=sys.stderr)
+            return None
+        return analysis_cache.load_track(track_path)
+
+    from pose_track import extract_track
+    artifact_store.release(track_path)
+    return extract_track(download.open_stream(), settings=settings)
+
+def parse_test_types(args):
+    """Test types from the command line: separate arguments and/or comma-separated lists."""
+    return [name.strip() for arg in args for name in arg.split(',') if name.strip()]
 
 if __name__ == "__main__":
+    # Usage: analyze_video.py <path-or-url> <testType> [<testType> ...] [--score-only] [--overlay]
+    # One test type prints a single result object; several print a list.
+    # --score-only skips the annotated video (see render_video.py) and
+    # --overlay adds a compact overlay track (see overlay_track.py).
     if len(sys.argv) > 2:
         input_path = sys.argv[1]
-        test_type = sys.argv[2]
+        flags = [arg for arg in sys.argv[2:] if arg.startswith('--')]
+        render, overlay = '--score-only' not in flags, '--overlay' in flags
+        test_types = parse_test_types([arg for arg in sys.argv[2:] if arg not in flags])
         
-        video_path = None
-        is_temp_file = False
+        download = None
         
         try:
             if is_url(input_path):
-                # Download the video if the input is a URL
-                video_path = download_video(input_path)
-                is_temp_file = True
+                # Reuse a cached copy, or decode the video while it downloads
+                # where the file allows it
+                download = fetch(input_path)
+                results = stream_analyses(download, test_types, render=render, overlay=overlay)
             else:
                 # If it's not a URL, assume it's a local file path
-                video_path = input_path
-            
-            # Pass the local file path to the dispatcher
-            result = dispatch_analysis(video_path, test_type)
-            print(json.dumps(result))
+                results = dispatch_analyses(input_path, test_types, render=render, overlay=overlay)
+            print(json.dumps(results[0] if len(results) == 1 else results))
 
         except RuntimeError as e:
             print(json.dumps({"error": str(e)}))
@@ -92,10 +249,9 @@ if __name__ == "__main__":
             print(json.dumps({"error": f"An unexpected error occurred: {traceback.format_exc()}"}))
         finally:
             # Clean up the temporary file after analysis
-            if is_temp_file and video_path and os.path.exists(video_path):
+            if download is not None:
                 try:
-                    os.remove(video_path)
-                    print(f"Cleaned up temporary file: {video_path}", file=sys.stderr)
+                    download.close()
                 except OSError as e:
                     print(f"Error removing temporary file: {e}", file=sys.stderr)
     else:
@@ -0,0 +1,194 @@
+"""Scratch space for temporary video artifacts.
+
+Annotated renders and uncached downloads only live until they are uploaded or
+analysed, so there is no point in writing them to disk and reading them back.
+Artifacts are still files, because cv2.VideoWriter and cv2.VideoCapture need
+a path, but they are created on a tmpfs (ANALYSIS_ARTIFACT_MEMORY_DIR,
+/dev/shm by default) where writing and reading them back stays in memory.
+
+The memory store is shared by every process and bounded by
+ANALYSIS_ARTIFACT_MEMORY_BYTES (default 512 MB; 0 turns it off). An artifact
+that isn't expected to fit in what is left goes to ANALYSIS_ARTIFACT_DISK_DIR
+(the system temp dir) instead, and settle() spills one that turned out bigger
+than expected once it is written.
+
+Each process keeps its artifacts in a directory of its own under
+sih2025-artifacts/, locked for as long as the process runs. It is removed when
+the process exits, after queued uploads are drained or handed over to the
+upload service (see uploader.py), and the directories of processes that died
+without cleaning up (a crashed pool worker, a killed analyze_video.py) are
+swept by the next process that creates an artifact.
+
+    python artifact_store.py stats
+    python artifact_store.py sweep
+"""
+import argparse
+import fcntl
+import json
+import multiprocessing.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+MEMORY_DIR = os.environ.get('ANALYSIS_ARTIFACT_MEMORY_DIR', '/dev/shm')
+MEMORY_BYTES = int(os.environ.get('ANALYSIS_ARTIFACT_MEMORY_BYTES', 512 * 1024 ** 2))
+DISK_DIR = os.environ.get('ANALYSIS_ARTIFACT_DISK_DIR', tempfile.gettempdir())
+STORE_NAME = 'sih2025-artifacts'
+LOCK_NAME = '.lock'
+ORPHAN_SECONDS = 60  # A directory without a lock file is only swept once it is this old
+
+def _memory_enabled():
+    return MEMORY_BYTES > 0 and os.path.isdir(MEMORY_DIR) and os.access(MEMORY_DIR, os.W_OK)
+
+def _roots():
+    roots = {'disk': os.path.join(DISK_DIR, STORE_NAME)}
+    if _memory_enabled():
+        roots['memory'] = os.path.join(MEMORY_DIR, STORE_NAME)
+    return roots
+
+# --- Process Directories ---
+_dirs = {}  # tier -> (pid, directory, lock fd)
+_lock = threading.Lock()
+
+def _process_dir(tier):
+    pid = os.getpid()
+    owned = _dirs.get(tier)
+    if owned is not None and owned[0] == pid:
+        return owned[1]
+    if not any(owner == pid for owner, _, _ in _dirs.values()):
+        # First artifact of this process (or of a forked child)
+        sweep()
+        multiprocessing.util.Finalize(None, cleanup, exitpriority=0)
+    root = _roots()[tier]
+    os.makedirs(root, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f'{pid}-', dir=root)
+    fd = os.open(os.path.join(directory, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    _dirs[tier] = (pid, directory, fd)
+    return directory
+
+def cleanup():
+    """Removes this process's artifacts; runs automatically at exit."""
+    with _lock:
+        for tier, (pid, directory, fd) in list(_dirs.items()):
+            if pid != os.getpid():
+                continue  # Inherited from the parent, which cleans up after itself
+            shutil.rmtree(directory, ignore_errors=True)
+            os.close(fd)
+            del _dirs[tier]
+
+def sweep():
+    """Removes the artifacts of processes that are gone; returns how many directories it removed."""
+    removed = 0
+    for root in _roots().values():
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            directory = os.path.join(root, name)
+            try:
+                fd = os.open(os.path.join(directory, LOCK_NAME), os.O_RDWR)
+            except FileNotFoundError:
+                # Its process died before it could take the lock
+                try:
+                    if time.time() - os.path.getmtime(directory) > ORPHAN_SECONDS:
+                        shutil.rmtree(directory, ignore_errors=True)
+                        removed += 1
+                except OSError:
+                    pass
+                continue
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue  # Still in use
+            print(f"Removing artifacts left behind in {directory}", file=sys.stderr)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.close(fd)
+            removed += 1
+    return removed
+
+# --- Artifacts ---
+def memory_used():
+    """Bytes of artifacts currently held in memory, by all processes."""
+    root = _roots().get('memory')
+    used = 0
+    if root is None or not os.path.isdir(root):
+        return used
+    for name in os.listdir(root):
+        try:
+            with os.scandir(os.path.join(root, name)) as entries:
+                used += sum(entry.stat().st_size for entry in entries if entry.is_file())
+        except OSError:
+            pass  # Removed while we looked
+    return used
+
+def _fits_in_memory(expected_bytes):
+    if not _memory_enabled():
+        return False
+    free = shutil.disk_usage(MEMORY_DIR).free
+    return memory_used() + expected_bytes <= MEMORY_BYTES and expected_bytes < free
+
+def create(suffix='.mp4', expected_bytes=None):
+    """Path of a new, empty artifact file.
+
+    It is created in memory if `expected_bytes` (0 when unknown) still fits
+    there, otherwise on disk. Remove it with release() when done.
+    """
+    with _lock:
+        tier = 'memory' if _fits_in_memory(expected_bytes or 0) else 'disk'
+        directory = _process_dir(tier)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+def in_memory(path):
+    root = _roots().get('memory')
+    return root is not None and os.path.abspath(path).startswith(root + os.sep)
+
+def settle(path):
+    """Spills a finished artifact to disk if the memory store has grown past its budget.
+
+    Returns the artifact's path, which changes if it was moved.
+    """
+    if not in_memory(path) or memory_used() <= MEMORY_BYTES:
+        return path
+    with _lock:
+        directory = _process_dir('disk')
+    spilled = os.path.join(directory, os.path.basename(path))
+    shutil.move(path, spilled)
+    print(f"Spilled {os.path.basename(path)} ({os.path.getsize(spilled)} bytes) to disk.", file=sys.stderr)
+    return spilled
+
+def adopt(path):
+    """Moves an artifact of another process into this process's directory.
+
+    Returns its new path. Lets a process that outlives the artifact's creator
+    (the upload service, see uploader.py) take it over before it is cleaned up.
+    """
+    with _lock:
+        directory = _process_dir('memory' if in_memory(path) else 'disk')
+    adopted = os.path.join(directory, os.path.basename(path))
+    os.rename(path, adopted)
+    return adopted
+
+def release(path):
+    """Deletes an artifact."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clean up temporary video artifacts.")
+    parser.add_argument('command', choices=['stats', 'sweep'])
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(json.dumps({"roots": _roots(), "memory_bytes": memory_used(), "max_memory_bytes": MEMORY_BYTES}))
+    else:
+        print(json.dumps({"removed": sweep()}))
@@ -0,0 +1,155 @@
+"""Batch analysis of a manifest of videos across a process pool.
+
+For district-level trials: takes a manifest with one video per row, fans the
+work out over warm worker processes (see analysis_worker.py) and appends one
+JSON line per finished entry to the output file as soon as it completes.
+
+    python batch_analyze.py manifest.csv results.jsonl [--workers N]
+
+The manifest is CSV (with a header row) or JSONL, with these fields:
+
+    video       local path or URL of the clip
+    test_type   test to run; several can be given comma-separated
+    athlete_id  who the clip belongs to
+    id          optional; defaults to a hash of the three fields above
+
+With --score-only no annotated videos are rendered or uploaded; render the
+ones somebody opens later with render_video.py. --overlay adds a compact
+overlay track to each result (see overlay_track.py).
+
+Re-running the same command after a crash skips every entry that already
+has a successful result in the output file. Failed entries are retried
+unless --skip-failed is given.
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+
+import analysis_worker
+from analysis_worker import DEFAULT_WORKERS, create_pool
+from analyze_video import dispatch_analyses, is_url, parse_test_types
+from source_cache import fetch
+
+# --- Manifest ---
+FIELD_ALIASES = {
+    'video': ('video', 'path', 'url', 'video_path', 'videoUrl'),
+    'test_type': ('test_type', 'testType', 'test'),
+    'athlete_id': ('athlete_id', 'athleteId', 'userId'),
+    'id': ('id',),
+}
+
+def _normalize_entry(row):
+    entry = {}
+    for field, aliases in FIELD_ALIASES.items():
+        entry[field] = next((str(row[a]).strip() for a in aliases if row.get(a) not in (None, '')), None)
+    if not entry['video'] or not entry['test_type']:
+        raise ValueError(f"Manifest row needs a video and a test type: {row}")
+    if not entry['id']:
+        key = json.dumps([entry['video'], entry['test_type'], entry['athlete_id']])
+        entry['id'] = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return entry
+
+def read_manifest(path):
+    """Reads a CSV or JSONL manifest into a list of normalized entries."""
+    with open(path, 'r', newline='') as f:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [_normalize_entry(row) for row in rows]
+
+def read_completed(output_path, include_failed=False):
+    """Ids of entries that already have a result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from a crash
+            if include_failed or not record.get('failed'):
+                completed.add(record.get('id'))
+    return completed
+
+# --- Worker Side ---
+def _run_in_worker(video_path, test_types, render=True, overlay=False):
+    # Runs inside a pool process, so it can use that process's warm Pose model.
+    return analysis_worker.run_tests(video_path, test_types, analysis_worker._pose, render, overlay)
+
+def analyze_entry(entry, render=True, overlay=False):
+    """Analyses one manifest entry; runs in a pool process."""
+    started = time.time()
+    source = None
+    try:
+        digest = None
+        if is_url(entry['video']):
+            source = fetch(entry['video'])
+            video_path, digest = source.wait(), source.hexdigest()
+        else:
+            video_path = entry['video']
+        results = dispatch_analyses(video_path, parse_test_types([entry['test_type']]), run=_run_in_worker,
+                                    render=render, overlay=overlay, digest=digest)
+    except Exception:
+        results = [{"error": f"An unexpected error occurred: {traceback.format_exc()}"}]
+    finally:
+        if source is not None:
+            source.close()
+
+    return {
+        **entry,
+        "results": results,
+        "failed": any('error' in result for result in results),
+        "elapsed_seconds": round(time.time() - started, 3),
+    }
+
+# --- Driver ---
+def run_batch(manifest_path, output_path, workers=DEFAULT_WORKERS, skip_failed=False, max_jobs_per_worker=None,
+              render=True, overlay=False):
+    entries = read_manifest(manifest_path)
+    completed = read_completed(output_path, include_failed=skip_failed)
+    todo = [entry for entry in entries if entry['id'] not in completed]
+    print(f"{len(entries)} entries in manifest, {len(entries) - len(todo)} already done, "
+          f"{len(todo)} to analyse on {workers} workers.", file=sys.stderr)
+    if not todo:
+        return
+
+    pool = create_pool(workers, max_jobs_per_worker)
+    try:
+        with open(output_path, 'a') as out:
+            for done, record in enumerate(pool.imap_unordered(functools.partial(analyze_entry, render=render, overlay=overlay), todo), 1):
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+                status = "FAILED" if record['failed'] else "ok"
+                print(f"[{done}/{len(todo)}] {record['id']} {record['video']} ({record['test_type']}): "
+                      f"{status} in {record['elapsed_seconds']} s", file=sys.stderr)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a manifest of videos in parallel.")
+    parser.add_argument('manifest', help="CSV or JSONL manifest (video, test_type, athlete_id).")
+    parser.add_argument('output', help="JSONL file that results are appended to.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of worker processes.")
+    parser.add_argument('--skip-failed', action='store_true', help="Don't retry entries that failed before.")
+    parser.add_argument('--max-jobs-per-worker', type=int, default=None,
+                        help="Recycle a worker after this many entries.")
+    parser.add_argument('--score-only', action='store_true', help="Don't render or upload annotated videos.")
+    parser.add_argument('--overlay', action='store_true', help="Add a compact overlay track to each result.")
+    args = parser.parse_args()
+
+    run_batch(args.manifest, args.output, args.workers, args.skip_failed, args.max_jobs_per_worker,
+              render=not args.score_only, overlay=args.overlay)
@@ -0,0 +1,156 @@
+"""Measures extraction settings against full-rate analysis.
+
+For each video and test, extracts a reference track at full rate and full
+resolution, without ROI cropping, motion gating, flow tracking, early
+termination or chunking, with default pose settings, then extracts again with each variant.
+It reports inference calls, wall time and how far each score drifts from the
+reference:
+
+    python benchmark.py clip1.mp4 clip2.mp4 --tests "Sit Ups" "Vertical Jump"
+
+Variants:
+    default     the test's own extraction settings from registry.py
+    side_N      the defaults with inference at most N px on the longest side
+    full_res    the defaults with inference at full resolution
+    roi         the defaults with pose on a crop around the last pose
+    no_roi      the defaults with pose on the whole frame
+    keyframes_N the defaults with flow tracking keyframes every N frames
+                (tests with 'tracking' only)
+    no_tracking the defaults with flow tracking off, sampling instead
+    chunks_N    the defaults with the video split into N second chunks
+                (see chunking.py; videos shorter than 2N seconds aren't split)
+
+Use this to check a test's defaults against the tolerances documented in
+registry.py before changing them. The cache is bypassed throughout.
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+
+from pose_track import extract_track
+from registry import ROI, TESTS, extraction_settings, load_entry_point
+from sampling import FULL_RATE, merge_policies
+
+def full_rate_settings(test_type):
+    settings = copy.deepcopy(extraction_settings([test_type]))
+    settings['sampling'] = dict(FULL_RATE)
+    settings['inference'] = {'max_side': None}
+    settings['early_stop'] = None
+    settings['roi'] = None
+    settings['motion_gate'] = None
+    settings['tracking'] = None
+    settings['chunking'] = None
+    return settings
+
+def tracking_settings(keyframe_interval):
+    def settings(test_type):
+        variant = copy.deepcopy(extraction_settings([test_type]))
+        if variant['tracking']:
+            variant['tracking']['keyframe_interval'] = keyframe_interval
+        return variant
+    return settings
+
+def no_tracking_settings(test_type):
+    variant = copy.deepcopy(extraction_settings([test_type]))
+    if variant['tracking']:
+        variant['tracking'] = None
+        variant['sampling'] = merge_policies([TESTS[test_type]['extraction']['sampling']])
+    return variant
+
+def inference_settings(max_side):
+    def settings(test_type):
+        variant = copy.deepcopy(extraction_settings([test_type]))
+        variant['inference'] = {'max_side': max_side}
+        return variant
+    return settings
+
+def roi_settings(roi):
+    def settings(test_type):
+        variant = copy.deepcopy(extraction_settings([test_type]))
+        variant['roi'] = copy.deepcopy(roi)
+        return variant
+    return settings
+
+def chunking_settings(seconds):
+    def settings(test_type):
+        variant = copy.deepcopy(extraction_settings([test_type]))
+        if variant['chunking']:
+            variant['chunking']['seconds'] = seconds
+        return variant
+    return settings
+
+VARIANTS = {
+    'default': lambda test_type: extraction_settings([test_type]),
+    'side_256': inference_settings(256),
+    'side_480': inference_settings(480),
+    'side_640': inference_settings(640),
+    'side_960': inference_settings(960),
+    'full_res': inference_settings(None),
+    'roi': roi_settings(ROI),
+    'no_roi': roi_settings(None),
+    'keyframes_5': tracking_settings(5),
+    'keyframes_10': tracking_settings(10),
+    'keyframes_20': tracking_settings(20),
+    'no_tracking': no_tracking_settings,
+    'chunks_10': chunking_settings(10),
+    'chunks_30': chunking_settings(30),
+}
+
+def _score(test_type, track):
+    return load_entry_point(test_type, 'score')(track)['score']
+
+def _inference_calls(track):
+    # Frames sent to inference (keyframes when flow tracking), minus those
+    # the motion gate skipped
+    calls = track.stats.get('tracking', {}).get('keyframes') or int(track.inferred.sum())
+    return calls - track.stats.get('motion_gate', {}).get('skipped', 0)
+
+def _extract(video_path, settings):
+    started = time.perf_counter()
+    track = extract_track(video_path, settings=settings)
+    if track is None:
+        raise RuntimeError(f"Could not open video file: {video_path}")
+    return track, time.perf_counter() - started
+
+def benchmark(video_path, test_types, variants):
+    rows = []
+    references = {}
+    for test_type in test_types:
+        # Tests whose reference settings match share one reference extraction
+        reference_settings = full_rate_settings(test_type)
+        reference_key = json.dumps(reference_settings, sort_keys=True)
+        if reference_key not in references:
+            references[reference_key] = _extract(video_path, reference_settings)
+        reference, reference_seconds = references[reference_key]
+        reference_score = _score(test_type, reference)
+        rows.append({
+            "video": video_path, "test": test_type, "variant": "full",
+            "inferred": _inference_calls(reference), "seconds": round(reference_seconds, 2),
+            "score": reference_score, "delta": 0, "delta_pct": 0.0,
+        })
+        for name in variants:
+            track, seconds = _extract(video_path, VARIANTS[name](test_type))
+            score = _score(test_type, track)
+            delta = score - reference_score
+            rows.append({
+                "video": video_path, "test": test_type, "variant": name,
+                "inferred": _inference_calls(track), "seconds": round(seconds, 2),
+                "score": score, "delta": round(delta, 4),
+                "delta_pct": round(100.0 * delta / reference_score, 2) if reference_score else None,
+                "speedup": round(reference_seconds / seconds, 2) if seconds else None,
+            })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare extraction settings against full-rate analysis.")
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--tests', nargs='+', default=list(TESTS), help="Test types to benchmark.")
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    args = parser.parse_args()
+
+    for video_path in args.videos:
+        for row in benchmark(video_path, args.tests, args.variants):
+            print(json.dumps(row))
+            sys.stdout.flush()
@@ -1,119 +1,139 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 import json
 import sys
-import tempfile
-import requests
-import os
-import urllib.parse
 from datetime import datetime
-import math # import
-
-# --- ImageKit Credentials and Upload Function (Same as above) ---
-IK_PRIVATE_KEY = "your_imagekit_private_key"
-IK_PUBLIC_KEY = "your_imagekit_public_key"
-IK_URL_ENDPOINT = "your_imagekit_url_endpoint"
-
-def upload_to_imagekit(file_path):
-    try:
-        url = f"https://upload.imagekit.io/api/v1/files/upload"
-        headers = {'Authorization': f'Bearer {IK_PRIVATE_KEY}'}
-        
-        with open(file_path, 'rb') as f:
-            response = requests.post(url, files={'file': f}, data={
-                'fileName': f"broad_jump_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4",
-                'folder': 'analyzed-videos'
-            })
-            response.raise_for_status()
-            return response.json().get('url')
-
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to upload to ImageKit: {e}", file=sys.stderr)
-        return None
-
-def analyze_broad_jump(video_path):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    cap = cv2.VideoCapture(video_path)
-
-    if not cap.isOpened():
-        return {"error": "Could not open video file."}
+from analysis_cache import cached_extract_track
+from pose_track import PoseLandmark, first_index, render_annotated_video
+from overlay_track import encode_overlay
+from registry import extraction_settings
+import uploader
+
+# --- Vectorized Scoring ---
+def walk_jump(track, walk):
+    """Finds the start, takeoff and landing among the frames of `track` not yet seen.
+
+    `walk` holds the 'start', 'takeoff' and 'landing' frames found so far and
+    the 'next' frame to look at; an empty dict starts from the beginning.
+    Returns `walk`.
+    """
+    begin = walk.setdefault('next', 0)
+    for event in ('start', 'takeoff', 'landing'):
+        walk.setdefault(event, None)
+    present = track.present[begin:]
+    left_y = track.coord(PoseLandmark.LEFT_ANKLE, 1)[begin:]
+    right_y = track.coord(PoseLandmark.RIGHT_ANKLE, 1)[begin:]
+    grounded = present & (left_y > 0.8) & (right_y > 0.8)
+    walk['next'] = track.frame_count
+
+    # Start point: first frame with both feet on the ground; then the first
+    # frame after it with both feet in the air, and the landing (both feet
+    # back down) after that, so only the first jump counts
+    i = 0
+    for event, mask in (('start', grounded), ('takeoff', present & (left_y < 0.7) & (right_y < 0.7)),
+                        ('landing', grounded)):
+        if walk[event] is None:
+            i = first_index(mask, i)
+            if i is None:
+                break
+            walk[event] = begin + i
+            i += 1
+    return walk
+
+def broad_jump_series(track):
+    """Per-frame running maximum jump distance for a whole PoseTrack."""
+    # Use ankle landmarks to track jump
+    left_ankle = track.xy(PoseLandmark.LEFT_ANKLE)
+    left_y = left_ankle[:, 1]
+    right_y = track.coord(PoseLandmark.RIGHT_ANKLE, 1)
+
+    max_distance = np.zeros(track.frame_count)
+    walk = walk_jump(track, {})
+    start, takeoff, landing = walk['start'], walk['takeoff'], walk['landing']
+    if start is None:
+        return {"max_distance_pixels": max_distance, "start": None, "landing": None}
+
+    # End point candidates: frames with both feet in the air, from the
+    # takeoff up to the landing
+    airborne = track.present & (left_y < 0.7) & (right_y < 0.7)
+    airborne[:start + 1] = False
+    if landing is not None:
+        airborne[landing:] = False
+
+    distance = np.hypot(left_ankle[:, 0] - left_ankle[start, 0], left_y - left_y[start])
+    max_distance = np.maximum.accumulate(np.where(airborne, distance, 0.0))
+    return {"max_distance_pixels": max_distance, "start": start, "landing": landing}
+
+def is_final_broad_jump(track, walk=None):
+    """True once the athlete has landed; later frames can't change the result.
+
+    Given the `walk` from a call on a shorter prefix of the same track, only
+    the frames added since are looked at.
+    """
+    return walk_jump(track, {} if walk is None else walk)['landing'] is not None
 
-    # --- Analysis Variables ---
-    start_point = None
-    end_point = None
-    max_distance_pixels = 0
-    
-    # --- Video Writer Setup ---
-    temp_output_video_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    out = cv2.VideoWriter(temp_output_video_path, fourcc, fps, (width, height))
-    
-    # --- Main Analysis and Rendering Loop ---
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(frame_rgb)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
-            # Use ankle landmarks to track jump
-            left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value]
-            right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value]
-            
-            # Set start point when feet are on the ground
-            if start_point is None and left_ankle.y > 0.8 and right_ankle.y > 0.8:
-                start_point = (left_ankle.x, left_ankle.y)
-            
-            # Get the end point when feet land
-            if start_point is not None and left_ankle.y < 0.7 and right_ankle.y < 0.7:
-                 end_point = (left_ankle.x, left_ankle.y)
-                 
-            # Calculate distance if both points are available
-            if start_point and end_point:
-                dx = end_point[0] - start_point[0]
-                dy = end_point[1] - start_point[1]
-                distance = math.sqrt(dx**2 + dy**2)
-                max_distance_pixels = max(max_distance_pixels, distance)
-
-            # --- Draw landmarks and text on the frame ---
-            mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-            
-            # Display the distance
-            cv2.putText(frame, f'Distance: {max_distance_pixels:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-            
-        out.write(frame)
-        
-    cap.release()
-    out.release()
-    pose.close()
-
-    # --- Final Score and Upload ---
+def score_broad_jump(track, series=None):
+    if series is None:
+        series = broad_jump_series(track)
+
+    max_distance_pixels = float(series["max_distance_pixels"][-1]) if track.frame_count else 0.0
     final_score = round(max_distance_pixels, 2)
-    analyzed_video_url = upload_to_imagekit(temp_output_video_path)
-    
-    if os.path.exists(temp_output_video_path):
-        os.remove(temp_output_video_path)
 
     return {
         "testType": "Broad Jump",
         "result": { "distance_pixels": final_score },
         "score": final_score,
-        "analyzedVideoUrl": analyzed_video_url
     }
 
+def render_broad_jump(video_path, track, series=None):
+    """Writes the annotated video for a track to a temp file and returns its path."""
+    if series is None:
+        series = broad_jump_series(track)
+
+    def draw_overlay(frame, i):
+        # Display the distance
+        if track.present[i]:
+            cv2.putText(frame, f'Distance: {series["max_distance_pixels"][i]:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+
+    return render_annotated_video(video_path, track, draw_overlay)
+
+def overlay_broad_jump(track, series=None):
+    """Compact overlay for drawing this test's annotations on the client (see overlay_track.py)."""
+    if series is None:
+        series = broad_jump_series(track)
+    return encode_overlay(track, counters={"distance": series["max_distance_pixels"]},
+                          markers={"start": series["start"], "landing": series["landing"]})
+
+def analyze_broad_jump(video_path, pose=None, track=None, render=True, overlay=False):
+    if track is None:
+        track = cached_extract_track(video_path, pose=pose, settings=extraction_settings(['Broad Jump']))
+    if track is None:
+        return {"error": "Could not open video file."}
+
+    series = broad_jump_series(track)
+    result = score_broad_jump(track, series)
+    if overlay:
+        result["overlay"] = overlay_broad_jump(track, series)
+
+    if not render:
+        # Score-only: the annotated video can be rendered later (render_video.py)
+        result["analyzedVideoUrl"] = None
+        return result
+
+    # --- Upload the annotated video in the background (see uploader.py) ---
+    temp_output_video_path = render_broad_jump(video_path, track, series)
+    result["analyzedVideoUrl"] = None
+    file_name = f"broad_jump_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
+    result["analyzedVideo"] = uploader.submit(temp_output_video_path, file_name)
+    return result
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         video_path = sys.argv[1]
-        result = analyze_broad_jump(video_path)
+        # --score-only skips rendering and uploading the annotated video;
+        # --overlay adds a compact overlay track for client-side drawing
+        result = analyze_broad_jump(video_path, render='--score-only' not in sys.argv[2:],
+                                    overlay='--overlay' in sys.argv[2:])
         print(json.dumps(result))
     else:
         print(json.dumps({"error": "No video path provided"}))
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""Parallel extraction of long videos in overlapping time chunks.
+
+A single long clip (an endurance run, say) otherwise keeps one core busy for
+the whole pose pass. With 'chunking' extraction settings (see registry.py),
+a video at least two chunks long is split into consecutive chunks that are
+decoded and pose-tracked in separate processes, and their records are
+stitched back into one PoseTrack in frame order, so the analyzers' scoring
+state machines still see a single sequence.
+
+Pose tracking, sampling, the motion gate and optical flow all carry state from
+one frame to the next, so a chunk that starts cold doesn't produce the same
+landmarks as a sequential pass right away. Sampling, keyframes and the
+motion gate's forced refreshes fall on frames picked by their index in the
+video, so a chunk runs pose on the same frames as a sequential pass, and the
+remaining state (the pose model's tracking, adaptive sampling's full-rate
+stretches) catches up within a few frames. Each chunk therefore also decodes
+`overlap` seconds before and after its own frames, and neighbouring chunks
+are stitched where they agree. Once both give the same result (the same
+landmarks, or no pose at all) on every frame to the end of the overlap, the
+later chunk has caught up with the sequential pass and the stitch is exact;
+stats['chunks']['converged'] counts those boundaries. A chunk that never
+agrees with the one before it is extracted again in one sequential pass with
+the frames before it, from where that earlier extraction started, so the
+stitched track always matches a sequential pass ('reextracted' counts
+those). Later chunks carry on from the redone one where its own extraction
+caught up with the redo; if it never did, the rest of the video is extracted
+in one more pass from there instead of being redone chunk by chunk.
+
+ANALYSIS_CHUNK_WORKERS sets the number of processes (default: number of
+CPUs); with fewer than two, videos are never split. Workers of a warm pool
+(analysis_worker.py, batch_analyze.py) are daemon processes, which can't
+start processes of their own, so they always extract sequentially, and
+neither is a streamed download.
+"""
+import multiprocessing
+import os
+import stat
+import sys
+import time
+
+import cv2
+import numpy as np
+
+CHUNK_WORKERS = int(os.environ.get('ANALYSIS_CHUNK_WORKERS', os.cpu_count() or 1))
+
+def probe(video_path):
+    """(frame_count, fps) of a video, or None if it can't be opened."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), cap.get(cv2.CAP_PROP_FPS) or 30.0
+    finally:
+        cap.release()
+
+def plan_chunks(frame_count, fps, chunking, stride=1):
+    """[(start, decode_start, decode_end), ...] frame ranges covering the video.
+
+    A chunk owns the frames from its start up to the next chunk's start, and
+    decodes [decode_start, decode_end), which adds the overlap on both sides.
+    decode_end is rounded up so that a chunk's last frame is one the
+    sampling `stride` runs inference on anyway (the last frame always gets
+    it, see sampling.FrameSampler). The last chunk's decode_end is None (to
+    the end of the video), since container frame counts aren't always exact.
+    """
+    size = max(1, int(round(chunking['seconds'] * fps)))
+    overlap = max(0, int(round(chunking['overlap'] * fps)))
+    starts = list(range(0, frame_count, size))
+    if len(starts) > 1 and frame_count - starts[-1] < size // 2:
+        starts.pop()  # Fold a short remainder into the last chunk
+
+    def decode_end(i):
+        if i + 1 == len(starts):
+            return None
+        last = starts[i + 1] + overlap - 1
+        return -(-last // stride) * stride + 1
+
+    return [(start, max(0, start - overlap), decode_end(i)) for i, start in enumerate(starts)]
+
+def _is_pipe(path):
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def should_chunk(video_path, settings=None):
+    chunking = (settings or {}).get('chunking')
+    if not chunking or CHUNK_WORKERS < 2 or multiprocessing.current_process().daemon:
+        return False
+    if _is_pipe(video_path):
+        return False  # A streamed download (see stream_ingest.py) can only be read once, front to back
+    probed = probe(video_path)
+    return probed is not None and probed[0] >= 2 * chunking['seconds'] * probed[1]
+
+# --- Worker Process State ---
+# Populated once per worker process by _init_worker().
+_pose = None
+
+def _init_worker():
+    global _pose
+    from pose_track import create_pose
+    _pose = create_pose()
+
+def _extract_chunk(args):
+    from pose_track import extract_records
+    video_path, settings, (_, decode_start, decode_end) = args
+    _pose.reset()
+    count = None if decode_end is None else decode_end - decode_start
+    return extract_records(video_path, _pose, settings, decode_start, count)
+
+# --- Stitching ---
+def _disagreement(a, b):
+    # Mean landmark distance between two records of the same frame. Only x and
+    # y, which is all the scoring uses: z and visibility are smoothed over a
+    # long window and keep differing slightly after the positions agree
+    if a[2] is None or b[2] is None:
+        return 0.0 if a[2] is None and b[2] is None else float('inf')
+    return float(np.nanmean(np.abs(a[2][:, :2] - b[2][:, :2])))
+
+def stitch(records, chunk_records, boundary):
+    """Joins a chunk's records onto the ones before it.
+
+    The chunk has converged if both agree exactly on every overlapping frame
+    from some frame on; it is cut in at the first of those. Otherwise it is
+    cut in at the overlapping frame where both agree best, or at `boundary`
+    if they never agree on whether there is a pose. Returns (records,
+    converged, cut).
+    """
+    earlier = {r[0]: r for r in records if chunk_records and r[0] >= chunk_records[0][0]}
+    overlap = [(_disagreement(earlier[r[0]], r), r[0]) for r in chunk_records if r[0] in earlier]
+    cut = None
+    for disagreement, index in reversed(overlap):
+        if disagreement != 0.0:
+            break
+        cut = index
+    converged = cut is not None
+    if not converged:
+        disagreement, cut = min(overlap, default=(float('inf'), boundary))
+        if disagreement == float('inf'):
+            cut = boundary
+    return [r for r in records if r[0] < cut] + [r for r in chunk_records if r[0] >= cut], converged, cut
+
+def _merge_stats(chunk_stats):
+    # Sums the counters of every chunk; pipeline stage rates are recomputed from the sums
+    merged = {}
+    for stats in chunk_stats:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                merged[key] = _merge_stats([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    if 'busy_seconds' in merged and 'frames' in merged:
+        merged['busy_seconds'] = round(merged['busy_seconds'], 3)
+        merged['fps'] = round(merged['frames'] / merged['busy_seconds'], 1) if merged['busy_seconds'] else None
+    return merged
+
+def extract_track_chunked(video_path, settings, workers=None):
+    """extract_track() for a long video, with chunks extracted in parallel processes."""
+    from pose_track import records_to_track
+
+    probed = probe(video_path)
+    if probed is None:
+        return None
+    frame_count, fps = probed
+    chunks = plan_chunks(frame_count, fps, settings['chunking'], (settings.get('sampling') or {}).get('stride', 1))
+    workers = max(1, min(workers or CHUNK_WORKERS, len(chunks)))
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes=workers, initializer=_init_worker) as pool:
+        results = pool.map(_extract_chunk, [(video_path, settings, chunk) for chunk in chunks])
+        if any(result is None for result in results):
+            return None
+
+        records, converged, reextracted = [], 0, 0
+        chunk_stats = [stats for _, stats, _ in results]
+        piece = (0, 0)  # (cut, decode_start) of the extraction the latest records come from
+        for (start, decode_start, decode_end), (chunk_records, _, _) in zip(chunks, results):
+            stitched, exact, cut = stitch(records, chunk_records, start)
+            if exact or not records:
+                records, piece = stitched, (cut, decode_start)
+                converged += exact
+                continue
+            # The chunk never caught up with the sequential pass: extract it
+            # together with the frames before it in one pass instead
+            redo = pool.apply(_extract_chunk, ((video_path, settings, (None, piece[1], decode_end)),))
+            if redo is None:
+                return None
+            records = [r for r in records if r[0] < piece[0]] + [r for r in redo[0] if r[0] >= piece[0]]
+            chunk_stats.append(redo[1])
+            reextracted += 1
+            _, caught_up, cut = stitch(redo[0], chunk_records, start)
+            if caught_up:
+                piece = (cut, decode_start)
+            elif decode_end is not None:
+                # Nothing suggests the next chunks would do better; finish
+                # the video in this pass
+                rest = pool.apply(_extract_chunk, ((video_path, settings, (None, piece[1], None)),))
+                if rest is None:
+                    return None
+                records = [r for r in records if r[0] < piece[0]] + [r for r in rest[0] if r[0] >= piece[0]]
+                chunk_stats.append(rest[1])
+                break
+    stats = _merge_stats(chunk_stats)
+    stats['wall_seconds'] = round(time.perf_counter() - started, 3)
+    stats['chunks'] = {"count": len(chunks), "converged": converged, "reextracted": reextracted}
+    print(f"Extracted {len(records)} frames of {os.path.basename(video_path)} in {len(chunks)} chunks "
+          f"({stats['wall_seconds']}s, {converged} of {len(chunks) - 1} boundaries stitched exactly, "
+          f"{reextracted} extracted again across the boundary).", file=sys.stderr)
+    fps, width, height = results[0][2]
+    return records_to_track(records, fps, width, height, stats)
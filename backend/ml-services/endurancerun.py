@@ -1,112 +1,90 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 import json
 import sys
-import tempfile
-import requests
-import os
-import urllib.parse
-import math
 from datetime import datetime
+from analysis_cache import cached_extract_track
+from pose_track import PoseLandmark, render_annotated_video
+from overlay_track import encode_overlay
+from registry import extraction_settings
+import uploader
 
-# --- ImageKit Credentials and Upload Function (Same as above) ---
-IK_PRIVATE_KEY = "your_imagekit_private_key"
-IK_PUBLIC_KEY = "your_imagekit_public_key"
-IK_URL_ENDPOINT = "your_imagekit_url_endpoint"
+# --- Vectorized Scoring ---
+def endurance_run_series(track):
+    """Per-frame cumulative hip travel for a whole PoseTrack."""
+    # Use a stable landmark like the right hip (landmark 24)
+    right_hip = track.xy(PoseLandmark.RIGHT_HIP)
 
-def upload_to_imagekit(file_path):
-    try:
-        url = f"https://upload.imagekit.io/api/v1/files/upload"
-        headers = {'Authorization': f'Bearer {IK_PRIVATE_KEY}'}
-        
-        with open(file_path, 'rb') as f:
-            response = requests.post(url, files={'file': f}, data={
-                'fileName': f"endurance_run_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4",
-                'folder': 'analyzed-videos'
-            })
-            response.raise_for_status()
-            return response.json().get('url')
+    # Distance between consecutive frames that have a pose
+    present_idx = np.flatnonzero(track.present)
+    step = np.zeros(track.frame_count)
+    if len(present_idx) > 1:
+        hip = right_hip[present_idx].astype(np.float64)
+        step[present_idx[1:]] = np.hypot(*np.diff(hip, axis=0).T)
 
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to upload to ImageKit: {e}", file=sys.stderr)
-        return None
+    return {"distance_covered_pixels": np.cumsum(step)}
 
-def analyze_endurance_run(video_path):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    cap = cv2.VideoCapture(video_path)
+def score_endurance_run(track, series=None):
+    if series is None:
+        series = endurance_run_series(track)
 
-    if not cap.isOpened():
-        return {"error": "Could not open video file."}
-
-    # --- Analysis Variables ---
-    total_distance_pixels = 0
-    prev_hip_pos = None
-
-    # --- Video Writer Setup ---
-    temp_output_video_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    out = cv2.VideoWriter(temp_output_video_path, fourcc, fps, (width, height))
-    
-    # --- Main Analysis and Rendering Loop ---
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(frame_rgb)
-
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
-            # Use a stable landmark like the right hip (landmark 24)
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-            
-            current_hip_pos = (right_hip.x, right_hip.y)
-            
-            if prev_hip_pos:
-                dx = current_hip_pos[0] - prev_hip_pos[0]
-                dy = current_hip_pos[1] - prev_hip_pos[1]
-                distance = math.sqrt(dx**2 + dy**2)
-                total_distance_pixels += distance
-            
-            prev_hip_pos = current_hip_pos
-
-            # --- Draw landmarks and text on the frame ---
-            mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-            
-            # Display the distance covered
-            cv2.putText(frame, f'Distance: {total_distance_pixels:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-        
-        out.write(frame)
-        
-    cap.release()
-    out.release()
-    pose.close()
-
-    # --- Final Score and Upload ---
+    total_distance_pixels = float(series["distance_covered_pixels"][-1]) if track.frame_count else 0.0
     final_score = round(total_distance_pixels, 2)
-    analyzed_video_url = upload_to_imagekit(temp_output_video_path)
-    
-    if os.path.exists(temp_output_video_path):
-        os.remove(temp_output_video_path)
 
     return {
         "testType": "Endurance Run",
         "result": { "distance_covered_pixels": final_score },
         "score": final_score,
-        "analyzedVideoUrl": analyzed_video_url
     }
 
+def render_endurance_run(video_path, track, series=None):
+    """Writes the annotated video for a track to a temp file and returns its path."""
+    if series is None:
+        series = endurance_run_series(track)
+
+    def draw_overlay(frame, i):
+        # Display the distance covered
+        if track.present[i]:
+            cv2.putText(frame, f'Distance: {series["distance_covered_pixels"][i]:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+
+    return render_annotated_video(video_path, track, draw_overlay)
+
+def overlay_endurance_run(track, series=None):
+    """Compact overlay for drawing this test's annotations on the client (see overlay_track.py)."""
+    if series is None:
+        series = endurance_run_series(track)
+    return encode_overlay(track, counters={"distance": series["distance_covered_pixels"]})
+
+def analyze_endurance_run(video_path, pose=None, track=None, render=True, overlay=False):
+    if track is None:
+        track = cached_extract_track(video_path, pose=pose, settings=extraction_settings(['Endurance Run']))
+    if track is None:
+        return {"error": "Could not open video file."}
+
+    series = endurance_run_series(track)
+    result = score_endurance_run(track, series)
+    if overlay:
+        result["overlay"] = overlay_endurance_run(track, series)
+
+    if not render:
+        # Score-only: the annotated video can be rendered later (render_video.py)
+        result["analyzedVideoUrl"] = None
+        return result
+
+    # --- Upload the annotated video in the background (see uploader.py) ---
+    temp_output_video_path = render_endurance_run(video_path, track, series)
+    result["analyzedVideoUrl"] = None
+    file_name = f"endurance_run_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
+    result["analyzedVideo"] = uploader.submit(temp_output_video_path, file_name)
+    return result
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         video_path = sys.argv[1]
-        result = analyze_endurance_run(video_path)
+        # --score-only skips rendering and uploading the annotated video;
+        # --overlay adds a compact overlay track for client-side drawing
+        result = analyze_endurance_run(video_path, render='--score-only' not in sys.argv[2:],
+                                       overlay='--overlay' in sys.argv[2:])
         print(json.dumps(result))
     else:
         print(json.dumps({"error": "No video path provided"}))
\ No newline at end of file
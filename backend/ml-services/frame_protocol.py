@@ -0,0 +1,139 @@
+"""Binary framing for the realtime stream between server.js and realtime_analysis.py.
+
+The JSON-lines protocol base64-encodes every camera frame (a third more bytes)
+and parses a JSON document per frame. With --binary, realtime_analysis.py
+reads length-prefixed frames instead: a fixed little-endian header followed
+by the raw payload, read into one reused buffer.
+
+    Frame (server.js -> Python)
+        magic      4s   b'SIHF'
+        encoding   B    0 JPEG, 1 raw BGR, 2 raw I420 (YUV 4:2:0, planar),
+                        255 control message (see below)
+        flags      B    reserved, 0
+        width      H    pixels; required for the raw encodings
+        height     H
+        session    I    session id assigned by server.js
+        timestamp  d    client capture time, ms since the epoch
+        length     I    payload bytes
+        payload
+
+    Control messages carry a UTF-8 JSON payload instead of an image; the
+    multi-session service (realtime_server.py) uses them to start and end
+    sessions: {"type": "start", "testType": ...} and {"type": "end"}.
+
+    Result (Python -> server.js)
+        magic      4s   b'SIHR'
+        session    I
+        timestamp  d    timestamp of the frame the result answers
+        length     I    payload bytes
+        payload         UTF-8 JSON
+
+The JavaScript side is backend/lib/frameProtocol.js.
+"""
+import json
+import struct
+
+import cv2
+import numpy as np
+
+FRAME_MAGIC = b'SIHF'
+RESULT_MAGIC = b'SIHR'
+FRAME_HEADER = struct.Struct('<4sBBHHIdI')
+RESULT_HEADER = struct.Struct('<4sIdI')
+MAX_PAYLOAD = 32 * 1024 * 1024  # Anything larger means the stream is out of step
+
+JPEG, BGR, I420 = range(3)
+CONTROL = 255
+ENCODINGS = {JPEG: 'jpeg', BGR: 'bgr', I420: 'i420', CONTROL: 'control'}
+
+class Frame:
+    """A decoded frame with the header fields it came with."""
+    __slots__ = ('session', 'timestamp', 'encoding', 'image')
+
+    def __init__(self, session, timestamp, encoding, image):
+        self.session = session
+        self.timestamp = timestamp
+        self.encoding = encoding
+        self.image = image
+
+class FrameReader:
+    """Reads binary frames from a byte stream (e.g. sys.stdin.buffer).
+
+    The payload is read into a buffer that is reused from frame to frame, so
+    a raw BGR image is a view into it that is only valid until the next
+    read(). With reuse=False, every payload is read into a buffer of its
+    own instead, for callers that keep frames around (saves copying them
+    out of the shared one).
+    """
+    def __init__(self, stream, reuse=True):
+        self.stream = stream
+        self.reuse = reuse
+        self.header = bytearray(FRAME_HEADER.size)
+        self.buffer = bytearray(1024 * 1024 if reuse else 0)
+
+    def _read_exactly(self, view):
+        read = 0
+        while read < len(view):
+            n = self.stream.readinto(view[read:])
+            if not n:
+                return False
+            read += n
+        return True
+
+    def read_message(self):
+        """(encoding, width, height, session, timestamp, payload) of the next frame, or None at the end.
+
+        `payload` is a view into the reused buffer (or into its own buffer
+        with reuse=False). Raises ValueError if the stream is out of step.
+        """
+        if not self._read_exactly(memoryview(self.header)):
+            return None
+        magic, encoding, _, width, height, session, timestamp, length = FRAME_HEADER.unpack(self.header)
+        if magic != FRAME_MAGIC or length > MAX_PAYLOAD:
+            raise ValueError(f"Bad frame header (magic {magic!r}, length {length}).")
+        if not self.reuse or length > len(self.buffer):
+            self.buffer = bytearray(length)
+        payload = memoryview(self.buffer)[:length]
+        if not self._read_exactly(payload):
+            return None
+        return encoding, width, height, session, timestamp, payload
+
+    def read(self):
+        """The next Frame, or None at the end of the stream.
+
+        Raises ValueError if the stream is out of step, and returns a Frame
+        with image None if the payload can't be decoded.
+        """
+        message = self.read_message()
+        if message is None:
+            return None
+        encoding, width, height, session, timestamp, payload = message
+        return Frame(session, timestamp, encoding, decode_payload(encoding, width, height, payload))
+
+def decode_payload(encoding, width, height, payload):
+    """A BGR image from a frame payload, or None if it doesn't match its header."""
+    data = np.frombuffer(payload, np.uint8)
+    if encoding == JPEG:
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if encoding == BGR and len(data) == width * height * 3:
+        return data.reshape(height, width, 3)
+    if encoding == I420 and len(data) == width * height * 3 // 2 and not width % 2 and not height % 2:
+        return cv2.cvtColor(data.reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420)
+    return None
+
+def encode_frame(image, session=0, timestamp=0.0, encoding=JPEG, quality=80):
+    """Header and payload for a BGR image (for tests and benchmarks)."""
+    height, width = image.shape[:2]
+    if encoding == JPEG:
+        payload = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+    elif encoding == I420:
+        payload = cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420).tobytes()
+    else:
+        payload = np.ascontiguousarray(image).tobytes()
+    return FRAME_HEADER.pack(FRAME_MAGIC, encoding, 0, width, height, session, timestamp, len(payload)) + payload
+
+def write_result(stream, result, session=0, timestamp=0.0):
+    """Writes one result message and flushes."""
+    payload = json.dumps(result, separators=(',', ':')).encode('utf-8')
+    stream.write(RESULT_HEADER.pack(RESULT_MAGIC, session, timestamp, len(payload)) + payload)
+    stream.flush()
@@ -0,0 +1,106 @@
+"""Compact overlay tracks for drawing skeletons on the client.
+
+Instead of burning the skeleton into a second mp4 (see render_video.py), an
+analyzer can emit an overlay: the landmarks and per-frame counters the React
+player needs to draw the same annotations over the original upload. It is a
+small JSON object, stored with the Performance record:
+
+    format, version     "pose-overlay", 1
+    fps, width, height  of the source video
+    frames              number of frames
+    scale               int16 units per normalized image unit
+    landmarks           base64(zlib(int16 little-endian)), frames x 33 x 3
+                        (x, y, visibility), delta-encoded between frames
+    timestamps          base64(zlib(int32 little-endian)) presentation times in
+                        milliseconds, delta-encoded between frames
+    present             change points [[frame, 0|1], ...] of pose presence
+    counters            {name: change points [[frame, value], ...]}, e.g. reps
+    markers             {name: frame index or null}, e.g. shuttle run start
+
+Deltas wrap around in int16/int32, so decoding is a running sum in the same
+type. Frames without a pose repeat the previous frame's landmarks, so their
+deltas are zero and compress to almost nothing. The JavaScript decoder lives
+in frontend/src/utils/overlayTrack.js.
+"""
+import base64
+import zlib
+
+import numpy as np
+
+from pose_track import NUM_LANDMARKS, VISIBILITY, X, Y
+
+FORMAT = 'pose-overlay'
+VERSION = 1
+SCALE = 4096  # Sub-pixel even at 4K; normalized coords up to +-8 fit in int16
+
+def _pack(array):
+    return base64.b64encode(zlib.compress(array.tobytes(), 9)).decode('ascii')
+
+def _unpack(data, dtype):
+    return np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype=dtype)
+
+def _delta(values):
+    # Differences along the frame axis; int arithmetic wraps, which decoding undoes.
+    deltas = values.copy()
+    deltas[1:] -= values[:-1]
+    return deltas
+
+def change_points(values, decimals=2):
+    """[[frame, value], ...] for every frame where a per-frame series changes value."""
+    values = np.asarray(values)
+    if values.dtype == bool:
+        values = values.astype(np.int64)
+    elif np.issubdtype(values.dtype, np.floating):
+        values = np.round(values.astype(np.float64), decimals)
+    if not len(values):
+        return []
+    changed = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return [[int(i), values[i].item()] for i in changed]
+
+def expand_change_points(points, frame_count):
+    """Inverse of change_points(): one value per frame (0 before the first point)."""
+    values = np.zeros(frame_count)
+    for frame, value in points:
+        values[frame:] = value
+    return values
+
+def encode_overlay(track, counters=None, markers=None):
+    """Builds the overlay for a PoseTrack; counters are per-frame arrays by name."""
+    points = np.nan_to_num(track.landmarks[:, :, [X, Y, VISIBILITY]])
+    quantized = np.round(np.clip(points * SCALE, -32767, 32767)).astype(np.int16)
+    # Missing frames repeat the previous landmarks (zero deltas)
+    last_present = np.maximum.accumulate(np.where(track.present, np.arange(track.frame_count), -1))
+    filled = quantized[np.maximum(last_present, 0)]
+    filled[last_present < 0] = 0
+
+    timestamps_ms = np.round(track.timestamps * 1000.0).astype(np.int32)
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "fps": track.fps,
+        "width": track.width,
+        "height": track.height,
+        "frames": track.frame_count,
+        "scale": SCALE,
+        "landmarks": _pack(_delta(filled).astype('<i2')),
+        "timestamps": _pack(_delta(timestamps_ms).astype('<i4')),
+        "present": change_points(track.present),
+        "counters": {name: change_points(values) for name, values in (counters or {}).items()},
+        "markers": {name: None if frame is None else int(frame) for name, frame in (markers or {}).items()},
+    }
+
+def decode_overlay(overlay):
+    """Decodes an overlay back into arrays (mainly for checks and tooling)."""
+    frames = overlay["frames"]
+    with np.errstate(over='ignore'):
+        landmarks = np.cumsum(_unpack(overlay["landmarks"], '<i2').reshape(frames, NUM_LANDMARKS, 3),
+                              axis=0, dtype=np.int16)
+        timestamps = np.cumsum(_unpack(overlay["timestamps"], '<i4'), dtype=np.int32)
+    present = expand_change_points(overlay["present"], frames).astype(bool)
+    return {
+        "landmarks": np.where(present[:, None, None], landmarks / overlay["scale"], np.nan),
+        "timestamps": timestamps / 1000.0,
+        "present": present,
+        "counters": {name: expand_change_points(points, frames) for name, points in overlay["counters"].items()},
+        "markers": overlay["markers"],
+    }
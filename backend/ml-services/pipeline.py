@@ -0,0 +1,144 @@
+"""Threaded frame pipeline for the offline scripts.
+
+Runs decode, inference, annotation and encode as separate stages, one thread
+each, connected by small bounded queues:
+
+    source thread -> stage thread -> ... -> sink (calling thread)
+
+cv2 and MediaPipe release the GIL while they work, so the decoder and encoder
+keep running while pose inference is busy, and a single clip can use several
+cores. Each stage is a single thread reading a FIFO queue, so frames come out
+in the same order they went in and every stage sees exactly what the old
+sequential loop saw. The queues are bounded, so memory stays bounded even
+when one stage is much slower than the others.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 4))
+
+_DONE = object()
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "frames": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "fps": round(self.items / self.busy_seconds, 1) if self.busy_seconds else None,
+        }
+
+def run_pipeline(source, stages, sink, queue_size=DEFAULT_QUEUE_SIZE, label='pipeline'):
+    """Pushes every item from `source` through `stages` into `sink`.
+
+    source is (name, iterable), stages is a list of (name, fn) where fn maps one
+    item to the next, and sink is (name, fn) called in the calling thread for
+    each final item. Returns per-stage throughput stats; any exception raised
+    by a stage is re-raised here.
+    """
+    stop = threading.Event()
+    errors = []
+    stats = [StageStats(source[0])] + [StageStats(name) for name, _ in stages] + [StageStats(sink[0])]
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return _DONE
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def run_source():
+        stage = stats[0]
+        items = iter(source[1])
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                stage.busy_seconds += time.perf_counter() - started
+                stage.items += 1
+                if not put(queues[0], item):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+            put(queues[0], _DONE)
+
+    def run_stage(index, fn):
+        stage = stats[index + 1]
+        try:
+            while True:
+                item = get(queues[index])
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                item = fn(item)
+                stage.busy_seconds += time.perf_counter() - started
+                stage.items += 1
+                if not put(queues[index + 1], item):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            put(queues[index + 1], _DONE)
+
+    threads = [threading.Thread(target=run_source, name=f"{label}-{source[0]}", daemon=True)]
+    for index, (name, fn) in enumerate(stages):
+        threads.append(threading.Thread(target=run_stage, args=(index, fn), name=f"{label}-{name}", daemon=True))
+
+    wall_started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    stage = stats[-1]
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _DONE:
+                break
+            started = time.perf_counter()
+            sink[1](item)
+            stage.busy_seconds += time.perf_counter() - started
+            stage.items += 1
+    except BaseException as e:
+        fail(e)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    report = {s.name: s.as_dict() for s in stats}
+    report["wall_seconds"] = round(time.perf_counter() - wall_started, 3)
+    print(f"{label}: " + ", ".join(
+        f"{s.name} {s.items} frames @ {report[s.name]['fps']} fps" for s in stats
+    ) + f" ({report['wall_seconds']} s wall)", file=sys.stderr)
+    return report
@@ -0,0 +1,602 @@
+"""Extract-once landmark tracks shared by all offline analyzers.
+
+Every offline test used to run its own decode -> cvtColor -> pose.process loop
+and score each frame as it went. Instead, extract_track() runs that loop once
+and stores the result as a compact NumPy array:
+
+    track.landmarks   float32 (frames, 33, 4)  x, y, z, visibility (NaN if no pose)
+    track.timestamps  float64 (frames,)        presentation time in seconds
+    track.present     bool    (frames,)        True where a pose was detected
+    track.inferred    bool    (frames,)        True where inference ran (see sampling.py;
+                                               the motion gate may have reused landmarks)
+
+The per-test modules then score the whole track with vectorized functions, so
+the same track can be scored (or re-scored with new thresholds) many times
+without touching the video again.
+"""
+import importlib
+import os
+import sys
+import threading
+
+import cv2
+import mediapipe as mp
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+import artifact_store
+from pipeline import run_pipeline
+from registry import POSE_SETTINGS
+from sampling import FrameSampler
+
+mp_pose = mp.solutions.pose
+PoseLandmark = mp_pose.PoseLandmark
+
+NUM_LANDMARKS = 33
+X, Y, Z, VISIBILITY = range(4)
+
+class PoseTrack:
+    def __init__(self, landmarks, timestamps, present, fps, width, height, inferred=None, stats=None):
+        self.landmarks = landmarks
+        self.timestamps = timestamps
+        self.present = present
+        # Frames that went through pose inference (the rest were interpolated)
+        self.inferred = present.copy() if inferred is None else inferred
+        self.fps = fps
+        self.width = width
+        self.height = height
+        # How the track was produced (per-stage throughput etc.); not cached
+        self.stats = stats or {}
+
+    @property
+    def frame_count(self):
+        return len(self.timestamps)
+
+    def coord(self, landmark, axis):
+        """Per-frame values of one landmark coordinate (NaN where no pose)."""
+        return self.landmarks[:, int(landmark), axis]
+
+    def xy(self, landmark):
+        """Per-frame (x, y) of one landmark as a (frames, 2) array."""
+        return self.landmarks[:, int(landmark), :2]
+
+def landmarks_to_array(pose_landmarks):
+    """Converts a MediaPipe landmark list into a (33, 4) float32 array."""
+    return np.array(
+        [(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark],
+        dtype=np.float32,
+    )
+
+def array_to_landmarks(landmarks):
+    """Converts a (33, 4) array back into a MediaPipe NormalizedLandmarkList."""
+    return landmark_pb2.NormalizedLandmarkList(landmark=[
+        landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=v) for x, y, z, v in landmarks
+    ])
+
+def create_pose():
+    return mp_pose.Pose(**POSE_SETTINGS)
+
+def read_frames(cap, stop=None, start=0, count=None):
+    """Yields (timestamp_seconds, frame) for every frame of an open VideoCapture.
+
+    Starts at frame `start` and yields at most `count` frames (None: to the
+    end). Stops early once the optional threading.Event `stop` is set.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    last_timestamp = None
+    try:
+        while cap.isOpened() and not (stop is not None and stop.is_set()):
+            if count is not None and index - start >= count:
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            # Prefer the container's presentation time; some backends report 0.
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if last_timestamp is not None and timestamp <= last_timestamp:
+                timestamp = index / fps
+            last_timestamp = timestamp
+            index += 1
+            yield timestamp, frame
+    finally:
+        cap.release()
+
+def resize_for_inference(frame, max_side):
+    """Shrinks a frame so its longest side is at most max_side (None: unchanged).
+
+    The aspect ratio is kept, so normalized landmarks match the original frame.
+    """
+    height, width = frame.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return frame
+    scale = max_side / float(max(height, width))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+class RoiCropper:
+    """Runs pose on a crop around the athlete's last pose instead of the whole frame.
+
+    Wraps an infer(image) function whose landmarks are normalized to the
+    image it was given. Once a pose is found, frames are cropped to the box
+    around its visible landmarks, grown by `padding` times the box's longest
+    side on every side, and the landmarks found in the crop are mapped back
+    to the full frame. The crop stays put until the pose comes within
+    `margin` (a fraction of the crop) of its edge, because MediaPipe tracks
+    the pose from frame to frame in the coordinates of the image it is given
+    and a crop that moved every frame made the landmarks jitter. If the crop
+    yields no pose, or one whose torso visibility is below `min_visibility`,
+    the frame is run again uncropped. Settings come from registry.ROI; None
+    disables cropping.
+    """
+    def __init__(self, infer, settings=None):
+        self.infer = infer
+        self.settings = settings
+        self.box = None  # (x0, y0, x1, y1) in pixels, or None for the whole frame
+        self.cropped = 0
+        self.full = 0
+        self.fallbacks = 0
+        self.moves = 0
+
+    def _visible(self, landmarks, width, height):
+        return landmarks[landmarks[:, VISIBILITY] >= self.settings['min_visibility'], :2] * (width, height)
+
+    def _inside(self, visible):
+        x0, y0, x1, y1 = self.box
+        inset = self.settings['margin'] * np.array([x1 - x0, y1 - y0])
+        return (visible.min(axis=0) >= (x0, y0) + inset).all() and (visible.max(axis=0) <= (x1, y1) - inset).all()
+
+    def _update_box(self, landmarks, width, height):
+        visible = self._visible(landmarks, width, height)
+        if len(visible) < 2:
+            self.box = None
+            return
+        if self.box is not None and self._inside(visible):
+            return
+        low, high = visible.min(axis=0), visible.max(axis=0)
+        pad = self.settings['padding'] * max(high - low)
+        x0, y0 = np.maximum(np.floor(low - pad), 0).astype(int)
+        x1, y1 = np.minimum(np.ceil(high + pad), (width, height)).astype(int)
+        self.moves += self.box is not None
+        self.box = (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+    def _confident(self, landmarks):
+        torso = landmarks[[int(PoseLandmark.LEFT_SHOULDER), int(PoseLandmark.RIGHT_SHOULDER),
+                           int(PoseLandmark.LEFT_HIP), int(PoseLandmark.RIGHT_HIP)], VISIBILITY]
+        return torso.mean() >= self.settings['min_visibility']
+
+    def __call__(self, frame, infer=None):
+        """Landmarks for a frame, normalized to the whole frame.
+
+        `infer` stands in for the wrapped function for this call (the
+        realtime service runs each frame on whichever pooled Pose is free).
+        """
+        infer = infer or self.infer
+        if not self.settings:
+            return infer(frame)
+
+        height, width = frame.shape[:2]
+        landmarks = None
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            landmarks = infer(frame[y0:y1, x0:x1])
+            if landmarks is not None and self._confident(landmarks):
+                landmarks[:, X] = (landmarks[:, X] * (x1 - x0) + x0) / width
+                landmarks[:, Y] = (landmarks[:, Y] * (y1 - y0) + y0) / height
+                self.cropped += 1
+            else:
+                landmarks = None
+                self.box = None
+                self.fallbacks += 1
+        if landmarks is None:
+            landmarks = infer(frame)
+            self.full += 1
+        if landmarks is None:
+            self.box = None
+        else:
+            self._update_box(landmarks, width, height)
+        return landmarks
+
+    def stats(self):
+        return {"cropped": self.cropped, "full": self.full, "fallbacks": self.fallbacks, "moves": self.moves}
+
+class MotionGate:
+    """Skips pose inference on frames that look like the last inferred one.
+
+    Wraps an infer(frame) function. Each frame is shrunk to a small grayscale
+    thumbnail and compared with the thumbnail of the frame inference last ran
+    on; if hardly any pixels changed, the landmarks from that frame are
+    reused. Inference still runs at least once every `max_skip` + 1 frames,
+    on frames whose index is a multiple of that, so separately extracted
+    chunks of a video (see chunking.py) refresh on the same frames;
+    `frame_index` returns the index of the frame being passed in (by default
+    the gate counts its calls). Settings come from registry.MOTION_GATE; None
+    disables the gate.
+    """
+    def __init__(self, infer, settings=None, frame_index=None):
+        self.infer = infer
+        self.settings = settings
+        self.frame_index = frame_index or (lambda: self.checked - 1)
+        self.reference = None   # Thumbnail of the last frame inference ran on
+        self.reference_period = None
+        self.landmarks = None
+        self.checked = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.settings['size'] / float(max(height, width))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+    def __call__(self, frame):
+        if not self.settings:
+            return self.infer(frame)
+
+        self.checked += 1
+        period = self.frame_index() // (self.settings['max_skip'] + 1)
+        thumbnail = self._thumbnail(frame)
+        if self.reference is not None and period == self.reference_period:
+            changed = np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > self.settings['pixel_threshold'])
+            if changed < self.settings['changed_fraction'] * thumbnail.size:
+                self.skipped += 1
+                return self.landmarks
+
+        self.reference, self.reference_period = thumbnail, period
+        self.landmarks = self.infer(frame)
+        return self.landmarks
+
+    def stats(self):
+        return {"checked": self.checked, "skipped": self.skipped}
+
+class FlowTracker:
+    """Runs pose only on keyframes and follows a few landmarks with optical flow.
+
+    Wraps an infer(frame) function for tests that only need a couple of
+    landmarks (e.g. the hip for endurance runs). Pose inference runs every
+    `keyframe_interval` frames; in between, the tracked landmarks are moved
+    with pyramidal Lucas-Kanade flow on the inference-sized grayscale frame
+    and the rest of the skeleton follows their mean displacement. A point
+    lost by LK, or one whose forward-backward error exceeds `max_fb_error`
+    pixels, ends the stretch and pose runs on that frame instead.
+    Keyframes fall on frames whose index is a multiple of the interval, so
+    separately extracted chunks of a video (see chunking.py) run pose on the
+    same frames; `frame_index` returns the index of the frame being passed in
+    (by default the tracker counts its calls). Settings come from the test's
+    'tracking' in registry.py; None disables it.
+    """
+    def __init__(self, infer, settings=None, max_side=None, frame_index=None):
+        self.infer = infer
+        self.settings = settings
+        self.max_side = max_side
+        self.calls = 0
+        self.frame_index = frame_index or (lambda: self.calls - 1)
+        self.points = [int(PoseLandmark[name]) for name in (settings or {}).get('landmarks', [])]
+        self.previous_gray = None
+        self.landmarks = None
+        self.keyframes = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def _keyframe(self, frame, gray):
+        self.keyframes += 1
+        self.landmarks = self.infer(frame)
+        self.previous_gray = gray if self.landmarks is not None else None
+        return self.landmarks
+
+    def _flow(self, gray):
+        """Tracked landmarks' new positions (normalized), or None if tracking failed."""
+        height, width = gray.shape
+        size = np.array([width, height], dtype=np.float32)
+        start = (self.landmarks[self.points, :2] * size).reshape(-1, 1, 2).astype(np.float32)
+        lk = {'winSize': (21, 21), 'maxLevel': 3}
+        end, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, start, None, **lk)
+        if end is None or not status.all():
+            return None
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous_gray, end, None, **lk)
+        if back is None or not back_status.all():
+            return None
+        if np.max(np.linalg.norm((back - start).reshape(-1, 2), axis=1)) > self.settings['max_fb_error']:
+            return None
+        return end.reshape(-1, 2) / size
+
+    def __call__(self, frame):
+        if not self.settings:
+            return self.infer(frame)
+
+        self.calls += 1
+        gray = cv2.cvtColor(resize_for_inference(frame, self.max_side), cv2.COLOR_BGR2GRAY)
+        if self.landmarks is None or self.frame_index() % self.settings['keyframe_interval'] == 0:
+            return self._keyframe(frame, gray)
+
+        moved = self._flow(gray)
+        if moved is None:
+            self.lost += 1
+            return self._keyframe(frame, gray)
+
+        landmarks = self.landmarks.copy()
+        landmarks[:, :2] += np.mean(moved - self.landmarks[self.points, :2], axis=0)
+        landmarks[self.points, :2] = moved
+        self.landmarks = landmarks
+        self.previous_gray = gray
+        self.tracked += 1
+        return landmarks
+
+    def stats(self):
+        return {"keyframes": self.keyframes, "tracked": self.tracked, "lost": self.lost}
+
+def records_to_track(records, fps, width, height, stats=None):
+    """Builds a PoseTrack from (index, timestamp, landmarks_or_None, inferred) records."""
+    missing = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    return PoseTrack(
+        landmarks=np.stack([missing if r[2] is None else r[2] for r in records]) if records
+            else np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32),
+        timestamps=np.array([r[1] for r in records], dtype=np.float64),
+        present=np.array([r[2] is not None for r in records], dtype=bool),
+        fps=fps,
+        width=width,
+        height=height,
+        inferred=np.array([r[3] for r in records], dtype=bool),
+        stats=stats,
+    )
+
+class FinalityWatch:
+    """Decides when extraction can stop because every test's result is final.
+
+    Records are copied into growing arrays as they come in, so the partial
+    PoseTrack is a view of them rather than a rebuild. Every half second of
+    video it is passed to each 'module:function' check from the 'early_stop'
+    settings (see registry.early_stop_settings()) together with a dict of that
+    check's own, where it keeps how far it got so it only looks at the new
+    frames next time. Once all of them agree, extraction carries on for
+    `tail_seconds` more and then stops.
+    """
+    def __init__(self, early_stop, fps, width, height):
+        self.checks = []
+        for name in early_stop['checks']:
+            module, function = name.split(':')
+            self.checks.append(getattr(importlib.import_module(module), function))
+        self.walks = [{} for _ in self.checks]
+        self.tail_seconds = early_stop.get('tail_seconds', 0.0)
+        self.check_every = max(1, int(round(fps / 2)))
+        self.fps, self.width, self.height = fps, width, height
+        self.next_check = self.check_every
+        self.final_time = None
+        self.final_frame = None
+        self.count = 0
+        self.landmarks = np.full((0, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        self.timestamps = np.empty(0, dtype=np.float64)
+        self.present = np.zeros(0, dtype=bool)
+        self.inferred = np.zeros(0, dtype=bool)
+
+    def _append(self, records):
+        new = records[self.count:]
+        end = self.count + len(new)
+        if end > len(self.timestamps):
+            # Doubling keeps the copies down to O(n) overall
+            size = max(end, 2 * len(self.timestamps), self.check_every)
+            landmarks = np.full((size, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+            landmarks[:self.count] = self.landmarks[:self.count]
+            timestamps = np.empty(size, dtype=np.float64)
+            timestamps[:self.count] = self.timestamps[:self.count]
+            present = np.zeros(size, dtype=bool)
+            present[:self.count] = self.present[:self.count]
+            inferred = np.zeros(size, dtype=bool)
+            inferred[:self.count] = self.inferred[:self.count]
+            self.landmarks, self.timestamps, self.present, self.inferred = landmarks, timestamps, present, inferred
+        for i, (_, timestamp, landmarks, inferred) in enumerate(new, self.count):
+            self.timestamps[i] = timestamp
+            self.inferred[i] = inferred
+            if landmarks is not None:
+                self.landmarks[i] = landmarks
+                self.present[i] = True
+        self.count = end
+
+    def is_done(self, records):
+        if not records:
+            return False
+        if self.final_time is None:
+            if len(records) < self.next_check:
+                return False
+            self.next_check = len(records) + self.check_every
+            self._append(records)
+            n = self.count
+            track = PoseTrack(self.landmarks[:n], self.timestamps[:n], self.present[:n], self.fps,
+                              self.width, self.height, inferred=self.inferred[:n])
+            if not all(check(track, walk) for check, walk in zip(self.checks, self.walks)):
+                return False
+            self.final_time, self.final_frame = records[-1][1], len(records) - 1
+        return records[-1][1] - self.final_time >= self.tail_seconds
+
+    def stats(self):
+        return {"final_frame": self.final_frame}
+
+def extract_track(video_path, pose=None, settings=None):
+    """Decodes a video once, runs pose estimation and returns a PoseTrack.
+
+    settings come from registry.extraction_settings(); its 'sampling' policy
+    decides which frames get inference (see sampling.py), and landmarks for
+    the rest are interpolated. With 'roi' settings, frames are cropped to the
+    athlete's last pose (RoiCropper). Frames (or crops) are shrunk to its
+    'inference' max_side before colour conversion and inference, and frames
+    the motion gate finds static reuse the previous landmarks. With 'tracking' settings, pose
+    only runs on keyframes and optical flow fills in between (FlowTracker).
+    With 'early_stop' settings, decoding stops a short tail after every
+    test's result is final (see FinalityWatch). Decoding runs on its own
+    thread (see pipeline.py) so it overlaps with inference. Long videos are
+    split into chunks extracted in parallel processes (see chunking.py).
+    Returns None if the video can't be opened.
+    """
+    import chunking
+    if chunking.should_chunk(video_path, settings):
+        return chunking.extract_track_chunked(video_path, settings)
+
+    extracted = extract_records(video_path, pose, settings)
+    if extracted is None:
+        return None
+    records, stats, (fps, width, height) = extracted
+    return records_to_track(records, fps, width, height, stats)
+
+def extract_records(video_path, pose=None, settings=None, start=0, count=None):
+    """The sequential extraction behind extract_track().
+
+    Covers `count` frames from frame `start` (None: to the end). Returns
+    (records, stats, (fps, width, height)) with records as
+    (frame_index, timestamp, landmarks_or_None, inferred) tuples, or None if
+    the video can't be opened.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+
+    owns_pose = pose is None
+    if owns_pose:
+        pose = create_pose()
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    max_side = (settings or {}).get('inference', {}).get('max_side')
+
+    def infer(frame):
+        frame_rgb = cv2.cvtColor(resize_for_inference(frame, max_side), cv2.COLOR_BGR2RGB)
+        results = pose.process(frame_rgb)
+        if results.pose_landmarks:
+            return landmarks_to_array(results.pose_landmarks)
+        return None
+
+    # The sampler passes every frame it runs inference on down the chain, and
+    # knows its index in the video
+    roi = RoiCropper(infer, (settings or {}).get('roi'))
+    gate = MotionGate(roi, (settings or {}).get('motion_gate'), lambda: sampler.current)
+    tracker = FlowTracker(gate, (settings or {}).get('tracking'), max_side, lambda: sampler.current)
+    sampler = FrameSampler(tracker, (settings or {}).get('sampling'), start)
+    early_stop = (settings or {}).get('early_stop')
+    watch = FinalityWatch(early_stop, fps, width, height) if early_stop else None
+    stop = threading.Event()
+    records = []
+
+    def collect(resolved):
+        records.extend(resolved)
+        if watch is not None and not stop.is_set() and watch.is_done(records):
+            print(f"Result final at frame {watch.final_frame}; stopping extraction.", file=sys.stderr)
+            stop.set()
+
+    try:
+        stats = run_pipeline(('decode', read_frames(cap, stop, start, count)), [('inference', sampler.feed)],
+                             ('collect', collect), label=f'extract {os.path.basename(video_path)}@{start}')
+        collect(sampler.finish())
+    finally:
+        if owns_pose:
+            pose.close()
+    stats['sampling'] = sampler.stats()
+    stats['motion_gate'] = gate.stats()
+    stats['tracking'] = tracker.stats()
+    stats['roi'] = roi.stats()
+    if roi.settings:
+        print(f"Pose ran on a crop for {roi.cropped} frames and on the full frame for {roi.full} "
+              f"({roi.fallbacks} after a failed crop).", file=sys.stderr)
+    if gate.settings:
+        print(f"Motion gate skipped inference on {gate.skipped} of {gate.checked} frames.", file=sys.stderr)
+    if watch is not None:
+        stats['early_stop'] = watch.stats()
+
+    return records, stats, (fps, width, height)
+
+# --- Vectorized Helpers ---
+def calculate_angles(a, b, c):
+    """Angle at b (degrees, 0-180) for every row of three (frames, 2) point arrays."""
+    radians = np.arctan2(c[:, 1] - b[:, 1], c[:, 0] - b[:, 0]) - np.arctan2(a[:, 1] - b[:, 1], a[:, 0] - b[:, 0])
+    angle = np.abs(radians * 180.0 / np.pi)
+    return np.where(angle > 180.0, 360 - angle, angle)
+
+def forward_fill(values, valid, initial):
+    """Carries the last valid value forward; frames before the first one get `initial`."""
+    idx = np.where(valid, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+
+def previous(values, initial):
+    """values shifted one frame later, with `initial` in front (same length)."""
+    return np.concatenate(([initial], values[:-1])).astype(values.dtype)[:len(values)]
+
+def first_index(mask, start=0):
+    """Index of the first True in mask at or after `start`, or None."""
+    hits = np.flatnonzero(mask[start:])
+    return int(hits[0]) + start if len(hits) else None
+
+def crossing_time(track, values, frame, low=-np.inf, high=np.inf):
+    """Sub-frame time (seconds) at which `values` entered [low, high] on `frame`.
+
+    Interpolates linearly between `frame` and the previous frame with a pose,
+    using the video's timestamps, and clamps to that interval. Falls back to
+    the frame's own timestamp if there is no earlier pose to interpolate from.
+    """
+    end_time = float(track.timestamps[frame])
+    earlier = np.flatnonzero(track.present[:frame])
+    if not len(earlier):
+        return end_time
+    start = earlier[-1]
+    start_value, end_value = float(values[start]), float(values[frame])
+    # Rising values enter the range through `low`, falling ones through `high`
+    edge = low if end_value > start_value else high
+    if end_value == start_value or not np.isfinite(edge):
+        return end_time
+    fraction = min(max((edge - start_value) / (end_value - start_value), 0.0), 1.0)
+    start_time = float(track.timestamps[start])
+    return start_time + fraction * (end_time - start_time)
+
+def events_to_series(event_indices, frame_count):
+    """Turns a list of event frame indices into a per-frame running count."""
+    series = np.zeros(frame_count, dtype=np.int64)
+    np.add.at(series, np.asarray(event_indices, dtype=np.int64), 1)
+    return np.cumsum(series)
+
+# --- Rendering ---
+def draw_pose(frame, landmarks):
+    """Draws one frame's (33, 4) landmarks with MediaPipe's standard skeleton style."""
+    mp.solutions.drawing_utils.draw_landmarks(frame, array_to_landmarks(landmarks), mp_pose.POSE_CONNECTIONS)
+
+# Rough mp4v output size, to decide up front whether a render fits in memory
+RENDER_BYTES_PER_PIXEL = 0.02
+
+def render_annotated_video(video_path, track, draw_overlay, skip_missing=False):
+    """Re-decodes the source and writes an annotated mp4 to a temp artifact.
+
+    draw_overlay(frame, i) draws the test-specific text for frame i. With
+    skip_missing, frames without a detected pose are left out of the output.
+    Decode, annotation and encode each run on their own thread (see
+    pipeline.py). Returns the artifact's path (see artifact_store.py).
+    """
+    cap = cv2.VideoCapture(video_path)
+    expected_bytes = int(track.frame_count * track.width * track.height * RENDER_BYTES_PER_PIXEL)
+    temp_output_video_path = artifact_store.create('.mp4', expected_bytes)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(temp_output_video_path, fourcc, track.fps, (track.width, track.height))
+
+    def numbered_frames():
+        for i, (_, frame) in enumerate(read_frames(cap)):
+            if i >= track.frame_count:
+                break
+            if skip_missing and not track.present[i]:
+                continue
+            yield i, frame
+
+    def annotate(item):
+        i, frame = item
+        if track.present[i]:
+            draw_pose(frame, track.landmarks[i])
+        draw_overlay(frame, i)
+        return frame
+
+    try:
+        run_pipeline(('decode', numbered_frames()), [('annotate', annotate)], ('encode', out.write),
+                     label=f'render {os.path.basename(video_path)}')
+    finally:
+        cap.release()
+        out.release()
+    return artifact_store.settle(temp_output_video_path)
@@ -0,0 +1,189 @@
+"""Pre-flight probe that rejects clips no test can score.
+
+A clip with nobody in it, filmed sideways, cut off after a second or with a
+broken stream used to go through the whole analyzer and come back with a
+score of 0 (and an annotated video uploaded for it). probe_video() looks at
+the container metadata and runs pose on a few frames spread over the clip,
+within a fixed time budget (see registry.PROBE_SETTINGS), and judge() turns
+that report into a rejection for a given test, or None:
+
+    {"reason": "no_person", "message": "No person is visible in the video."}
+
+Reasons: 'unreadable', 'corrupt', 'low_resolution', 'too_short',
+'no_person' and 'wrong_orientation'. analyze_video.py runs preflight() on
+every clip before dispatching it, on a warm worker when the pool
+(analysis_worker.py) is running; rejected tests get
+{"testType", "error", "rejection"} as their result.
+
+    python probe.py VIDEO [TEST_TYPE ...]
+"""
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from registry import POSE_SETTINGS, PROBE_ENABLED, PROBE_SETTINGS, TESTS, get_test
+
+MESSAGES = {
+    'unreadable': "The video file could not be opened.",
+    'corrupt': "The video stream is damaged; most frames could not be decoded.",
+    'low_resolution': "The video resolution is too low to analyse.",
+    'too_short': "The video is too short for this test.",
+    'no_person': "No person is visible in the video.",
+    'wrong_orientation': "The video appears to be rotated; the athlete is lying on their side.",
+}
+
+# Landmark indices of the shoulders and hips (see pose_track.PoseLandmark)
+LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP = 11, 12, 23, 24
+
+# --- Probing ---
+_pose = None
+
+def _get_pose():
+    # Frames far apart are unrelated, so each one is detected from scratch;
+    # the same model as extraction, which ships with mediapipe
+    global _pose
+    if _pose is None:
+        import mediapipe as mp
+        _pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=POSE_SETTINGS['model_complexity'])
+    return _pose
+
+def _is_upright(landmarks, width, height):
+    """Whether the torso runs more up and down than sideways, or None if it isn't visible."""
+    torso = landmarks[[LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP]]
+    if np.isnan(torso).any() or (torso[:, 3] < 0.5).any():
+        return None
+    dx = (torso[:2, 0].mean() - torso[2:, 0].mean()) * width
+    dy = (torso[:2, 1].mean() - torso[2:, 1].mean()) * height
+    return abs(dy) > abs(dx)
+
+def _count_poses(report, landmark_frames):
+    upright = [_is_upright(landmarks, report['width'], report['height'])
+               for landmarks in landmark_frames if landmarks is not None]
+    report['with_pose'] = len(upright)
+    report['torso_visible'] = sum(u is not None for u in upright)
+    report['upright'] = sum(bool(u) for u in upright)
+
+def probe_video(video_path, settings=None):
+    """Metadata and sampled-pose report for a clip, gathered within the time budget."""
+    from pose_track import landmarks_to_array, resize_for_inference
+
+    settings = settings or PROBE_SETTINGS
+    started = time.perf_counter()
+    deadline = started + settings['budget_seconds']
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return {'readable': False, 'seconds': round(time.perf_counter() - started, 3)}
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        report = {
+            'readable': True,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': round(fps, 3),
+            'frame_count': frame_count,
+            # Some containers (and pipes) don't know their length
+            'duration': round(frame_count / fps, 3) if frame_count > 0 else None,
+        }
+        if frame_count > 0:
+            positions = np.linspace(0, frame_count - 1, settings['samples'] + 2)[1:-1].astype(int)
+        else:
+            positions = [None] * settings['samples']
+
+        landmark_frames, failed = [], 0
+        for position in positions:
+            if time.perf_counter() > deadline:
+                break
+            if position is not None:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+            else:
+                for _ in range(int(fps) - 1):  # About one sample per second
+                    cap.grab()
+            ret, frame = cap.read()
+            if not ret:
+                failed += 1
+                continue
+            if not report['width']:
+                report['height'], report['width'] = frame.shape[:2]
+            results = _get_pose().process(cv2.cvtColor(resize_for_inference(frame, settings['max_side']),
+                                                       cv2.COLOR_BGR2RGB))
+            landmark_frames.append(landmarks_to_array(results.pose_landmarks) if results.pose_landmarks else None)
+    finally:
+        cap.release()
+
+    report['sampled'] = len(landmark_frames)
+    report['failed'] = failed
+    report['complete'] = len(landmark_frames) + failed == len(positions)
+    _count_poses(report, landmark_frames)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+def track_report(track):
+    """The report probe_video() would give, from an already extracted PoseTrack."""
+    report = {
+        'readable': True, 'width': track.width, 'height': track.height, 'fps': round(track.fps, 3),
+        'frame_count': track.frame_count, 'duration': round(track.frame_count / track.fps, 3),
+        'sampled': track.frame_count, 'failed': 0, 'complete': True, 'seconds': 0.0,
+    }
+    _count_poses(report, [landmarks if present else None
+                          for landmarks, present in zip(track.landmarks, track.present)])
+    return report
+
+# --- Verdicts ---
+def judge(report, test_type, settings=None):
+    """Why a clip can't be scored for test_type ({"reason", "message"}), or None."""
+    settings = settings or PROBE_SETTINGS
+    limits = get_test(test_type).get('probe', {})
+    reason = None
+    if not report['readable']:
+        reason = 'unreadable'
+    elif report['failed'] > report['sampled']:
+        reason = 'corrupt'
+    elif report['width'] and min(report['width'], report['height']) < settings['min_side']:
+        reason = 'low_resolution'
+    elif report['duration'] is not None and report['duration'] < limits.get('min_seconds', 0):
+        reason = 'too_short'
+    elif report['sampled'] >= settings['min_samples']:
+        if report['with_pose'] < settings['min_pose_fraction'] * report['sampled']:
+            reason = 'no_person'
+        elif (limits.get('upright') and report['torso_visible']
+              and report['upright'] < settings['min_upright_fraction'] * report['torso_visible']):
+            reason = 'wrong_orientation'
+    if reason is None:
+        return None
+    return {"reason": reason, "message": MESSAGES[reason]}
+
+def preflight(video_path, test_types, track=None, probe=None):
+    """Rejection results for the tests a clip can't be scored for, keyed by test type.
+
+    Probes the clip with `probe(video_path)` (probe_video() by default; the
+    dispatcher passes one that runs on a warm worker), or judges its
+    extracted `track`, if there is one. Tests that pass, and unknown test
+    types, are left out.
+    """
+    test_types = [t for t in dict.fromkeys(test_types) if get_test(t)]
+    if not PROBE_ENABLED or not test_types:
+        return {}
+    report = track_report(track) if track is not None else (probe or probe_video)(video_path)
+    print(f"Probed {video_path}: {json.dumps(report)}", file=sys.stderr)
+    rejected = {}
+    for test_type in test_types:
+        rejection = judge(report, test_type)
+        if rejection is not None:
+            print(f"Rejected {video_path} for {test_type}: {rejection['reason']}", file=sys.stderr)
+            rejected[test_type] = {"testType": test_type, "error": rejection['message'],
+                                   "rejection": {**rejection, "probe": report}}
+    return rejected
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "No video path provided."}))
+        sys.exit(1)
+    report = probe_video(sys.argv[1])
+    print(json.dumps({
+        "probe": report,
+        "verdicts": {t: judge(report, t) for t in (sys.argv[2:] or TESTS) if get_test(t)},
+    }))
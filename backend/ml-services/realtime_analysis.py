@@ -2,14 +2,33 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import json
+import os
 import sys
 import base64
+import threading
 import time
+from collections import deque
 from datetime import datetime
+from functools import partial
+
+from frame_protocol import FrameReader, decode_payload, write_result
+from pose_track import RoiCropper, array_to_landmarks, landmarks_to_array
+from registry import ROI
+
+# Frames kept waiting for inference; older ones are dropped when it falls behind
+FRAME_WINDOW = int(os.environ.get('REALTIME_FRAME_WINDOW', 1))
+# Unchanged results are re-sent at most this often (0: send every result);
+# tests/test_realtime.py checks that they are skipped
+HEARTBEAT_SECONDS = float(os.environ.get('REALTIME_HEARTBEAT', 1.0))
+# REALTIME_ROI=1 runs pose on a crop around the last pose (see registry.ROI)
+ROI_SETTINGS = ROI if os.environ.get('REALTIME_ROI') == '1' else None
 
 # --- Pose Estimation Setup (for all analyzers) ---
 mp_pose = mp.solutions.pose
-pose_model = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+pose_model = None  # Created by main(); realtime_server.py keeps a pool instead
+
+def create_pose():
+    return mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
 
 # --- Base64 to Image Helper ---
 def base64_to_image(base64_string):
@@ -41,16 +60,20 @@ class BaseAnalyzer:
     def __init__(self, state_manager):
         self.state_manager = state_manager
         self.mp_pose = mp_pose
-        self.pose = pose_model
         
-    def process_frame(self, frame, landmarks):
-        # Override in subclasses
+    def process_frame(self, frame, landmarks, timestamp=None):
+        # Override in subclasses; timestamp is the client's capture time in seconds
         pass
     
     def get_result(self):
         # Override in subclasses
         pass
 
+    def change_key(self, result):
+        # What has to differ for a result to be sent before the next heartbeat
+        # (see ResultEmitter); override to leave out continuously changing values
+        return result
+
 # --- Sit Ups Analyzer ---
 class SitupsAnalyzer(BaseAnalyzer):
     def __init__(self, state_manager):
@@ -69,7 +92,7 @@ class SitupsAnalyzer(BaseAnalyzer):
         if angle > 180.0: angle = 360 - angle
         return angle
 
-    def process_frame(self, frame, landmarks):
+    def process_frame(self, frame, landmarks, timestamp=None):
         # Your Sit Ups logic here, using the state manager
         hip = [landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].x, landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y]
         shoulder = [landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].y]
@@ -101,7 +124,7 @@ class VerticalJumpAnalyzer(BaseAnalyzer):
             self.state_manager.set_state('start_height', None)
             self.state_manager.set_state('max_height', 0)
 
-    def process_frame(self, frame, landmarks):
+    def process_frame(self, frame, landmarks, timestamp=None):
         # Vertical Jump logic
         hip_y = (landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y + landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].y) / 2
         
@@ -120,6 +143,10 @@ class VerticalJumpAnalyzer(BaseAnalyzer):
             "result": {"max_height": self.state_manager.get_state('max_height')}
         }
 
+    def change_key(self, result):
+        # A new best height, to 1% of the frame height
+        return round(self.state_manager.get_state('max_height'), 2)
+
 # --- Shuttle Run Analyzer ---
 class ShuttleRunAnalyzer(BaseAnalyzer):
     def __init__(self, state_manager):
@@ -131,9 +158,12 @@ class ShuttleRunAnalyzer(BaseAnalyzer):
             self.state_manager.set_state('end_time', 0)
             self.state_manager.set_state('is_turning', False)
 
-    def process_frame(self, frame, landmarks):
+    def process_frame(self, frame, landmarks, timestamp=None):
         # Shuttle Run logic
         wrist_y = landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].y
+        # Time by the client's capture clock, so dropped frames don't skew it
+        timestamp = time.time() if timestamp is None else timestamp
+        self.state_manager.set_state('end_time', timestamp)
         
         # Conceptual logic based on landmarks and state
         current_laps = self.state_manager.get_state('lap_count')
@@ -142,7 +172,7 @@ class ShuttleRunAnalyzer(BaseAnalyzer):
         # This needs a more complex state machine like the file-based version
         if not self.state_manager.get_state('is_running'):
             self.state_manager.set_state('is_running', True)
-            self.state_manager.set_state('start_time', time.time())
+            self.state_manager.set_state('start_time', timestamp)
         # Example: check if wrist crosses a certain y-coordinate
         # if wrist_y < 0.2 and not self.state_manager.get_state('is_turning'):
         #     self.state_manager.set_state('is_turning', True)
@@ -151,12 +181,18 @@ class ShuttleRunAnalyzer(BaseAnalyzer):
         #     self.state_manager.set_state('is_turning', False)
 
     def get_result(self):
-        current_time = time.time() - self.state_manager.get_state('start_time')
+        current_time = self.state_manager.get_state('end_time') - self.state_manager.get_state('start_time')
         return {
             "testType": "Shuttle Run",
             "score": current_time,
             "result": {"laps": self.state_manager.get_state('lap_count'), "time_seconds": current_time}
         }
+
+    def change_key(self, result):
+        # The clock runs every frame; send it in tenths of a second, along
+        # with laps and starting
+        return (self.state_manager.get_state('lap_count'), self.state_manager.get_state('is_running'),
+                round(result['result']['time_seconds'], 1))
 # ... Add similar classes for EnduranceRunAnalyzer and BroadJumpAnalyzer
 
 # --- Main Dispatcher ---
@@ -171,7 +207,202 @@ def get_analyzer(test_type, state_manager):
 
     return None
 
+# --- Frame Input ---
+class LatestFrames:
+    """Hand-off from the stdin reader thread to the inference loop.
+
+    Holds at most `window` frames; when inference falls behind, the oldest
+    are dropped (and counted) so it always works on the newest ones.
+    """
+    def __init__(self, window=FRAME_WINDOW):
+        self.frames = deque()
+        self.window = max(1, window)
+        self.dropped = 0
+        self.closed = False
+        self.changed = threading.Condition()
+
+    def put(self, frame):
+        with self.changed:
+            self.frames.append(frame)
+            while len(self.frames) > self.window:
+                self.frames.popleft()
+                self.dropped += 1
+            self.changed.notify()
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify()
+
+    def get(self):
+        """The oldest waiting frame, or None once the input has ended."""
+        with self.changed:
+            while not self.frames and not self.closed:
+                self.changed.wait()
+            return self.frames.popleft() if self.frames else None
+
+    def take(self):
+        """The oldest waiting frame without blocking, or None."""
+        with self.changed:
+            return self.frames.popleft() if self.frames else None
+
+class PendingFrame:
+    """A frame as read from stdin; decoded only if inference gets to it."""
+    __slots__ = ('timestamp', 'session', 'decode')
+
+    def __init__(self, timestamp, session, decode):
+        # Client capture time in ms; arrival time if the client didn't send one
+        self.timestamp = timestamp or time.time() * 1000.0
+        self.session = session
+        self.decode = decode
+
+def read_json_lines(frames):
+    """Reads {"frame": <base64 JPEG>, "timestamp": <ms>} lines."""
+    try:
+        for line in sys.stdin:
+            try:
+                frame_data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            encoded = frame_data.get('frame')
+            if encoded:
+                # Decoding is deferred until the frame is picked, so bind this
+                # frame's data now rather than the loop variable
+                frames.put(PendingFrame(frame_data.get('timestamp'), 0, partial(base64_to_image, encoded)))
+    finally:
+        frames.close()
+
+def read_binary(frames):
+    """Reads length-prefixed frames (see frame_protocol.py)."""
+    # Frames wait in `frames` until they are decoded, so each gets its own buffer
+    reader = FrameReader(sys.stdin.buffer, reuse=False)
+    try:
+        while True:
+            message = reader.read_message()
+            if message is None:
+                break
+            encoding, width, height, session, timestamp, payload = message
+            frames.put(PendingFrame(timestamp, session, partial(decode_payload, encoding, width, height, payload)))
+    except ValueError as e:
+        # Past a bad header there is no way to find the next frame boundary
+        print(json.dumps({"error": str(e)}), file=sys.stderr)
+    finally:
+        frames.close()
+
+# --- Result Emission ---
+class ResultEmitter:
+    """Decides which results are sent.
+
+    Most frames leave the result as it was (the same rep count), so a result
+    only goes out when the analyzer's change_key() differs from the last one
+    sent (a new rep, a lap, a new anomaly), or as a heartbeat once
+    `heartbeat` seconds have passed since the last one sent. Keys are
+    compared as JSON snapshots, since a key can be the result itself, which
+    the caller and the analyzer may go on to change.
+    """
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        self.heartbeat = heartbeat
+        self.last_key = None
+        self.last_sent = None
+        self.suppressed = 0
+
+    def check(self, analyzer, result):
+        """None if the result can be skipped, else the result to send (marked if it's a heartbeat)."""
+        key = json.dumps(analyzer.change_key(result), sort_keys=True, default=str)
+        now = time.monotonic()
+        if self.last_sent is None or self.heartbeat <= 0 or key != self.last_key:
+            self.last_key, self.last_sent = key, now
+            return result
+        if now - self.last_sent >= self.heartbeat:
+            self.last_sent = now
+            return {**result, "heartbeat": True}
+        self.suppressed += 1
+        return None
+
+# --- Inference Loop ---
+def analyze_frame(analyzer, frame, timestamp=None, pose=None, roi=None):
+    """Runs pose on a BGR frame; returns the analyzer's result, or None if no pose was found.
+
+    With a RoiCropper (one per stream), pose runs on a crop around the
+    stream's last pose when it can.
+    """
+    pose = pose or pose_model
+    if roi is None or not roi.settings:
+        results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if not results.pose_landmarks:
+            return None
+        analyzer.process_frame(frame, results.pose_landmarks.landmark, timestamp)
+        return analyzer.get_result()
+
+    def infer(image):
+        results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return landmarks_to_array(results.pose_landmarks) if results.pose_landmarks else None
+
+    landmarks = roi(frame, infer)
+    if landmarks is None:
+        return None
+    analyzer.process_frame(frame, array_to_landmarks(landmarks).landmark, timestamp)
+    return analyzer.get_result()
+
+def run(analyzer, binary=False):
+    """Analyses the newest frames from stdin until it closes.
+
+    Only changed results and heartbeats are sent (see ResultEmitter). They
+    carry the total number of frames dropped so far ("droppedFrames") and, in
+    the JSON-lines protocol, the capture time of the frame they answer
+    ("frameTimestamp"). Once stdin closes, the analyzer's current result is
+    sent unconditionally, marked "final", as realtime_server.py does when a
+    session ends.
+    """
+    frames = LatestFrames()
+    emitter = ResultEmitter()
+    roi = RoiCropper(None, ROI_SETTINGS)
+    reader = threading.Thread(target=read_binary if binary else read_json_lines, args=(frames,),
+                              name='stdin', daemon=True)
+    reader.start()
+
+    def send(result, session, timestamp):
+        result = {**result, "droppedFrames": frames.dropped}
+        if binary:
+            write_result(sys.stdout.buffer, result, session, timestamp)
+        else:
+            result["frameTimestamp"] = timestamp
+            sys.stdout.write(json.dumps(result) + '\n')
+            sys.stdout.flush()
+
+    last = None  # (session, timestamp) of the last frame analysed
+    while True:
+        pending = frames.get()
+        if pending is None:
+            break
+        try:
+            frame = pending.decode()
+            if frame is None:
+                print(json.dumps({"error": "Could not decode frame."}), file=sys.stderr)
+                continue
+            result = analyze_frame(analyzer, frame, pending.timestamp / 1000.0, roi=roi)
+            last = (pending.session, pending.timestamp)
+            if result is not None:
+                result = emitter.check(analyzer, result)
+            if result is not None:
+                send(result, pending.session, pending.timestamp)
+        except Exception as e:
+            print(json.dumps({"error": f"An unexpected error occurred: {str(e)}"}), file=sys.stderr)
+            sys.stderr.flush()
+    # The last results may have been skipped as unchanged (or as changing
+    # too little, like the shuttle run clock)
+    session, timestamp = last or (0, 0.0)
+    send({**(analyzer.get_result() or {}), "final": True}, session, timestamp)
+    if frames.dropped:
+        print(f"Dropped {frames.dropped} frames while inference was behind.", file=sys.stderr)
+    print(f"Skipped {emitter.suppressed} unchanged results.", file=sys.stderr)
+    if roi.settings:
+        print(f"Pose ran on a crop for {roi.cropped} frames and on the full frame for {roi.full} "
+              f"({roi.fallbacks} after a failed crop).", file=sys.stderr)
+
 def main():
+    # Usage: realtime_analysis.py <testType> [--binary]
+    global pose_model
     if len(sys.argv) < 2:
         print(json.dumps({"error": "No test type provided."}))
         sys.exit(1)
@@ -184,31 +415,9 @@ def main():
         print(json.dumps({"error": f"Invalid test type: {test_type}"}))
         sys.exit(1)
 
+    pose_model = create_pose()
     # Main loop to read from stdin
-    while True:
-        try:
-            line = sys.stdin.readline()
-            if not line:
-                break
-            
-            frame_data = json.loads(line)
-            frame = base64_to_image(frame_data['frame'])
-            
-            if frame is not None:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = pose_model.process(frame_rgb)
-                
-                if results.pose_landmarks:
-                    analyzer.process_frame(frame, results.pose_landmarks.landmark)
-                    result = analyzer.get_result()
-                    sys.stdout.write(json.dumps(result) + '\n')
-                    sys.stdout.flush()
-
-        except json.JSONDecodeError:
-            continue
-        except Exception as e:
-            print(json.dumps({"error": f"An unexpected error occurred: {str(e)}"}), file=sys.stderr)
-            sys.stderr.flush()
+    run(analyzer, binary='--binary' in sys.argv[2:])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""Long-running realtime analysis service hosting many live sessions.
+
+Instead of one realtime_analysis.py per socket, each loading mediapipe and a
+Pose model of its own, server.js (REALTIME_SERVICE=1) starts this once and
+multiplexes every live test over its stdin/stdout with the binary protocol
+(see frame_protocol.py): frames carry their session id, control messages
+start and end sessions, and results come back tagged with the session and
+the frame they answer.
+
+Each session has its own StateManager, analyzer and pose crop (REALTIME_ROI,
+see pose_track.RoiCropper), keeps only its newest frames
+(REALTIME_FRAME_WINDOW, see realtime_analysis.LatestFrames) and only sends
+changed results and heartbeats (REALTIME_HEARTBEAT, see
+realtime_analysis.ResultEmitter). A pool of REALTIME_WORKERS threads runs
+inference:
+
+    fairness    sessions with a waiting frame are served round-robin, one
+                frame in flight per session, so a fast client can't starve
+                a slow one; the frames a session can't get to are dropped
+    Pose pool   up to REALTIME_POSE_POOL Pose instances, created as sessions
+                need them; a session gets the one it used last, so pose
+                tracking carries over between its frames. With more live
+                sessions than that, the least recently used one is reset and
+                reassigned
+    CPU budget  workers pause while the process has used more than
+                REALTIME_CPU_BUDGET cores over the last second
+
+    python realtime_server.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from frame_protocol import CONTROL, FrameReader, decode_payload, write_result
+from pose_track import RoiCropper
+from realtime_analysis import (ROI_SETTINGS, LatestFrames, PendingFrame, ResultEmitter, StateManager, analyze_frame,
+                               create_pose, get_analyzer)
+
+WORKERS = int(os.environ.get('REALTIME_WORKERS', os.cpu_count() or 1))
+CPU_BUDGET = float(os.environ.get('REALTIME_CPU_BUDGET', os.cpu_count() or 1))
+# A Pose holds about 75 MB; one reset for every frame (no tracking, detection
+# each time) cut throughput about fivefold with six sessions on one Pose
+POSE_POOL = int(os.environ.get('REALTIME_POSE_POOL', 16))
+MAX_SESSIONS = int(os.environ.get('REALTIME_MAX_SESSIONS', 64))
+
+# --- Sessions ---
+class Session:
+    def __init__(self, session_id, test_type, analyzer):
+        self.id = session_id
+        self.test_type = test_type
+        self.analyzer = analyzer
+        self.frames = LatestFrames()
+        self.emitter = ResultEmitter()
+        self.roi = RoiCropper(None, ROI_SETTINGS)  # Its crop follows the session whichever Pose it gets
+        self.busy = False      # A worker is on one of its frames
+        self.queued = False    # In the scheduler's ready queue
+        self.ending = False
+
+class PosePool:
+    """Pose instances shared by all sessions, preferring the one a session used last."""
+    def __init__(self, size):
+        self.size = size
+        self.created = 0
+        self.free = OrderedDict()  # Pose -> session that used it last, least recently used first
+        self.lock = threading.Lock()
+
+    def acquire(self, session_id):
+        with self.lock:
+            pose = next((p for p, owner in self.free.items() if owner == session_id), None)
+            if pose is not None:
+                del self.free[pose]
+                return pose
+            if self.created >= self.size:
+                pose, _ = self.free.popitem(last=False)
+                pose.reset()  # Its tracking state belongs to another session
+                return pose
+            self.created += 1
+        return create_pose()
+
+    def release(self, pose, session_id):
+        with self.lock:
+            self.free[pose] = session_id
+
+class CpuBudget:
+    """Holds workers back while the process uses more than `cores` CPUs."""
+    def __init__(self, cores, window=1.0):
+        self.cores = cores
+        self.window = window
+        self.samples = deque([(time.monotonic(), time.process_time())])
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now, cpu = time.monotonic(), time.process_time()
+                self.samples.append((now, cpu))
+                while len(self.samples) > 2 and now - self.samples[1][0] > self.window:
+                    self.samples.popleft()
+                since, cpu_since = self.samples[0]
+                # Pause until the CPU time used fits in the budget
+                delay = (cpu - cpu_since) / self.cores - (now - since)
+            if delay <= 0:
+                return
+            time.sleep(min(delay, self.window))
+
+class Scheduler:
+    """Round-robin hand-out of session frames to the inference workers."""
+    def __init__(self):
+        self.sessions = {}
+        self.ready = deque()
+        self.stopped = False
+        self.changed = threading.Condition()
+
+    def start_session(self, session_id, test_type):
+        """Returns an error message, or None once the session is started."""
+        analyzer = get_analyzer(test_type, StateManager())
+        if analyzer is None:
+            return f"Invalid test type: {test_type}"
+        with self.changed:
+            if session_id not in self.sessions and len(self.sessions) >= MAX_SESSIONS:
+                return f"Too many live sessions (at most {MAX_SESSIONS})."
+            self.sessions[session_id] = Session(session_id, test_type, analyzer)
+        print(f"Session {session_id} started ({test_type}); {len(self.sessions)} live.", file=sys.stderr)
+        return None
+
+    def end_session(self, session_id):
+        """Removes a session; returns it if it has no frame in flight (else the worker finishes it)."""
+        with self.changed:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return None
+            session.ending = True
+            return None if session.busy else session
+
+    def submit(self, session_id, pending):
+        with self.changed:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return False
+            session.frames.put(pending)
+            if not session.busy and not session.queued:
+                session.queued = True
+                self.ready.append(session)
+                self.changed.notify()
+            return True
+
+    def next_job(self):
+        """(session, frame) for a worker, or None once stopped."""
+        with self.changed:
+            while True:
+                while not self.ready and not self.stopped:
+                    self.changed.wait()
+                if self.stopped:
+                    return None
+                session = self.ready.popleft()
+                session.queued = False
+                pending = session.frames.take()
+                if pending is not None and not session.ending:
+                    session.busy = True
+                    return session, pending
+
+    def done(self, session):
+        """Marks a session's frame finished; returns the session if it ended meanwhile."""
+        with self.changed:
+            session.busy = False
+            if session.ending:
+                return session
+            if session.frames.frames and not session.queued:
+                session.queued = True
+                self.ready.append(session)
+                self.changed.notify()
+            return None
+
+    def stop(self):
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+
+# --- Service ---
+class RealtimeService:
+    def __init__(self, workers=WORKERS, cpu_budget=CPU_BUDGET):
+        self.scheduler = Scheduler()
+        # Every busy worker holds one Pose, so the pool never runs dry
+        self.pool = PosePool(max(workers, POSE_POOL))
+        self.budget = CpuBudget(cpu_budget)
+        self.output_lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f'inference-{i}', daemon=True)
+                        for i in range(workers)]
+
+    def emit(self, session_id, result, timestamp=0.0):
+        with self.output_lock:
+            write_result(sys.stdout.buffer, result, session_id, timestamp)
+
+    def _finish(self, session):
+        result = session.analyzer.get_result() or {}
+        self.emit(session.id, {**result, "droppedFrames": session.frames.dropped, "final": True})
+        print(f"Session {session.id} ended; dropped {session.frames.dropped} frames, "
+              f"skipped {session.emitter.suppressed} unchanged results.", file=sys.stderr)
+
+    def _work(self):
+        while True:
+            job = self.scheduler.next_job()
+            if job is None:
+                return
+            session, pending = job
+            try:
+                self.budget.wait()
+                frame = pending.decode()
+                if frame is None:
+                    self.emit(session.id, {"error": "Could not decode frame."}, pending.timestamp)
+                else:
+                    pose = self.pool.acquire(session.id)
+                    try:
+                        result = analyze_frame(session.analyzer, frame, pending.timestamp / 1000.0, pose,
+                                               session.roi)
+                    finally:
+                        self.pool.release(pose, session.id)
+                    if result is not None:
+                        result = session.emitter.check(session.analyzer, result)
+                    if result is not None:
+                        self.emit(session.id, {**result, "droppedFrames": session.frames.dropped},
+                                  pending.timestamp)
+            except Exception as e:
+                self.emit(session.id, {"error": f"An unexpected error occurred: {str(e)}"}, pending.timestamp)
+            finally:
+                ended = self.scheduler.done(session)
+            if ended is not None:
+                self._finish(ended)
+
+    def _control(self, session_id, payload):
+        try:
+            message = json.loads(bytes(payload))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            self.emit(session_id, {"error": "Invalid control message."})
+            return
+        if message.get('type') == 'start':
+            error = self.scheduler.start_session(session_id, message.get('testType'))
+            if error:
+                self.emit(session_id, {"error": error})
+        elif message.get('type') == 'end':
+            session = self.scheduler.end_session(session_id)
+            if session is not None:
+                self._finish(session)
+
+    def serve(self, stream):
+        """Reads frames and control messages until the stream ends."""
+        for thread in self.threads:
+            thread.start()
+        # Frames wait in the scheduler until they are decoded, so each gets its own buffer
+        reader = FrameReader(stream, reuse=False)
+        try:
+            while True:
+                message = reader.read_message()
+                if message is None:
+                    break
+                encoding, width, height, session_id, timestamp, payload = message
+                if encoding == CONTROL:
+                    self._control(session_id, payload)
+                    continue
+                self.scheduler.submit(session_id, PendingFrame(
+                    timestamp, session_id, lambda e=encoding, w=width, h=height, p=payload: decode_payload(e, w, h, p)))
+        except ValueError as e:
+            # Past a bad header there is no way to find the next frame boundary
+            print(json.dumps({"error": str(e)}), file=sys.stderr)
+        finally:
+            self.scheduler.stop()
+            for thread in self.threads:
+                thread.join()
+
+if __name__ == "__main__":
+    print(f"Realtime service up with {WORKERS} inference workers.", file=sys.stderr)
+    RealtimeService().serve(sys.stdin.buffer)
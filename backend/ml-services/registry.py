@@ -0,0 +1,279 @@
+import importlib
+import os
+
+from sampling import FULL_RATE, merge_policies
+
+# --- Pose Model Settings ---
+# Shared by every analyzer. Part of the pose track cache key, so changing any
+# of these invalidates previously extracted tracks.
+POSE_SETTINGS = {
+    'model_complexity': 1,
+    'smooth_landmarks': True,
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5,
+}
+
+# --- Motion Gate ---
+# Cheap pre-filter on the decode path: frames that barely differ from the one
+# pose inference last ran on (setup, idle time) reuse its landmarks instead.
+# Frames are compared as `size` px grayscale thumbnails; a frame is static if
+# fewer than `changed_fraction` of the pixels changed by more than
+# `pixel_threshold` grey levels. Inference still runs at least once every
+# `max_skip` + 1 frames. ANALYSIS_MOTION_GATE=0 turns it off.
+MOTION_GATE = {
+    'size': 64,
+    'pixel_threshold': 12,
+    'changed_fraction': 0.002,
+    'max_skip': 30,
+}
+
+# --- ROI Cropping ---
+# Once a pose is found, pose runs on frames cropped to the box around its
+# landmarks of at least `min_visibility`, grown by `padding` times the box's
+# longest side on every side, instead of on the whole frame; the crop moves
+# once the pose comes within `margin` of its edge (see pose_track.RoiCropper).
+# A crop whose torso visibility falls below `min_visibility` is retried on
+# the whole frame. Off by default: it cut pose time per frame by 10-15% (720p
+# and 1080p reference clips), but barely changed extraction time in
+# benchmark.py runs, where decoding and sampling dominate, and moved the jump
+# heights (8-25%) and endurance distance past the tolerances (see TESTS). MediaPipe
+# already tracks the pose from the previous frame's landmarks inside the
+# image it is given. ANALYSIS_ROI=1 turns it on.
+ROI = {
+    'padding': 0.5,
+    'margin': 0.1,
+    'min_visibility': 0.5,
+}
+
+# --- Early Termination ---
+# Once every test's result is final, extraction keeps going for this many
+# seconds of video (so the annotated video shows the finish) and then stops.
+EARLY_STOP_ENABLED = os.environ.get('ANALYSIS_EARLY_STOP', '1') != '0'
+EARLY_STOP_TAIL_SECONDS = float(os.environ.get('ANALYSIS_EARLY_STOP_TAIL', 1.0))
+
+# --- Temporal Chunking ---
+# Videos at least two chunks long are split into `seconds` long chunks that
+# are pose-tracked in parallel processes and stitched back together (see
+# chunking.py); each chunk also decodes `overlap` seconds on either side to
+# warm up and to find where to stitch. Pose tracking carries state across
+# frames, so a chunk's landmarks right after its start can differ from a
+# sequential pass; a chunk that hasn't caught up by the end of the overlap is
+# extracted again together with the one before it. With 4 s of overlap every
+# boundary of the reference clip looped into 8 s chunks stitched exactly
+# (with 0.5 s none did, and the video was in effect extracted sequentially).
+# Not used with early termination, and not part of the track cache key.
+# ANALYSIS_CHUNK_SECONDS=0 turns it off.
+CHUNK_SECONDS = float(os.environ.get('ANALYSIS_CHUNK_SECONDS', 60))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get('ANALYSIS_CHUNK_OVERLAP', 4))
+
+# --- Pre-flight Probe ---
+# Before any analysis is dispatched, probe.py reads the clip's container
+# metadata and runs pose on `samples` frames spread over it (shrunk to
+# `max_side` px), and rejects clips no test could score: unreadable or
+# corrupt, smaller than `min_side` px, a pose in fewer than
+# `min_pose_fraction` of the decoded samples, or shorter than / turned on
+# its side for the test's 'probe' settings below. It stops sampling after
+# `budget_seconds` (model loading included) and judges on what it has seen;
+# with fewer than `min_samples` decoded frames the pose checks are skipped.
+# ANALYSIS_PROBE=0 turns it off.
+PROBE_ENABLED = os.environ.get('ANALYSIS_PROBE', '1') != '0'
+PROBE_SETTINGS = {
+    'budget_seconds': float(os.environ.get('ANALYSIS_PROBE_BUDGET', 3.0)),
+    'samples': 8,
+    'min_samples': 3,
+    'max_side': 256,
+    'min_side': 144,
+    'min_pose_fraction': 0.25,
+    'min_upright_fraction': 0.5,
+}
+
+# --- Test Registry ---
+# Maps each supported test type to the script and entry points that implement it:
+# 'analyze' runs the full video analysis, 'score' scores an extracted PoseTrack
+# and 'render' writes the annotated video for one (see render_video.py), while
+# 'overlay' encodes it for client-side drawing instead (see overlay_track.py).
+# Bump 'version' whenever a test's scoring changes; it is part of the result
+# cache key (see analysis_cache.py).
+# 'extraction' holds the test's pose extraction defaults. 'sampling' is its
+# frame sampling policy (see sampling.py). Target tolerance against full-rate
+# analysis: counts and lap/rep totals exact, times within one frame, and
+# heights/distances within 2%. Endurance distance is the exception: it sums
+# frame-to-frame movement, jitter included, so interpolated or flow-tracked
+# frames make it read lower (about 13% on the reference clip with stride 2
+# sampling, about 5% with flow tracking). Set ANALYSIS_SAMPLING=full where it
+# must match full-rate results; re-check any change here with benchmark.py.
+# 'inference' caps the longest side (in pixels) of the frames pose inference
+# sees; None means full resolution. Landmarks are normalized, so scoring is
+# unaffected by the scale and annotation is still drawn on the original frames.
+# The jumps keep full resolution: their heights/distances drifted past 2% at
+# 640 px in benchmark.py runs, while counts, laps and endurance did not.
+# 'final' names a function that tells, from a partial PoseTrack, that the
+# test's result can no longer change; extraction then stops early (see
+# early_stop_settings()). It is called again as the track grows, with a dict
+# it can keep its progress in, so it only has to look at the new frames.
+# Tests without one always decode the whole video.
+# 'tracking' (optional) switches extraction to keyframe pose plus optical flow
+# for the listed landmarks (see pose_track.FlowTracker). It needs every frame,
+# so it replaces the test's sampling policy, and it is only used when every
+# test analysed together asks for it.
+# 'probe' holds the test's pre-flight limits: the shortest clip it can score
+# ('min_seconds') and whether the athlete's torso must mostly be upright
+# ('upright'), which catches rotated phone videos; sit-ups are filmed lying
+# down, so they can't be checked that way.
+# Modules are imported lazily so callers that only need the table (e.g. the
+# dispatcher in analyze_video.py) don't pay for the cv2/mediapipe imports.
+TESTS = {
+    'Sit Ups': {
+        'script': 'situps.py',
+        'module': 'situps',
+        'analyze': 'analyze_situps',
+        'score': 'score_situps',
+        'render': 'render_situps',
+        'overlay': 'overlay_situps',
+        'version': 1,
+        'probe': {'min_seconds': 2.0, 'upright': False},
+        'extraction': {
+            'sampling': {'stride': 2, 'adaptive': True, 'motion_threshold': 0.015,
+                         'key_landmarks': ['LEFT_SHOULDER', 'LEFT_HIP', 'LEFT_KNEE']},
+            'inference': {'max_side': 640},
+        },
+    },
+    'Vertical Jump': {
+        'script': 'verticaljump.py',
+        'module': 'verticaljump',
+        'analyze': 'analyze_vertical_jump',
+        'score': 'score_vertical_jump',
+        'render': 'render_vertical_jump',
+        'overlay': 'overlay_vertical_jump',
+        'version': 1,
+        'probe': {'min_seconds': 1.5, 'upright': True},
+        'extraction': {
+            'sampling': {'stride': 2, 'adaptive': True, 'motion_threshold': 0.01,
+                         'key_landmarks': ['LEFT_HIP', 'RIGHT_HIP']},
+            'inference': {'max_side': None},
+        },
+    },
+    'Shuttle Run': {
+        'script': 'shuttlerun.py',
+        'module': 'shuttlerun',
+        'analyze': 'analyze_shuttle_run',
+        'score': 'score_shuttle_run',
+        'render': 'render_shuttle_run',
+        'overlay': 'overlay_shuttle_run',
+        'final': 'is_final_shuttle_run',
+        'version': 2,
+        'probe': {'min_seconds': 3.0, 'upright': True},
+        'extraction': {
+            'sampling': {'stride': 2, 'adaptive': True, 'motion_threshold': 0.02,
+                         'key_landmarks': ['RIGHT_WRIST']},
+            'inference': {'max_side': 640},
+        },
+    },
+    'Endurance Run': {
+        'script': 'endurancerun.py',
+        'module': 'endurancerun',
+        'analyze': 'analyze_endurance_run',
+        'score': 'score_endurance_run',
+        'render': 'render_endurance_run',
+        'overlay': 'overlay_endurance_run',
+        'version': 1,
+        'probe': {'min_seconds': 5.0, 'upright': True},
+        'extraction': {
+            'sampling': {'stride': 2, 'adaptive': True, 'motion_threshold': 0.05,
+                         'key_landmarks': ['RIGHT_HIP']},
+            'inference': {'max_side': 480},
+            'tracking': {'keyframe_interval': 10, 'landmarks': ['RIGHT_HIP'], 'max_fb_error': 1.0},
+        },
+    },
+    'Broad Jump': {
+        'script': 'broadjump.py',
+        'module': 'broadjump',
+        'analyze': 'analyze_broad_jump',
+        'score': 'score_broad_jump',
+        'render': 'render_broad_jump',
+        'overlay': 'overlay_broad_jump',
+        'final': 'is_final_broad_jump',
+        'version': 2,
+        'probe': {'min_seconds': 1.5, 'upright': True},
+        'extraction': {
+            'sampling': {'stride': 2, 'adaptive': True, 'motion_threshold': 0.01,
+                         'key_landmarks': ['LEFT_ANKLE', 'RIGHT_ANKLE']},
+            'inference': {'max_side': None},
+        },
+    },
+}
+
+def merge_inference(configs):
+    """Largest inference resolution any of the tests asks for."""
+    sides = [c.get('max_side') for c in configs]
+    if not sides or None in sides:
+        return {'max_side': None}
+    return {'max_side': max(sides)}
+
+def merge_tracking(configs):
+    """Flow tracking settings that serve every test, or None if any test needs full pose."""
+    if not configs or not all(configs) or os.environ.get('ANALYSIS_TRACKING') == 'off':
+        return None
+    return {
+        'keyframe_interval': min(c['keyframe_interval'] for c in configs),
+        'landmarks': sorted({name for c in configs for name in c['landmarks']}),
+        'max_fb_error': min(c['max_fb_error'] for c in configs),
+    }
+
+def early_stop_settings(checks):
+    """Early termination settings for a list of 'module:function' finality checks.
+
+    Returns None (decode everything) when early termination is disabled.
+    """
+    if not checks or not EARLY_STOP_ENABLED:
+        return None
+    return {'checks': sorted(checks), 'tail_seconds': EARLY_STOP_TAIL_SECONDS}
+
+def extraction_settings(test_types):
+    """Pose extraction settings that satisfy every test in test_types.
+
+    These are part of the pose track cache key. ANALYSIS_SAMPLING=full forces
+    every frame through inference regardless of the tests' defaults, and
+    ANALYSIS_MAX_SIDE overrides the inference resolution (0 for full size).
+    Extraction stops early only if every test has a 'final' check; only
+    extraction that doesn't stop early is split into chunks.
+    """
+    tests = [TESTS[t] for t in test_types if t in TESTS]
+    tracking = merge_tracking([test['extraction'].get('tracking') for test in tests])
+    if os.environ.get('ANALYSIS_SAMPLING') == 'full':
+        sampling, tracking = dict(FULL_RATE), None
+    elif tracking:
+        sampling = dict(FULL_RATE)  # The tracker decides which frames get pose
+    else:
+        sampling = merge_policies([test['extraction']['sampling'] for test in tests])
+    if os.environ.get('ANALYSIS_MAX_SIDE'):
+        inference = {'max_side': int(os.environ['ANALYSIS_MAX_SIDE']) or None}
+    else:
+        inference = merge_inference([test['extraction']['inference'] for test in tests])
+    early_stop = None
+    if tests and all(test.get('final') for test in tests):
+        early_stop = early_stop_settings([f"{test['module']}:{test['final']}" for test in tests])
+    motion_gate = MOTION_GATE if os.environ.get('ANALYSIS_MOTION_GATE', '1') != '0' else None
+    roi = ROI if os.environ.get('ANALYSIS_ROI') == '1' else None
+    chunking = None
+    if CHUNK_SECONDS > 0 and not early_stop:
+        chunking = {'seconds': CHUNK_SECONDS, 'overlap': CHUNK_OVERLAP_SECONDS}
+    return {'pose': POSE_SETTINGS, 'sampling': sampling, 'inference': inference, 'roi': roi,
+            'motion_gate': motion_gate, 'tracking': tracking, 'early_stop': early_stop, 'chunking': chunking}
+
+def get_test(test_type):
+    """Returns the registry entry for a test type, or None if it is unknown."""
+    return TESTS.get(test_type)
+
+def load_entry_point(test_type, name='analyze'):
+    """Imports the module for a test type and returns the named entry point."""
+    test = TESTS.get(test_type)
+    if test is None:
+        raise KeyError(f"Invalid test type: {test_type}.")
+    module = importlib.import_module(test['module'])
+    return getattr(module, test[name])
+
+def preload_all():
+    """Imports every analyzer module up front (used by warm workers)."""
+    for test in TESTS.values():
+        importlib.import_module(test['module'])
@@ -0,0 +1,83 @@
+"""On-demand rendering of annotated videos.
+
+Score-only analyses (analyze_video.py --score-only, batch_analyze.py
+--score-only) skip the annotate/encode/upload step. When somebody actually
+opens a result, this regenerates its annotated video from the source clip and
+the pose track stored in the analysis cache, so pose inference doesn't run a
+second time:
+
+    python render_video.py VIDEO TEST_TYPE [--analyzed-with TYPES] [--output PATH]
+
+A clip analysed together with other tests shares one track with them; pass the
+same comma-separated list with --analyzed-with so the right track is found.
+Without --output the video is uploaded and its URL printed as
+{"testType": ..., "analyzedVideoUrl": ...}; with --output it is written to
+PATH instead.
+"""
+import argparse
+import json
+import shutil
+import sys
+import traceback
+
+import analysis_cache
+import artifact_store
+from analyze_video import is_url, parse_test_types
+from registry import extraction_settings, get_test, load_entry_point
+from source_cache import fetch
+import uploader
+
+def load_track(video_path, test_types):
+    """The stored track for a video analysed with test_types, extracting it only if it isn't cached."""
+    settings = extraction_settings(test_types)
+    if analysis_cache.ENABLED:
+        track = analysis_cache.get_track(analysis_cache.track_key(analysis_cache.file_digest(video_path), settings))
+        if track is not None:
+            return track
+        print(f"No stored pose track for {video_path}; extracting it again.", file=sys.stderr)
+    return analysis_cache.cached_extract_track(video_path, settings=settings)
+
+def render_video(video_path, test_type, analyzed_with=None, output_path=None):
+    test = get_test(test_type)
+    if test is None:
+        return {"error": f"Invalid test type: {test_type}."}
+    test_types = [t for t in dict.fromkeys([test_type, *(analyzed_with or [])]) if get_test(t)]
+
+    track = load_track(video_path, test_types)
+    if track is None:
+        return {"error": f"Could not open video file: {video_path}"}
+
+    temp_output_video_path = load_entry_point(test_type, 'render')(video_path, track)
+    try:
+        if output_path:
+            shutil.move(temp_output_video_path, output_path)
+            return {"testType": test_type, "path": output_path}
+        # Whoever asked for the video is waiting for its URL, so this uploads in the foreground
+        return {"testType": test_type, "analyzedVideoUrl": uploader.upload(temp_output_video_path)}
+    finally:
+        artifact_store.release(temp_output_video_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a test's annotated video from its stored pose track.")
+    parser.add_argument('video', help="Path or URL of the source clip.")
+    parser.add_argument('test_type')
+    parser.add_argument('--analyzed-with', default='',
+                        help="Comma-separated tests the clip was analysed together with.")
+    parser.add_argument('--output', help="Write the video here instead of uploading it.")
+    args = parser.parse_args()
+
+    video_path = args.video
+    source = None
+    try:
+        if is_url(video_path):
+            source = fetch(video_path)
+            video_path = source.wait()
+        result = render_video(video_path, args.test_type, parse_test_types([args.analyzed_with]), args.output)
+    except RuntimeError as e:
+        result = {"error": str(e)}
+    except Exception:
+        result = {"error": f"An unexpected error occurred: {traceback.format_exc()}"}
+    finally:
+        if source is not None:
+            source.close()
+    print(json.dumps(result))
@@ -0,0 +1,156 @@
+"""Frame sampling policies for pose extraction.
+
+Running pose inference on every frame is wasteful when the athlete barely
+moves between adjacent frames. A sampling policy runs inference on a subset
+of frames and linearly interpolates landmarks for the rest:
+
+    stride            run inference on every Nth frame (1 = every frame)
+    adaptive          watch for fast motion between sampled frames and, when it
+                      happens, re-run inference on the skipped frames and stay at
+                      full rate until things calm down again
+    motion_threshold  per-frame displacement (normalized image units) of any
+                      key landmark that counts as fast motion
+    key_landmarks     PoseLandmark names watched for fast motion
+
+Appearing or disappearing poses always count as fast motion, so presence is
+never interpolated across a gap. Per-test defaults live in registry.py; see
+benchmark.py for measuring a policy's score drift against full-rate analysis.
+"""
+import numpy as np
+
+FULL_RATE = {'stride': 1, 'adaptive': False, 'motion_threshold': None, 'key_landmarks': []}
+
+def merge_policies(policies):
+    """Combines several tests' policies into one that satisfies all of them."""
+    policies = [p for p in policies if p]
+    if not policies:
+        return dict(FULL_RATE)
+    thresholds = [p['motion_threshold'] for p in policies if p.get('adaptive') and p.get('motion_threshold')]
+    return {
+        'stride': min(p.get('stride', 1) for p in policies),
+        'adaptive': any(p.get('adaptive') for p in policies),
+        'motion_threshold': min(thresholds) if thresholds else None,
+        'key_landmarks': sorted({name for p in policies for name in p.get('key_landmarks', [])}),
+    }
+
+def interpolate(start, end, timestamp):
+    """Landmarks at `timestamp`, linearly interpolated between two inferred frames.
+
+    start and end are (timestamp, landmarks) with landmarks a (33, 4) array or None.
+    """
+    (start_time, start_landmarks), (end_time, end_landmarks) = start, end
+    if start_landmarks is None or end_landmarks is None:
+        return None
+    if end_time <= start_time:
+        return start_landmarks
+    weight = (timestamp - start_time) / (end_time - start_time)
+    return start_landmarks + np.float32(weight) * (end_landmarks - start_landmarks)
+
+class FrameSampler:
+    """Decides which frames get pose inference and fills in the rest.
+
+    feed() takes frames in order and returns the records that are now
+    resolved, as (index, timestamp, landmarks_or_None, inferred) tuples, also
+    in order. finish() flushes whatever is still buffered at end of stream.
+    At most `stride` frames are ever held in memory.
+
+    Outside full-rate stretches, inference runs on the frames whose index is
+    a multiple of `stride` (and on the first and last frame), so a sampler
+    started at frame `start` of a video (see chunking.py) samples the same
+    frames as one started at its beginning. `current` is the index of the
+    frame inference last ran on.
+    """
+    def __init__(self, infer, policy=None, start=0):
+        policy = policy or FULL_RATE
+        self.infer = infer
+        self.stride = max(1, int(policy.get('stride', 1)))
+        self.adaptive = bool(policy.get('adaptive')) and self.stride > 1
+        self.motion_threshold = policy.get('motion_threshold') or float('inf')
+        self.key_landmarks = self._landmark_indices(policy.get('key_landmarks'))
+
+        self.start = start
+        self.index = start
+        self.current = None
+        self.pending = []     # (index, timestamp, frame) skipped since the last inferred frame
+        self.last = None      # (index, timestamp, landmarks) of the last inferred frame
+        self.dense = False    # Running every frame because of fast motion
+        self.calm_frames = 0
+        self.inferred = 0
+        self.backfilled = 0
+
+    @staticmethod
+    def _landmark_indices(names):
+        from pose_track import PoseLandmark
+        return [int(PoseLandmark[name]) for name in (names or [])]
+
+    def _is_fast(self, start, end):
+        (start_index, _, start_landmarks), (end_index, _, end_landmarks) = start, end
+        if (start_landmarks is None) != (end_landmarks is None):
+            return True
+        if start_landmarks is None or not self.key_landmarks:
+            return False
+        delta = end_landmarks[self.key_landmarks, :2] - start_landmarks[self.key_landmarks, :2]
+        per_frame = np.max(np.hypot(delta[:, 0], delta[:, 1])) / max(1, end_index - start_index)
+        return per_frame > self.motion_threshold
+
+    def _run(self, index, frame):
+        self.inferred += 1
+        self.current = index
+        return self.infer(frame)
+
+    def _sample(self, index, timestamp, frame):
+        landmarks = self._run(index, frame)
+        current = (index, timestamp, landmarks)
+        records = []
+
+        if self.last is not None and self.pending and self.adaptive and self._is_fast(self.last, current):
+            # Fast event somewhere in the skipped stretch: re-run it at full rate,
+            # then this frame again so the tracker's state ends on the newest frame.
+            for skipped_index, skipped_timestamp, skipped_frame in self.pending:
+                records.append((skipped_index, skipped_timestamp, self._run(skipped_index, skipped_frame), True))
+                self.backfilled += 1
+            landmarks = self._run(index, frame)
+            current = (index, timestamp, landmarks)
+            self.dense, self.calm_frames = True, 0
+        elif self.last is not None:
+            start = (self.last[1], self.last[2])
+            end = (timestamp, landmarks)
+            for skipped_index, skipped_timestamp, _ in self.pending:
+                records.append((skipped_index, skipped_timestamp, interpolate(start, end, skipped_timestamp), False))
+
+        if self.dense and self.last is not None and not records:
+            # Leave full-rate mode after `stride` calm frames in a row
+            self.calm_frames = 0 if self._is_fast(self.last, current) else self.calm_frames + 1
+            if self.calm_frames >= self.stride:
+                self.dense = False
+
+        records.append((index, timestamp, landmarks, True))
+        self.last = current
+        self.pending = []
+        return records
+
+    def feed(self, item):
+        timestamp, frame = item
+        index = self.index
+        self.index += 1
+
+        if self.last is None or self.dense or index % self.stride == 0:
+            return self._sample(index, timestamp, frame)
+
+        # Only adaptive sampling ever re-runs skipped frames; otherwise keep
+        # just the newest one, in case it turns out to be the last frame.
+        if not self.adaptive and self.pending:
+            previous_index, previous_timestamp, _ = self.pending[-1]
+            self.pending[-1] = (previous_index, previous_timestamp, None)
+        self.pending.append((index, timestamp, frame))
+        return []
+
+    def finish(self):
+        """Resolves frames still buffered at end of stream (the last one is always inferred)."""
+        if not self.pending:
+            return []
+        index, timestamp, frame = self.pending.pop()
+        return self._sample(index, timestamp, frame)
+
+    def stats(self):
+        return {"frames": self.index - self.start, "inferred": self.inferred, "backfilled": self.backfilled}
@@ -1,116 +1,100 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 import json
 import sys
-import tempfile
-import requests
-import os
-import urllib.parse
-import time
 from datetime import datetime
+from analysis_cache import cached_extract_track
+from pose_track import (PoseLandmark, crossing_time, events_to_series, first_index,
+                        render_annotated_video)
+from overlay_track import encode_overlay
+from registry import extraction_settings
+import uploader
 
-# --- ImageKit Credentials and Upload Function (Same as above) ---
-IK_PRIVATE_KEY = "your_imagekit_private_key"
-IK_PUBLIC_KEY = "your_imagekit_public_key"
-IK_URL_ENDPOINT = "your_imagekit_url_endpoint"
-
-def upload_to_imagekit(file_path):
-    try:
-        url = f"https://upload.imagekit.io/api/v1/files/upload"
-        headers = {'Authorization': f'Bearer {IK_PRIVATE_KEY}'}
-        
-        with open(file_path, 'rb') as f:
-            response = requests.post(url, files={'file': f}, data={
-                'fileName': f"shuttle_run_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4",
-                'folder': 'analyzed-videos'
-            })
-            response.raise_for_status()
-            return response.json().get('url')
-
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to upload to ImageKit: {e}", file=sys.stderr)
-        return None
-
-def analyze_shuttle_run(video_path):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    cap = cv2.VideoCapture(video_path)
-
-    if not cap.isOpened():
-        return {"error": f"Could not open video file: {video_path}"}
-        
-    start_line_y = 550
-    far_line_y = 150
-    line_touch_threshold = 25
-    
-    current_state = "READY"
-    lap_counter = 0
-    start_time = 0
-    final_time = 0
-    
-    # --- Video Writer Setup ---
-    temp_output_video_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    out = cv2.VideoWriter(temp_output_video_path, fourcc, fps, (width, height))
-    
-    # --- Main Analysis and Rendering Loop ---
-    while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
+# --- Calibration Lines (pixels) ---
+START_LINE_Y = 550
+FAR_LINE_Y = 150
+LINE_TOUCH_THRESHOLD = 25
+TOTAL_LAPS = 4
+
+# --- Vectorized Scoring ---
+def walk_laps(track, walk):
+    """Carries the start/lap walk on over the frames of `track` it hasn't seen.
+
+    `walk` holds the run's 'start_frame', the 'lap_frames' so far and the
+    'next' frame to look at; an empty dict starts from the beginning. The
+    line tests are evaluated for the new frames at once; the walk then only
+    visits the frames where the state changes. Returns `walk`.
+    """
+    begin = walk.setdefault('next', 0)
+    walk.setdefault('start_frame', None)
+    lap_frames = walk.setdefault('lap_frames', [])
+    present = track.present[begin:]
+    wrist_pos_y = np.trunc(track.coord(PoseLandmark.RIGHT_WRIST, 1)[begin:] * track.height)
+    walk['next'] = track.frame_count
+
+    i = 0
+    if walk['start_frame'] is None:
+        i = first_index(present & (wrist_pos_y > START_LINE_Y))
+        if i is None:
+            return walk
+        walk['start_frame'] = begin + i
+        # Touches are only checked on frames after the one that started the run
+        i += 1
+    at_far_line = present & (np.abs(wrist_pos_y - FAR_LINE_Y) < LINE_TOUCH_THRESHOLD)
+    at_start_line = present & (np.abs(wrist_pos_y - START_LINE_Y) < LINE_TOUCH_THRESHOLD)
+    while len(lap_frames) < TOTAL_LAPS:
+        line = at_far_line if len(lap_frames) % 2 == 0 else at_start_line
+        i = first_index(line, i)
+        if i is None:
             break
+        lap_frames.append(begin + i)
+        i += 1
+    return walk
 
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image_rgb)
-        
-        # Draw the virtual lines for visualization
-        cv2.line(frame, (0, start_line_y), (width, start_line_y), (0, 255, 0), 2)
-        cv2.line(frame, (0, far_line_y), (width, far_line_y), (0, 0, 255), 2)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            h, w, _ = frame.shape
-            
-            right_wrist = landmarks[mp_pose.PoseLandmark.RIGHT_WRIST]
-            wrist_pos_y = int(right_wrist.y * h)
-            
-            # State machine logic
-            if current_state == "READY" and wrist_pos_y > start_line_y:
-                current_state = "RUNNING"
-                start_time = time.time()
-            
-            elif current_state == "RUNNING" and abs(wrist_pos_y - far_line_y) < line_touch_threshold:
-                current_state = "RETURNING"
-                lap_counter += 1
-            
-            elif current_state == "RETURNING" and abs(wrist_pos_y - start_line_y) < line_touch_threshold:
-                lap_counter += 1
-                if lap_counter == 4:
-                    final_time = time.time() - start_time
-                    current_state = "FINISHED"
-                else:
-                    current_state = "RUNNING"
-
-            # --- Draw landmarks and text on the frame ---
-            mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-        
-        # Display analysis information
-        cv2.putText(frame, f'Laps: {lap_counter}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-        
-        if start_time > 0 and final_time == 0:
-            current_time = time.time() - start_time
-            cv2.putText(frame, f'Time: {current_time:.2f} s', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-        elif final_time > 0:
-            cv2.putText(frame, f'Final Time: {final_time:.2f} s', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+def shuttle_run_series(track):
+    """Walks the READY -> RUNNING <-> RETURNING -> FINISHED state machine over a PoseTrack.
 
-        out.write(frame)
-    
-    cap.release()
-    out.release()
-    pose.close()
+    Times come from the video's own timestamps, interpolated to the moment
+    the wrist crossed the line between two frames, so they don't depend on
+    how fast (or how many) frames were processed.
+    """
+    wrist_y = track.coord(PoseLandmark.RIGHT_WRIST, 1) * track.height
+    walk = walk_laps(track, {})
+    start_frame, lap_frames = walk['start_frame'], walk['lap_frames']
+    finish_frame = None
+    start_time = finish_time = None
+    if start_frame is not None:
+        start_time = crossing_time(track, wrist_y, start_frame, low=START_LINE_Y)
+    if len(lap_frames) == TOTAL_LAPS:
+        finish_frame = lap_frames[-1]
+        # The last lap ends on the start line
+        finish_time = crossing_time(track, wrist_y, finish_frame, low=START_LINE_Y - LINE_TOUCH_THRESHOLD,
+                                    high=START_LINE_Y + LINE_TOUCH_THRESHOLD)
+
+    return {
+        "laps": events_to_series(lap_frames, track.frame_count),
+        "start_frame": start_frame,
+        "finish_frame": finish_frame,
+        "start_time": start_time,
+        "finish_time": finish_time,
+    }
+
+def is_final_shuttle_run(track, walk=None):
+    """True once the last lap is done; later frames can't change the result.
+
+    Given the `walk` from a call on a shorter prefix of the same track, only
+    the frames added since are looked at.
+    """
+    return len(walk_laps(track, {} if walk is None else walk)['lap_frames']) == TOTAL_LAPS
+
+def score_shuttle_run(track, series=None):
+    if series is None:
+        series = shuttle_run_series(track)
+
+    lap_counter = int(series["laps"][-1]) if track.frame_count else 0
+    final_time = 0
+    if series["finish_frame"] is not None:
+        final_time = series["finish_time"] - series["start_time"]
 
     if final_time == 0:
         status = "INCOMPLETE"
@@ -119,12 +103,6 @@ def analyze_shuttle_run(video_path):
         status = "SUCCESS"
         final_score = final_time
 
-    # --- Final Score and Upload ---
-    analyzed_video_url = upload_to_imagekit(temp_output_video_path)
-    
-    if os.path.exists(temp_output_video_path):
-        os.remove(temp_output_video_path)
-
     return {
         "testType": "Shuttle Run",
         "result": {
@@ -133,13 +111,68 @@ def analyze_shuttle_run(video_path):
             "status": status,
         },
         "score": final_score,
-        "analyzedVideoUrl": analyzed_video_url
     }
 
+def render_shuttle_run(video_path, track, series=None):
+    """Writes the annotated video for a track to a temp file and returns its path."""
+    if series is None:
+        series = shuttle_run_series(track)
+    result = score_shuttle_run(track, series)
+    final_time = result["result"]["final_time_seconds"]
+    start_frame, finish_frame = series["start_frame"], series["finish_frame"]
+
+    def draw_overlay(frame, i):
+        # Draw the virtual lines for visualization
+        cv2.line(frame, (0, START_LINE_Y), (track.width, START_LINE_Y), (0, 255, 0), 2)
+        cv2.line(frame, (0, FAR_LINE_Y), (track.width, FAR_LINE_Y), (0, 0, 255), 2)
+
+        # Display analysis information
+        cv2.putText(frame, f'Laps: {series["laps"][i]}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+
+        if start_frame is not None and i >= start_frame and (finish_frame is None or i < finish_frame):
+            current_time = max(0.0, track.timestamps[i] - series["start_time"])
+            cv2.putText(frame, f'Time: {current_time:.2f} s', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+        elif finish_frame is not None and i >= finish_frame:
+            cv2.putText(frame, f'Final Time: {final_time:.2f} s', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+
+    return render_annotated_video(video_path, track, draw_overlay)
+
+def overlay_shuttle_run(track, series=None):
+    """Compact overlay for drawing this test's annotations on the client (see overlay_track.py)."""
+    if series is None:
+        series = shuttle_run_series(track)
+    return encode_overlay(track, counters={"laps": series["laps"]}, markers={"start": series["start_frame"], "finish": series["finish_frame"]})
+
+def analyze_shuttle_run(video_path, pose=None, track=None, render=True, overlay=False):
+    if track is None:
+        track = cached_extract_track(video_path, pose=pose, settings=extraction_settings(['Shuttle Run']))
+    if track is None:
+        return {"error": f"Could not open video file: {video_path}"}
+
+    series = shuttle_run_series(track)
+    result = score_shuttle_run(track, series)
+    if overlay:
+        result["overlay"] = overlay_shuttle_run(track, series)
+
+    if not render:
+        # Score-only: the annotated video can be rendered later (render_video.py)
+        result["analyzedVideoUrl"] = None
+        return result
+
+    # --- Upload the annotated video in the background (see uploader.py) ---
+    temp_output_video_path = render_shuttle_run(video_path, track, series)
+    result["analyzedVideoUrl"] = None
+    file_name = f"shuttle_run_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
+    result["analyzedVideo"] = uploader.submit(temp_output_video_path, file_name)
+    return result
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         video_path = sys.argv[1]
-        result = analyze_shuttle_run(video_path)
+        # --score-only skips rendering and uploading the annotated video;
+        # --overlay adds a compact overlay track for client-side drawing
+        result = analyze_shuttle_run(video_path, render='--score-only' not in sys.argv[2:],
+                                     overlay='--overlay' in sys.argv[2:])
         print(json.dumps(result))
     else:
         print(json.dumps({"error": "No video path provided"}))
\ No newline at end of file
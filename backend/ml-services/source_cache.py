@@ -0,0 +1,258 @@
+"""Local cache of downloaded source videos.
+
+The Node routes pass the same ImageKit URL to analyze_video.py again for
+retries and re-analysis. Instead of fetching the whole file every time, the
+downloads are kept under ANALYSIS_SOURCE_CACHE_DIR, keyed by URL:
+
+    <key>.mp4         the complete video
+    <key>.json        its URL, ETag/Last-Modified validators, size and SHA-256
+    <key>.part        an interrupted download, with its validators in
+    <key>.part.json   (resumed with a Range request)
+    <key>.lock        held while a process uses the entry; removed with it
+
+A cached video is revalidated with a conditional request (If-None-Match /
+If-Modified-Since); 304 Not Modified serves it from disk, anything else
+downloads it again. An interrupted download is resumed where it stopped if
+the server still has the same version (If-Range). All requests share one
+requests.Session, so repeated fetches reuse keep-alive connections.
+
+The cache is bounded by ANALYSIS_SOURCE_CACHE_MAX_BYTES; entries are touched
+on every hit and the least recently used ones are evicted first, skipping
+entries another process holds. If another process is already downloading
+the same URL, the video is downloaded to a temp file instead.
+
+    python source_cache.py stats
+    python source_cache.py purge
+
+tests/test_source_cache.py runs it against a local stand-in HTTP server.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import analysis_cache
+from stream_ingest import VideoDownload
+
+CACHE_DIR = os.environ.get('ANALYSIS_SOURCE_CACHE_DIR', os.path.join(analysis_cache.CACHE_DIR, 'sources'))
+MAX_BYTES = int(os.environ.get('ANALYSIS_SOURCE_CACHE_MAX_BYTES', 4 * 1024 ** 3))
+ENABLED = os.environ.get('ANALYSIS_SOURCE_CACHE', '1') != '0'
+POOL_SIZE = 8
+
+_session = None
+
+def session():
+    """The shared keep-alive session all source downloads go through."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+# --- Entries ---
+def _entry_paths(url):
+    base = os.path.join(CACHE_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest())
+    return {
+        'video': base + '.mp4',
+        'meta': base + '.json',
+        'part': base + '.part',
+        'part_meta': base + '.part.json',
+        'lock': base + '.lock',
+    }
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _write_json(path, data):
+    analysis_cache._atomic_write(path, lambda f: f.write(json.dumps(data).encode('utf-8')))
+
+def _validators(response):
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+def _conditional_headers(meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+def _resume_headers(part_path, meta):
+    # If-Range needs a strong ETag or a date; without one, start over
+    validator = meta.get('etag') if meta.get('etag') and not meta['etag'].startswith('W/') else meta.get('last_modified')
+    if not validator or not os.path.exists(part_path) or not os.path.getsize(part_path):
+        return {}
+    return {'Range': f"bytes={os.path.getsize(part_path)}-", 'If-Range': validator}
+
+def _try_lock(path):
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        # The entry was evicted, lock file and all, while we waited for it
+        _unlock(fd)
+
+def _unlock(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+class CachedSource:
+    """A cached video that is still current, with VideoDownload's interface."""
+    streamable = False
+
+    def __init__(self, url, path, digest, lock):
+        self.url, self.path, self.digest, self.lock = url, path, digest, lock
+
+    def wait(self):
+        return self.path
+
+    def hexdigest(self):
+        return self.digest
+
+    def close(self):
+        if self.lock is not None:
+            _unlock(self.lock)
+            self.lock = None
+
+class SourceDownload(VideoDownload):
+    """A VideoDownload into the cache; the entry is committed once it completes."""
+    def __init__(self, url, response, paths, lock):
+        self.paths, self.lock = paths, lock
+        super().__init__(url, response=response, path=paths['part'])
+
+    def _completed(self):
+        os.replace(self.paths['part'], self.paths['video'])
+        self.path = self.paths['video']
+        meta = _read_json(self.paths['part_meta']) or {}
+        _write_json(self.paths['meta'], {**meta, 'size': self.size, 'digest': self.digest.hexdigest()})
+        os.remove(self.paths['part_meta'])
+        evict()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.lock is not None:
+                _unlock(self.lock)
+                self.lock = None
+
+def fetch(url):
+    """Starts fetching a source video; returns a VideoDownload-like object.
+
+    Cache hits come back as a CachedSource (complete, not streamable); misses
+    as a download that is committed to the cache once it completes. Call
+    close() when done with the video.
+    """
+    if not ENABLED:
+        return VideoDownload(url, response=_get(url))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    paths = _entry_paths(url)
+    lock = _try_lock(paths['lock'])
+    if lock is None:
+        print(f"{url} is being fetched by another process; downloading a private copy.", file=sys.stderr)
+        return VideoDownload(url, response=_get(url))
+
+    try:
+        meta = _read_json(paths['meta'])
+        if meta and os.path.exists(paths['video']):
+            response = _get(url, _conditional_headers(meta))
+            if response.status_code == 304:
+                response.close()
+                os.utime(paths['video'])
+                print(f"Source cache hit for {url}", file=sys.stderr)
+                return CachedSource(url, paths['video'], meta['digest'], lock)
+        else:
+            response = _get(url, _resume_headers(paths['part'], _read_json(paths['part_meta']) or {}))
+        if response.status_code != 206:
+            _write_json(paths['part_meta'], {'url': url, **_validators(response)})
+        return SourceDownload(url, response, paths, lock)
+    except BaseException:
+        if not os.path.exists(paths['video']) and not os.path.exists(paths['part']):
+            os.remove(paths['lock'])  # Nothing was cached for this URL (e.g. a 404)
+        _unlock(lock)
+        raise
+
+def _get(url, headers=None):
+    try:
+        response = session().get(url, stream=True, headers=headers)
+        response.raise_for_status()
+        return response
+    except requests.RequestException as e:
+        raise RuntimeError(f"Failed to download video from URL: {e}")
+
+# --- Eviction and Inspection ---
+def list_entries():
+    """Returns (key, size_bytes, last_used) for every complete video, oldest first."""
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.mp4'):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue  # Removed by another process
+        entries.append((name[:-len('.mp4')], stat.st_size, stat.st_mtime))
+    entries.sort(key=lambda e: e[2])
+    return entries
+
+def remove_entry(key):
+    """Removes an entry unless another process holds it; returns whether it did."""
+    base = os.path.join(CACHE_DIR, key)
+    lock = _try_lock(base + '.lock')
+    if lock is None:
+        return False
+    try:
+        # The lock file goes too, while it is held; see _try_lock()
+        for suffix in ('.mp4', '.json', '.part', '.part.json', '.lock'):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+    finally:
+        _unlock(lock)
+    return True
+
+def evict(max_bytes=None):
+    """Deletes least recently used videos until the cache fits in max_bytes."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = list_entries()
+    total = sum(size for _, size, _ in entries)
+    for key, size, _ in entries:
+        if total <= max_bytes:
+            break
+        if remove_entry(key):
+            total -= size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the source video cache.")
+    parser.add_argument('command', choices=['stats', 'purge'])
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        entries = list_entries()
+        print(json.dumps({"dir": CACHE_DIR, "entries": len(entries),
+                          "bytes": sum(size for _, size, _ in entries), "max_bytes": MAX_BYTES}))
+    else:
+        removed = sum(remove_entry(key) for key, _, _ in list_entries())
+        print(json.dumps({"removed": removed}))
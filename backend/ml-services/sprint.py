@@ -1,49 +1,70 @@
-import cv2
-import mediapipe as mp
-import time
+import numpy as np
 import json
 import sys
+from analysis_cache import cached_extract_track
+from pose_track import PoseLandmark, crossing_time, first_index
+from registry import early_stop_settings, extraction_settings
+
+# Fixed calibration lines (pixels)
+START_LINE_X = 100
+FINISH_LINE_X = 1200
+
+# --- Vectorized Scoring ---
+def walk_sprint(track, walk):
+    """Finds the line crossings among the frames of `track` not yet seen.
+
+    `walk` holds the 'start_frame' and 'finish_frame' found so far and the
+    'next' frame to look at; an empty dict starts from the beginning.
+    Returns `walk`.
+    """
+    begin = walk.setdefault('next', 0)
+    walk.setdefault('start_frame', None)
+    walk.setdefault('finish_frame', None)
+    present = track.present[begin:]
+    right_shoulder_x = np.trunc(track.coord(PoseLandmark.RIGHT_SHOULDER, 0)[begin:] * track.width)
+    walk['next'] = track.frame_count
+
+    i = 0
+    for event, line_x in (('start_frame', START_LINE_X), ('finish_frame', FINISH_LINE_X)):
+        if walk[event] is None:
+            i = first_index(present & (right_shoulder_x > line_x), i)
+            if i is None:
+                break
+            walk[event] = begin + i
+            i += 1
+    return walk
+
+def sprint_series(track):
+    """Finds the start and finish of the run in a PoseTrack.
+
+    Times are the video timestamps at which the shoulder crossed each line,
+    interpolated between the frames on either side of it.
+    """
+    shoulder_x = track.coord(PoseLandmark.RIGHT_SHOULDER, 0) * track.width
+    walk = walk_sprint(track, {})
+    start_frame, finish_frame = walk['start_frame'], walk['finish_frame']
+    start_time = finish_time = None
+    if start_frame is not None:
+        start_time = crossing_time(track, shoulder_x, start_frame, low=START_LINE_X)
+    if finish_frame is not None:
+        finish_time = crossing_time(track, shoulder_x, finish_frame, low=FINISH_LINE_X)
+    return {"start_frame": start_frame, "finish_frame": finish_frame, "start_time": start_time, "finish_time": finish_time}
+
+def is_final_sprint(track, walk=None):
+    """True once the finish line is crossed; later frames can't change the result.
+
+    Given the `walk` from a call on a shorter prefix of the same track, only
+    the frames added since are looked at.
+    """
+    return walk_sprint(track, {} if walk is None else walk)['finish_frame'] is not None
+
+def score_sprint(track, series=None):
+    if series is None:
+        series = sprint_series(track)
 
-def analyze_sprint(video_path):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose()
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
-        return {"error": f"Could not open video file: {video_path}"}
-    
-    # Fixed calibration lines
-    start_line_x = 100
-    finish_line_x = 1200
-    
-    current_state = "READY"
-    start_time = 0
     final_time = 0
-    
-    while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
-            break
-        
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image_rgb)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            h, w, _ = frame.shape
-            
-            right_shoulder_x = int(landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER].x * w)
-            
-            if current_state == "READY" and right_shoulder_x > start_line_x:
-                current_state = "RUNNING"
-                start_time = time.time()
-            
-            elif current_state == "RUNNING" and right_shoulder_x > finish_line_x:
-                final_time = time.time() - start_time
-                current_state = "FINISHED"
-    
-    cap.release()
-    pose.close()
+    if series["finish_frame"] is not None:
+        final_time = series["finish_time"] - series["start_time"]
 
     if final_time == 0:
         status = "INCOMPLETE"
@@ -61,6 +82,18 @@ def analyze_sprint(video_path):
         "anomalies": ["Incomplete run"] if status == "INCOMPLETE" else []
     }
 
+def analyze_sprint(video_path, pose=None, track=None):
+    if track is None:
+        # Sprint isn't in the registry, so it asks for early termination itself
+        settings = extraction_settings(['Sprint'])
+        settings['early_stop'] = early_stop_settings(['sprint:is_final_sprint'])
+        if settings['early_stop']:
+            settings['chunking'] = None
+        track = cached_extract_track(video_path, pose=pose, settings=settings)
+    if track is None:
+        return {"error": f"Could not open video file: {video_path}"}
+    return score_sprint(track)
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         video_path = sys.argv[1]
@@ -0,0 +1,228 @@
+"""Streaming ingest: decode a video while it is still downloading.
+
+Downloading the whole upload before the first frame is decoded makes time to
+first frame grow with file size. A VideoDownload writes the response to a
+temp file on a background thread (hashing it on the way, so the cache key is
+ready as soon as the last byte lands) and, for MP4s laid out for streaming,
+hands out a named pipe that replays the growing file to the decoder as bytes
+arrive:
+
+    faststart   'moov' (the index) before 'mdat' (the samples)
+    fragmented  'moof' fragments, each with its own index
+
+Downloads that aren't cached (see source_cache.py) and the pipes are temp
+artifacts (see artifact_store.py), so a small download is held in memory.
+Other files, including MP4s with 'moov' at the end, can't be decoded from a
+pipe; callers wait() for the full download instead. The pipe is read once,
+front to back, so extraction from it can't be split into chunks or seek.
+ANALYSIS_STREAM_INGEST=0 turns streaming off.
+"""
+import hashlib
+import os
+import struct
+import sys
+import threading
+
+import requests
+
+import artifact_store
+
+ENABLED = os.environ.get('ANALYSIS_STREAM_INGEST', '1') != '0'
+CHUNK_SIZE = 64 * 1024
+HEAD_LIMIT = 1024 * 1024  # Give up on finding the layout after this many bytes
+STREAMABLE = ('faststart', 'fragmented')
+
+def sniff_layout(head):
+    """Layout of an MP4 from its first bytes, by walking the top-level boxes.
+
+    Returns 'faststart', 'fragmented', 'progressive' (samples before the
+    index), 'unknown' (not an MP4) or None if `head` is too short to tell.
+    """
+    if len(head) >= 8 and head[4:8] != b'ftyp':
+        return 'unknown'
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[offset:offset + 8])
+        if size == 1:
+            if offset + 16 > len(head):
+                return None
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if kind == b'moof':
+            return 'fragmented'
+        if kind == b'moov':
+            # Fragmented files start with a 'moov' too; both stream the same way
+            return 'faststart'
+        if kind == b'mdat':
+            return 'progressive'
+        if size < 8:
+            return 'unknown'
+        offset += size
+    return None
+
+class VideoDownload:
+    """Downloads a URL to a file in the background.
+
+    `path` is the file; wait() blocks until it is complete and returns it. If
+    `streamable`, open_stream() returns a named pipe that yields the file's
+    bytes as they arrive. close() removes the pipe and, unless a `path` was
+    given, the file.
+
+    An already opened streaming `response` can be passed in; if it is a 206
+    Partial Content answer to a Range request for the rest of `path`, the
+    download appends to what is already there (see source_cache.py).
+    """
+    def __init__(self, url, chunk_size=CHUNK_SIZE, response=None, path=None):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.changed = threading.Condition()
+        self.stream_path = None
+        self.feeder = None
+
+        try:
+            self.response = response if response is not None else requests.get(url, stream=True)
+            self.response.raise_for_status()
+        except requests.RequestException as e:
+            raise RuntimeError(f"Failed to download video from URL: {e}")
+        self.temporary = path is None
+        if self.temporary:
+            self.path = artifact_store.create('.mp4', int(self.response.headers.get('Content-Length') or 0))
+            self.file = open(self.path, 'wb')
+        else:
+            self.path = path
+            self.file = open(path, 'ab' if self._resumes(self.response, path) else 'wb')
+        self.chunks = self.response.iter_content(chunk_size=chunk_size)
+
+        # Read just enough to tell whether the file can be decoded as it arrives
+        head = b''
+        if self.file.tell():
+            with open(self.path, 'rb') as existing:
+                for chunk in iter(lambda: existing.read(chunk_size), b''):
+                    self.digest.update(chunk)
+                    self.size += len(chunk)
+                    if len(head) < HEAD_LIMIT:
+                        head += chunk
+            print(f"Resuming download of {url} at byte {self.size}.", file=sys.stderr)
+        self.layout = sniff_layout(head) if head else None
+        try:
+            while self.layout is None and len(head) < HEAD_LIMIT:
+                chunk = next(self.chunks, b'')
+                if not chunk:
+                    break
+                self._append(chunk)
+                head += chunk
+                self.layout = sniff_layout(head)
+        except requests.RequestException as e:
+            self.file.close()
+            if self.temporary:
+                artifact_store.release(self.path)
+            raise RuntimeError(f"Failed to download video from URL: {e}")
+        self.streamable = ENABLED and self.layout in STREAMABLE
+        print(f"Downloading {url} ({self.layout or 'unknown'} layout"
+              f"{', streaming' if self.streamable else ''}).", file=sys.stderr)
+
+        self.thread = threading.Thread(target=self._download, name='download', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _resumes(response, path):
+        if response.status_code != 206:
+            return False
+        content_range = response.headers.get('Content-Range', '')
+        if not os.path.exists(path) or not content_range.startswith(f"bytes {os.path.getsize(path)}-"):
+            raise RuntimeError(f"Failed to download video from URL: unexpected range {content_range!r}")
+        return True
+
+    def _append(self, chunk):
+        self.file.write(chunk)
+        self.file.flush()
+        self.digest.update(chunk)
+        with self.changed:
+            self.size += len(chunk)
+            self.changed.notify_all()
+
+    def _download(self):
+        try:
+            for chunk in self.chunks:
+                if self.cancelled:
+                    break
+                self._append(chunk)
+            self.file.close()
+            if not self.cancelled:
+                if self.temporary:
+                    self.path = artifact_store.settle(self.path)
+                self._completed()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.file.close()
+            self.response.close()
+            with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    def _completed(self):
+        """Called on the download thread once the last byte is written."""
+
+    def wait(self):
+        """Blocks until the download is complete; returns the temp file path."""
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Failed to download video from URL: {self.error}")
+        print(f"Video downloaded to {self.path}", file=sys.stderr)
+        return self.path
+
+    def hexdigest(self):
+        """SHA-256 of the complete file (same as analysis_cache.file_digest())."""
+        self.wait()
+        return self.digest.hexdigest()
+
+    # --- Streaming ---
+    def open_stream(self):
+        """Path of a named pipe replaying the file from the start as it downloads."""
+        if not self.streamable:
+            raise ValueError(f"{self.url} can't be decoded while downloading ({self.layout} layout).")
+        self.stream_path = artifact_store.create('.mp4')
+        os.remove(self.stream_path)
+        os.mkfifo(self.stream_path)
+        self.feeder = threading.Thread(target=self._feed, args=(self.stream_path,), name='stream', daemon=True)
+        self.feeder.start()
+        return self.stream_path
+
+    def _feed(self, stream_path):
+        try:
+            with open(stream_path, 'wb') as stream, open(self.path, 'rb') as source:
+                while True:
+                    data = source.read(self.chunk_size)
+                    if data:
+                        stream.write(data)
+                        continue
+                    with self.changed:
+                        if source.tell() >= self.size:
+                            if self.done:
+                                break
+                            self.changed.wait()
+        except BrokenPipeError:
+            pass  # The decoder stopped reading (early termination or an error)
+
+    def close(self):
+        """Stops streaming and removes the temp file and pipe."""
+        if self.feeder is not None and self.feeder.is_alive():
+            # Nobody opened the pipe: open its read end so the feeder gets
+            # a broken pipe instead of blocking forever
+            try:
+                os.close(os.open(self.stream_path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            self.feeder.join(timeout=1.0)
+        if self.stream_path is not None:
+            artifact_store.release(self.stream_path)
+        self.cancelled = True
+        self.thread.join()
+        if self.temporary and os.path.exists(self.path):
+            artifact_store.release(self.path)
+            print(f"Cleaned up temporary file: {self.path}", file=sys.stderr)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from chunking import plan_chunks, stitch
+
+CHUNKING = {'seconds': 10.0, 'overlap': 1.0}
+
+def records(indices, value=0.0, missing=()):
+    return [(i, i / 30.0, None if i in missing else np.full((33, 4), value, dtype=np.float32), True)
+            for i in indices]
+
+@pytest.mark.parametrize('frame_count', [600, 750, 901, 1000])
+def test_chunks_cover_the_video_in_order(frame_count):
+    chunks = plan_chunks(frame_count, 30.0, CHUNKING)
+    starts = [start for start, _, _ in chunks]
+    assert starts[0] == 0 and starts == sorted(starts)
+    for (start, decode_start, decode_end), next_start in zip(chunks, starts[1:] + [None]):
+        assert decode_start == max(0, start - 30)
+        if next_start is None:
+            assert decode_end is None
+        else:
+            # The overlap goes on past the next chunk's start
+            assert decode_end >= next_start + 30
+
+def test_short_remainder_folds_into_the_last_chunk():
+    assert [start for start, _, _ in plan_chunks(1000, 30.0, CHUNKING)] == [0, 300, 600]
+    assert [start for start, _, _ in plan_chunks(1050, 30.0, CHUNKING)] == [0, 300, 600, 900]
+
+@pytest.mark.parametrize('stride', [1, 2, 3, 4])
+def test_a_chunk_ends_on_the_sampling_grid(stride):
+    for _, _, decode_end in plan_chunks(1200, 30.0, CHUNKING, stride)[:-1]:
+        # The last frame decoded is one a sequential pass infers anyway
+        assert (decode_end - 1) % stride == 0
+
+def test_stitch_cuts_in_where_the_chunk_has_caught_up():
+    earlier = records(range(0, 40))
+    # The chunk starts cold and only agrees from frame 25 on
+    chunk = records(range(20, 25), value=0.5) + records(range(25, 60))
+    stitched, converged, cut = stitch(earlier, chunk, 30)
+    assert converged and cut == 25
+    assert [r[0] for r in stitched] == list(range(60))
+    assert all(np.allclose(r[2], 0.0) for r in stitched)
+
+def test_stitch_disagreement_at_the_end_of_the_overlap_is_not_converged():
+    earlier = records(range(0, 40))
+    chunk = records(range(20, 39)) + records(range(39, 60), value=0.5)
+    stitched, converged, cut = stitch(earlier, chunk, 30)
+    assert not converged
+    # The overlapping frame where both agree best
+    assert cut == 20
+    assert [r[0] for r in stitched] == list(range(60))
+
+def test_stitch_falls_back_to_the_boundary_when_pose_presence_never_agrees():
+    earlier = records(range(0, 40))
+    chunk = records(range(20, 60), missing=range(20, 40))
+    stitched, converged, cut = stitch(earlier, chunk, 30)
+    assert not converged and cut == 30
+    assert [r[0] for r in stitched] == list(range(60))
+    assert [r[2] is None for r in stitched if 30 <= r[0] < 40] == [True] * 10
@@ -0,0 +1,142 @@
+import base64
+import io
+import json
+import sys
+from functools import partial
+
+import cv2
+import numpy as np
+
+import realtime_analysis
+from frame_protocol import BGR, JPEG, encode_frame
+from pose_track import array_to_landmarks
+from realtime_analysis import (BaseAnalyzer, LatestFrames, PendingFrame, ResultEmitter, ShuttleRunAnalyzer,
+                               StateManager)
+
+def image(value):
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+def stdin_with(monkeypatch, data):
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(data), encoding='utf-8'))
+
+def queued(frames):
+    pending = []
+    while (frame := frames.take()) is not None:
+        pending.append(frame)
+    return pending
+
+def test_latest_frames_drops_the_oldest():
+    frames = LatestFrames(window=2)
+    for i in range(5):
+        frames.put(i)
+    assert frames.dropped == 3
+    assert frames.get() == 3 and frames.take() == 4
+    assert frames.take() is None
+    frames.close()
+    assert frames.get() is None
+
+def test_pending_frame_falls_back_to_the_arrival_time():
+    assert PendingFrame(1234.0, 0, None).timestamp == 1234.0
+    assert PendingFrame(None, 0, None).timestamp > 0
+
+def test_json_frames_decode_to_their_own_image(monkeypatch):
+    lines = ''.join(json.dumps({"frame": base64.b64encode(cv2.imencode('.png', image(v))[1]).decode('ascii'),
+                                "timestamp": 1000 + v}) + '\n' for v in (10, 20, 30))
+    stdin_with(monkeypatch, lines.encode('utf-8'))
+    frames = LatestFrames(window=3)
+    realtime_analysis.read_json_lines(frames)
+
+    # Decoding is deferred until now, after every frame has been read
+    pending = queued(frames)
+    assert [frame.timestamp for frame in pending] == [1010, 1020, 1030]
+    assert [int(frame.decode()[0, 0, 0]) for frame in pending] == [10, 20, 30]
+
+def test_binary_frames_keep_their_own_payload(monkeypatch):
+    data = b''.join(encode_frame(image(v), session=7, timestamp=1000 + v, encoding=encoding)
+                    for v, encoding in ((10, BGR), (20, JPEG), (30, BGR)))
+    stdin_with(monkeypatch, data)
+    frames = LatestFrames(window=3)
+    realtime_analysis.read_binary(frames)
+
+    pending = queued(frames)
+    assert [(frame.session, frame.timestamp) for frame in pending] == [(7, 1010), (7, 1020), (7, 1030)]
+    decoded = [frame.decode() for frame in pending]
+    assert np.array_equal(decoded[0], image(10)) and np.array_equal(decoded[2], image(30))
+    assert abs(int(decoded[1][0, 0, 0]) - 20) <= 2  # JPEG
+
+class RepCounter(BaseAnalyzer):
+    """Counts a rep every `every` frames, updating one result object in place."""
+    def __init__(self, every=5):
+        super().__init__(StateManager())
+        self.every = every
+        self.frames = 0
+        self.result = {"testType": "Reps", "score": 0, "result": {"count": 0}}
+
+    def process_frame(self, frame, landmarks, timestamp=None):
+        self.frames += 1
+        self.result["result"]["count"] = self.result["score"] = self.frames // self.every
+
+    def get_result(self):
+        return self.result
+
+def test_emitter_skips_unchanged_results():
+    analyzer, emitter = RepCounter(), ResultEmitter(heartbeat=3600)
+    sent = []
+    for _ in range(12):
+        analyzer.process_frame(None, None)
+        if emitter.check(analyzer, analyzer.get_result()) is not None:
+            sent.append(analyzer.result["score"])
+    # The result object is the same every time; the changes still go out
+    assert sent == [0, 1, 2]
+    assert emitter.suppressed == 9
+
+def test_emitter_sends_a_heartbeat(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(realtime_analysis.time, 'monotonic', lambda: now[0])
+    analyzer, emitter = RepCounter(every=100), ResultEmitter(heartbeat=1.0)
+    assert emitter.check(analyzer, analyzer.get_result()) is not None
+    now[0] += 0.5
+    assert emitter.check(analyzer, analyzer.get_result()) is None
+    now[0] += 0.5
+    assert emitter.check(analyzer, analyzer.get_result())["heartbeat"]
+    assert all(ResultEmitter(heartbeat=0).check(analyzer, analyzer.get_result()) for _ in range(3))
+
+def test_shuttle_run_sends_its_clock_in_tenths():
+    analyzer, emitter = ShuttleRunAnalyzer(StateManager()), ResultEmitter(heartbeat=3600)
+    landmarks = array_to_landmarks(np.zeros((33, 4), dtype=np.float32)).landmark
+    sent = []
+    for i in range(31):
+        analyzer.process_frame(None, landmarks, 10.0 + i / 30.0)
+        result = emitter.check(analyzer, analyzer.get_result())
+        if result is not None:
+            sent.append(round(result["result"]["time_seconds"], 1))
+    assert sent == [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+def run(monkeypatch, capsys, analyzer, frames, heartbeat):
+    """The JSON results run() sends for `frames` copies of one frame."""
+    encoded = base64.b64encode(cv2.imencode('.png', image(0))[1]).decode('ascii')
+    lines = ''.join(json.dumps({"frame": encoded, "timestamp": 1000 + i * 33}) + '\n' for i in range(frames))
+    stdin_with(monkeypatch, lines.encode('utf-8'))
+    monkeypatch.setattr(realtime_analysis, 'LatestFrames', partial(LatestFrames, frames))
+    monkeypatch.setattr(realtime_analysis, 'ResultEmitter', partial(ResultEmitter, heartbeat))
+
+    def analyze_frame(analyzer, frame, timestamp=None, pose=None, roi=None):
+        analyzer.process_frame(frame, None, timestamp)
+        return analyzer.get_result()
+
+    monkeypatch.setattr(realtime_analysis, 'analyze_frame', analyze_frame)
+    realtime_analysis.run(analyzer)
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_run_sends_changes_and_a_final_result(monkeypatch, capsys):
+    results = run(monkeypatch, capsys, RepCounter(every=5), 12, heartbeat=3600)
+    assert [(r["score"], r["frameTimestamp"]) for r in results[:-1]] == [(0, 1000), (1, 1000 + 4 * 33),
+                                                                          (2, 1000 + 9 * 33)]
+    # The last result goes out at the end even though it didn't change
+    assert results[-1]["final"] and results[-1]["score"] == 2
+    assert results[-1]["frameTimestamp"] == 1000 + 11 * 33
+    assert all(r["droppedFrames"] == 0 for r in results)
+
+def test_run_sends_every_result_without_a_heartbeat(monkeypatch, capsys):
+    results = run(monkeypatch, capsys, RepCounter(every=5), 12, heartbeat=0)
+    assert len(results) == 13 and results[-1]["final"]
@@ -0,0 +1,74 @@
+import numpy as np
+
+from sampling import FrameSampler, interpolate, merge_policies
+
+def landmarks(value):
+    return np.full((33, 4), value, dtype=np.float32)
+
+def run(policy, frames, start=0, infer=None):
+    """Records for `frames` (each frame's value is its pose), and the frames inference ran on."""
+    ran = []
+
+    def default_infer(frame):
+        ran.append(frame)
+        return None if frame is None else landmarks(frame)
+
+    sampler = FrameSampler(infer or default_infer, policy, start)
+    records = []
+    for i, frame in enumerate(frames):
+        records.extend(sampler.feed(((start + i) / 30.0, frame)))
+    records.extend(sampler.finish())
+    return records, ran, sampler
+
+def test_interpolate_is_linear_in_time():
+    assert np.allclose(interpolate((0.0, landmarks(0)), (1.0, landmarks(10)), 0.25), 2.5)
+    assert interpolate((0.0, landmarks(0)), (1.0, None), 0.5) is None
+    assert np.allclose(interpolate((1.0, landmarks(3)), (1.0, landmarks(5)), 1.0), 3)
+
+def test_merge_policies_satisfies_all():
+    merged = merge_policies([{'stride': 3}, {'stride': 2, 'adaptive': True, 'motion_threshold': 0.1,
+                                            'key_landmarks': ['RIGHT_HIP']}])
+    assert merged == {'stride': 2, 'adaptive': True, 'motion_threshold': 0.1, 'key_landmarks': ['RIGHT_HIP']}
+    assert merge_policies([None])['stride'] == 1
+
+def test_stride_runs_on_the_grid_and_interpolates_the_rest():
+    records, ran, sampler = run({'stride': 3}, list(range(11)))
+    assert [r[0] for r in records] == list(range(11))
+    # The grid, plus the last frame
+    assert ran == [0, 3, 6, 9, 10]
+    assert [r[0] for r in records if r[3]] == ran
+    for index, _, pose, _ in records:
+        # Poses grow linearly with the frame index, so interpolation is exact
+        assert np.allclose(pose, index)
+    assert sampler.stats() == {"frames": 11, "inferred": 5, "backfilled": 0}
+
+def test_started_mid_video_samples_the_same_frames():
+    _, full, _ = run({'stride': 4}, list(range(40)))
+    _, chunk, sampler = run({'stride': 4}, list(range(10, 40)), start=10)
+    # The first frame always runs; after it, the same grid
+    assert chunk[0] == 10
+    assert chunk[1:] == [i for i in full if i > 10]
+    assert sampler.stats()["frames"] == 30
+
+def test_presence_is_not_interpolated_without_adaptive_sampling():
+    frames = [0, 1, 2, None, None, None, 6]
+    records, _, _ = run({'stride': 3}, frames)
+    assert [r[0] for r in records if r[3]] == [0, 3, 6]
+    assert [r[2] is None for r in records] == [False, True, True, True, True, True, False]
+
+def test_adaptive_sampling_reruns_a_fast_stretch():
+    frames = [0, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5]
+    policy = {'stride': 4, 'adaptive': True, 'motion_threshold': 0.05, 'key_landmarks': ['RIGHT_HIP']}
+
+    ran = []
+    def infer(frame):
+        ran.append(frame)
+        return landmarks(frame)
+
+    records, _, sampler = run(policy, frames, infer=infer)
+    assert [r[0] for r in records] == list(range(len(frames)))
+    # The jump between frames 4 and 8 is re-run at full rate...
+    assert all(r[3] for r in records if 4 <= r[0] <= 8)
+    assert sampler.stats()["backfilled"] == 3
+    # ...and every record has its frame's real pose
+    assert all(np.allclose(r[2], frames[r[0]]) for r in records)
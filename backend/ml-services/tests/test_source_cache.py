@@ -0,0 +1,122 @@
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+
+import source_cache
+
+SIZE = 1024 * 1024
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """Serves `data` at every path, recording the conditional and range headers it gets."""
+    daemon_threads = True
+
+    def __init__(self, data):
+        self.data = data
+        self.drop_after = None  # Bytes of the next body to send before dropping the connection
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), _StandInHandler)
+
+    @property
+    def etag(self):
+        return '"%s"' % hashlib.md5(self.data).hexdigest()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/video.mp4"
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        headers = {name: self.headers.get(name) for name in ('If-None-Match', 'Range', 'If-Range')}
+        server.requests.append(headers)
+        if headers['If-None-Match'] == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+        start = 0
+        if headers['Range'] and headers['If-Range'] == server.etag:
+            start = int(headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(server.data) - 1}/{len(server.data)}")
+        else:
+            self.send_response(200)
+        body = server.data[start:]
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.drop_after is not None:
+            self.wfile.write(body[:server.drop_after])
+            self.wfile.flush()
+            server.drop_after = None
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    server = StandInServer(os.urandom(SIZE))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(source_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(source_cache, 'ENABLED', True)
+    return tmp_path
+
+def fetch(url):
+    """(kind of source, its digest) for one fetch."""
+    download = source_cache.fetch(url)
+    try:
+        download.wait()
+        return type(download).__name__, download.hexdigest()
+    finally:
+        download.close()
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def test_an_interrupted_download_is_resumed(server):
+    server.drop_after = SIZE // 2
+    with pytest.raises(RuntimeError):
+        fetch(server.url)
+    assert os.path.getsize(source_cache._entry_paths(server.url)['part']) == SIZE // 2
+
+    del server.requests[:]
+    assert fetch(server.url) == ('SourceDownload', sha256(server.data))
+    assert server.requests[0]['Range'] == f"bytes={SIZE // 2}-"
+    assert server.requests[0]['If-Range'] == server.etag
+
+def test_a_cached_video_is_revalidated(server):
+    assert fetch(server.url) == ('SourceDownload', sha256(server.data))
+
+    del server.requests[:]
+    assert fetch(server.url) == ('CachedSource', sha256(server.data))
+    assert server.requests == [{'If-None-Match': server.etag, 'Range': None, 'If-Range': None}]
+
+def test_a_changed_video_is_downloaded_again(server):
+    fetch(server.url)
+    server.data = os.urandom(SIZE)
+
+    assert fetch(server.url) == ('SourceDownload', sha256(server.data))
+    with open(source_cache._entry_paths(server.url)['video'], 'rb') as f:
+        assert f.read() == server.data
+
+def test_eviction_removes_the_whole_entry(server, cache_dir):
+    fetch(server.url)
+    assert source_cache.list_entries()
+
+    source_cache.evict(max_bytes=0)
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,173 @@
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import artifact_store
+import uploader
+
+class StandInUploadServer(http.server.ThreadingHTTPServer):
+    """Takes multipart uploads and answers with a URL; can fail or hold them back."""
+    daemon_threads = True
+
+    def __init__(self):
+        self.failures = 0            # Next uploads to answer with a 503
+        self.gate = threading.Event()  # Uploads wait for this before they are answered
+        self.gate.set()
+        self.uploads = []
+        super().__init__(('127.0.0.1', 0), _StandInHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/upload"
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.gate.wait()
+        if server.failures:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        boundary = self.headers['Content-Type'].split('boundary=')[1].encode('utf-8')
+        fields = {}
+        for part in body.split(b'--' + boundary)[1:-1]:
+            head, _, value = part.partition(b'\r\n\r\n')
+            fields[head.split(b'name="')[1].split(b'"')[0].decode('utf-8')] = value[:-2]
+        server.uploads.append(fields)
+        reply = json.dumps({"url": f"http://stand-in/{fields['fileName'].decode('utf-8')}"}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = StandInUploadServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(uploader, 'UPLOAD_URL', server.url)
+    monkeypatch.setattr(uploader, 'BACKOFF_SECONDS', 0.0)
+    monkeypatch.setattr(uploader, 'STATUS_DIR', str(tmp_path / 'status'))
+    yield server
+    server.gate.set()
+    server.shutdown()
+    server.server_close()
+
+def artifact(data):
+    path = artifact_store.create()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_upload_streams_the_file_and_retries_transient_failures(server, tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(200 * 1024))
+    server.failures = 2
+    attempts = []
+
+    assert uploader.upload(str(path), 'video.mp4', attempts.append) == "http://stand-in/video.mp4"
+    assert attempts == [1, 2, 3]
+    assert server.uploads[0]['file'] == path.read_bytes()
+    assert server.uploads[0]['folder'] == uploader.FOLDER.encode('utf-8')
+
+def test_submit_without_the_service_uploads_in_this_process(server, tmp_path):
+    data = os.urandom(64 * 1024)
+    path = artifact(data)
+
+    handle = uploader.submit(path, 'clip.mp4', socket_path=str(tmp_path / 'missing.sock'))
+    assert handle['status'] == 'pending'
+    uploader.drain()
+
+    status = uploader.read_status(handle)
+    assert status['status'] == 'done' and status['url'] == "http://stand-in/clip.mp4"
+    assert server.uploads[-1]['file'] == data
+    # The uploader owns the file and releases it once uploaded
+    assert not os.path.exists(path)
+
+def test_settle_fills_in_or_drops_a_pending_upload(server, tmp_path):
+    os.makedirs(uploader.STATUS_DIR)
+
+    def result_with(status):
+        handle = {'id': 'x', 'status': 'pending', 'statusFile': str(tmp_path / 'status' / 'x.json')}
+        uploader._write_status({**handle, **status})
+        return {'score': 1, 'analyzedVideo': handle}
+
+    done = uploader.settle(result_with({'status': 'done', 'url': 'http://stand-in/x.mp4'}))
+    assert done['analyzedVideoUrl'] == 'http://stand-in/x.mp4' and done['analyzedVideo']['status'] == 'done'
+    assert uploader.settle(result_with({'status': 'failed', 'error': 'no'})) is None
+    running = result_with({'status': 'uploading', 'pid': os.getpid()})
+    assert uploader.settle(running) is running
+
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    assert uploader.settle(result_with({'status': 'uploading', 'pid': exited.pid})) is None
+    os.remove(str(tmp_path / 'status' / 'x.json'))
+    assert uploader.settle(running) is None
+
+@pytest.fixture
+def service(server, tmp_path):
+    socket_path = str(tmp_path / 'uploads.sock')
+    env = {**os.environ, 'ANALYSIS_UPLOAD_URL': server.url, 'ANALYSIS_UPLOAD_STATUS_DIR': uploader.STATUS_DIR,
+           'ANALYSIS_UPLOAD_WORKERS': '1', 'ANALYSIS_UPLOAD_QUEUE': '1'}
+    process = subprocess.Popen([sys.executable, uploader.__file__, 'serve', '--socket', socket_path],
+                               env=env, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        assert time.monotonic() < deadline and process.poll() is None, "Upload service did not start"
+        time.sleep(0.05)
+    yield process, socket_path
+    process.kill()
+    process.wait()
+
+def wait_for(handle, state, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            status = uploader.read_status(handle)
+            if status['status'] == state:
+                return status
+        except (OSError, ValueError):
+            pass
+        assert time.monotonic() < deadline, f"Upload never got to {state}"
+        time.sleep(0.05)
+
+def test_the_service_takes_uploads_over_and_bounds_its_queue(server, service):
+    process, socket_path = service
+    server.gate.clear()
+
+    # One upload in flight and one queued fill the service...
+    first = uploader.submit(artifact(b'first'), 'first.mp4', socket_path=socket_path)
+    wait_for(first, 'uploading')
+    second = uploader.submit(artifact(b'second'), 'second.mp4', socket_path=socket_path)
+
+    # ...so the next submit waits for room
+    handles = []
+    third = threading.Thread(target=lambda: handles.append(
+        uploader.submit(artifact(b'third'), 'third.mp4', socket_path=socket_path)))
+    third.start()
+    third.join(0.5)
+    assert third.is_alive()
+
+    server.gate.set()
+    third.join(10)
+    assert not third.is_alive()
+    for handle, name in ((first, 'first'), (second, 'second'), (handles[0], 'third')):
+        status = wait_for(handle, 'done')
+        assert status['url'] == f"http://stand-in/{name}.mp4"
+        # The service did the upload, so settle() watches its pid
+        assert status['pid'] == process.pid
+    assert sorted(upload['file'] for upload in server.uploads) == [b'first', b'second', b'third']
@@ -0,0 +1,338 @@
+"""Background uploads of annotated videos.
+
+Rendering an annotated video is quick next to POSTing it, so analyzers don't
+wait for the upload: submit() queues the file and returns straight away with
+a pending-video handle that goes into the result as "analyzedVideo":
+
+    {"id": "...", "status": "pending", "statusFile": "/tmp/.../<id>.json"}
+
+A small pool of upload threads (ANALYSIS_UPLOAD_WORKERS, default 2) works
+through the queue over one keep-alive session, streaming each file as a
+multipart body instead of reading it into memory. Connection errors, 429s
+and 5xx answers are retried with exponential backoff. Every state change is
+written to the status file ("pending", "uploading", then "done" with the
+"url", or "failed" with the "error"), and an optional callback gets the
+final status. The file is released from the artifact store (see
+artifact_store.py) once it is uploaded or given up on. Statuses carry the
+pid of the process doing the upload, so settle() can tell an upload that is
+still running from one whose process died with it.
+
+Uploads go to ANALYSIS_UPLOAD_URL (ImageKit's upload API by default), so a
+local stand-in server can take its place.
+
+Uploads go through one long-lived upload service when it runs, so every
+process shares its session and its limit on uploads in flight:
+
+    python uploader.py serve [--socket PATH]
+
+listens on ANALYSIS_UPLOAD_SOCKET (the backend starts it at boot, see
+backend/lib/uploadService.js). submit() hands the file over to it and returns
+once the service has taken it, so a one-off process (an analysis script,
+analyze_video.py) can exit as soon as its result is out. The service's queue
+holds at most ANALYSIS_UPLOAD_QUEUE files; when it is full, submitting waits
+for room.
+
+Without the service (or with a callback, which has to run in the caller),
+the upload is queued in the calling process instead. Workers of a warm pool
+(analysis_worker.py, batch_analyze.py) keep running after a job, so those
+uploads just carry on in the background, and every process finishes them
+before it exits; drain() waits for them explicitly.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing.util
+import os
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import artifact_store
+
+UPLOAD_URL = os.environ.get('ANALYSIS_UPLOAD_URL', 'https://upload.imagekit.io/api/v1/files/upload')
+PRIVATE_KEY = os.environ.get('IMAGEKIT_PRIVATE_KEY', 'your_imagekit_private_key')
+FOLDER = 'analyzed-videos'
+WORKERS = int(os.environ.get('ANALYSIS_UPLOAD_WORKERS', 2))
+MAX_ATTEMPTS = int(os.environ.get('ANALYSIS_UPLOAD_ATTEMPTS', 5))
+BACKOFF_SECONDS = float(os.environ.get('ANALYSIS_UPLOAD_BACKOFF', 1.0))
+MAX_QUEUED = int(os.environ.get('ANALYSIS_UPLOAD_QUEUE', 16))
+SOCKET_PATH = os.environ.get('ANALYSIS_UPLOAD_SOCKET', '/tmp/sih2025-uploads.sock')
+STATUS_DIR = os.environ.get('ANALYSIS_UPLOAD_STATUS_DIR', os.path.join(tempfile.gettempdir(), 'sih2025-uploads'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# --- Streamed Multipart Body ---
+class MultipartFile:
+    """A multipart/form-data body that reads the file as it is sent.
+
+    requests sends objects with read() block by block, and __len__ gives it
+    the Content-Length up front.
+    """
+    def __init__(self, path, fields, file_name, field='file'):
+        self.boundary = uuid.uuid4().hex
+        head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in fields.items()
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+                 f'Content-Type: video/mp4\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.length = len(head) + os.path.getsize(path) + len(tail)
+        self.file = open(path, 'rb')
+        self.parts = itertools.chain([head], iter(lambda: self.file.read(64 * 1024), b''), [tail])
+        self.buffer = b''
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            part = next(self.parts, None)
+            if part is None:
+                break
+            self.buffer += part
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.file.close()
+
+# --- Uploading ---
+_session = None
+
+def session():
+    """The shared keep-alive session all uploads go through."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, WORKERS))
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def upload(path, file_name=None, on_attempt=None):
+    """Uploads a file, retrying transient failures; returns its URL.
+
+    Raises RuntimeError once the upload fails for good.
+    """
+    file_name = file_name or os.path.basename(path)
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if on_attempt is not None:
+            on_attempt(attempt)
+        body = MultipartFile(path, {'fileName': file_name, 'folder': FOLDER}, file_name)
+        try:
+            response = session().post(UPLOAD_URL, data=body, auth=(PRIVATE_KEY, ''),
+                                      headers={'Content-Type': body.content_type})
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json().get('url')
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.HTTPError as e:
+            raise RuntimeError(f"Failed to upload {file_name}: {e}")
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        finally:
+            body.close()
+        if attempt < MAX_ATTEMPTS:
+            delay = BACKOFF_SECONDS * 2 ** (attempt - 1)
+            print(f"Upload of {file_name} failed ({error}); retrying in {delay:.1f} s.", file=sys.stderr)
+            time.sleep(delay)
+    raise RuntimeError(f"Failed to upload {file_name} after {MAX_ATTEMPTS} attempts: {error}")
+
+# --- Background Queue ---
+_queue = queue.Queue(maxsize=MAX_QUEUED)
+_threads = []
+_lock = threading.Lock()
+
+def _write_status(status):
+    os.makedirs(STATUS_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=STATUS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(status, f)
+    os.replace(temp_path, status['statusFile'])
+
+def _run_upload(job):
+    path, file_name, status, callback = job
+    def on_attempt(attempt):
+        _write_status({**status, 'status': 'uploading', 'attempts': attempt})
+    try:
+        status = {**status, 'status': 'done', 'url': upload(path, file_name, on_attempt)}
+        print(f"Uploaded {file_name}: {status['url']}", file=sys.stderr)
+    except Exception as e:
+        status = {**status, 'status': 'failed', 'error': str(e)}
+        print(f"Failed to upload to ImageKit: {e}", file=sys.stderr)
+    finally:
+        artifact_store.release(path)
+    _write_status(status)
+    if callback is not None:
+        try:
+            callback(status)
+        except Exception as e:
+            print(f"Upload callback for {file_name} failed: {e}", file=sys.stderr)
+
+def _worker():
+    while True:
+        job = _queue.get()
+        try:
+            _run_upload(job)
+        finally:
+            _queue.task_done()
+
+def _start_workers():
+    with _lock:
+        if _threads:
+            return
+        for i in range(max(1, WORKERS)):
+            thread = threading.Thread(target=_worker, name=f'upload-{i}', daemon=True)
+            thread.start()
+            _threads.append(thread)
+        # Runs at interpreter exit and when a multiprocessing worker exits
+        multiprocessing.util.Finalize(None, drain, exitpriority=10)
+
+def _hand_over(path, status, socket_path):
+    # The service takes the file over from this process's artifacts (which
+    # go when it exits) and answers once it is queued
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps({"path": path, "status": status}) + '\n').encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as f:
+            reply = f.readline()
+    if not reply:
+        raise OSError("Upload service closed the connection")
+    reply = json.loads(reply)
+    if 'error' in reply:
+        raise OSError(reply['error'])
+
+def submit(path, file_name=None, callback=None, socket_path=SOCKET_PATH):
+    """Queues a file for upload and returns its pending-video handle.
+
+    The file belongs to the uploader from here on and is released when done.
+    Without a callback, it goes to the upload service if one is running (see
+    above).
+    """
+    upload_id = uuid.uuid4().hex
+    status = {
+        'id': upload_id,
+        'status': 'pending',
+        'fileName': file_name or os.path.basename(path),
+        'statusFile': os.path.join(STATUS_DIR, f'{upload_id}.json'),
+        'pid': os.getpid(),
+    }
+    handle = {'id': upload_id, 'status': 'pending', 'statusFile': status['statusFile']}
+    if callback is None and os.path.exists(socket_path):
+        try:
+            _hand_over(path, status, socket_path)
+            return handle
+        except (OSError, ValueError) as e:
+            print(f"Could not hand the upload of {status['fileName']} to the upload service ({e}); "
+                  f"uploading in this process.", file=sys.stderr)
+    _write_status(status)
+    _start_workers()
+    _queue.put((path, status['fileName'], status, callback))
+    return handle
+
+def read_status(handle):
+    """Current status of a pending-video handle (or status file path)."""
+    path = handle['statusFile'] if isinstance(handle, dict) else handle
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def settle(result):
+    """A result with the outcome of its background upload filled in.
+
+    Returns the result unchanged while the upload is still going, with
+    "analyzedVideoUrl" set once it is done, or None if it failed (or its
+    status file or uploading process is gone), so the caller can analyse
+    and upload again.
+    """
+    handle = result.get('analyzedVideo')
+    if not isinstance(handle, dict) or handle.get('status') not in ('pending', 'uploading'):
+        return result
+    try:
+        status = read_status(handle)
+    except (OSError, ValueError):
+        return None
+    if status['status'] == 'done':
+        return {**result, 'analyzedVideoUrl': status['url'], 'analyzedVideo': {**handle, 'status': 'done'}}
+    if status['status'] == 'failed' or ('pid' in status and not _alive(status['pid'])):
+        return None
+    return result
+
+def drain():
+    """Blocks until every queued upload has finished."""
+    if _threads and _queue.unfinished_tasks:
+        print(f"Waiting for {_queue.unfinished_tasks} upload(s) to finish.", file=sys.stderr)
+    _queue.join()
+
+# --- Upload Service ---
+class _UploadHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            path = artifact_store.adopt(request['path'])
+            status = {**request['status'], 'pid': os.getpid()}
+            _write_status(status)
+            _start_workers()
+            # Blocks while the queue is full, which holds the submitter back
+            _queue.put((path, status['fileName'], status, None))
+            reply = {"id": status['id']}
+        except Exception as e:
+            reply = {"error": f"Upload service could not take the file: {e}"}
+            print(reply["error"], file=sys.stderr)
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+class UploadServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(socket_path=SOCKET_PATH):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Stale socket from a previous run
+
+    server = UploadServer(socket_path, _UploadHandler)
+    print(f"Upload service ({max(1, WORKERS)} workers, up to {MAX_QUEUED} queued) listening on {socket_path}",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        drain()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background upload service (see submit()).")
+    parser.add_argument('mode', choices=['serve'])
+    parser.add_argument('--socket', default=SOCKET_PATH, help="Unix socket path.")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args.socket)
@@ -1,116 +1,94 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 import json
 import sys
-import tempfile
-import requests
-import os
-import urllib.parse
 from datetime import datetime
+from analysis_cache import cached_extract_track
+from pose_track import PoseLandmark, render_annotated_video
+from overlay_track import encode_overlay
+from registry import extraction_settings
+import uploader
 
-# --- ImageKit Credentials ---
-IK_PRIVATE_KEY = "your_imagekit_private_key"
-IK_PUBLIC_KEY = "your_imagekit_public_key"
-IK_URL_ENDPOINT = "your_imagekit_url_endpoint"
+# --- Vectorized Scoring ---
+def vertical_jump_series(track):
+    """Per-frame running maximum jump height for a whole PoseTrack."""
+    # Use hip landmarks for height calculation
+    hip_y = (track.coord(PoseLandmark.LEFT_HIP, 1) + track.coord(PoseLandmark.RIGHT_HIP, 1)) / 2
 
-def upload_to_imagekit(file_path):
-    try:
-        url = f"https://upload.imagekit.io/api/v1/files/upload"
-        headers = {'Authorization': f'Bearer {IK_PRIVATE_KEY}'}
-        
-        with open(file_path, 'rb') as f:
-            response = requests.post(url, files={'file': f}, data={
-                'fileName': f"vertical_jump_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4",
-                'folder': 'analyzed-videos'
-            })
-            response.raise_for_status()
-            return response.json().get('url')
+    # The first frame with a pose sets the reference height for the starting position
+    present_idx = np.flatnonzero(track.present)
+    if len(present_idx) == 0:
+        return {"max_jump_height": np.zeros(track.frame_count)}
+    start_height = hip_y[present_idx[0]]
 
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to upload to ImageKit: {e}", file=sys.stderr)
-        return None
+    # Calculate current jump height (in relative units) and keep the running max
+    jump_height = np.where(track.present, start_height - hip_y, 0.0)
+    max_jump_height = np.maximum.accumulate(np.maximum(jump_height, 0.0))
+    return {"max_jump_height": max_jump_height}
 
-def analyze_vertical_jump(video_path):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    cap = cv2.VideoCapture(video_path)
+def score_vertical_jump(track, series=None):
+    if series is None:
+        series = vertical_jump_series(track)
 
-    if not cap.isOpened():
-        return {"error": "Could not open video file."}
-
-    # --- Video Writer Setup ---
-    temp_output_video_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    out = cv2.VideoWriter(temp_output_video_path, fourcc, fps, (width, height))
-
-    # --- Analysis Variables ---
-    max_jump_height = 0
-    start_height = 0
-    
-    # --- Main Analysis and Rendering Loop ---
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(frame_rgb)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
-            # Use hip landmarks for height calculation
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-            hip_y = (left_hip.y + right_hip.y) / 2
-            
-            # Set a reference height for the starting position
-            if start_height == 0:
-                start_height = hip_y
-            
-            # Calculate current jump height (in relative units)
-            jump_height = start_height - hip_y
-            
-            # Update max jump height
-            if jump_height > max_jump_height:
-                max_jump_height = jump_height
-                
-            # --- Draw landmarks and text on the frame ---
-            mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-            
-            # Display the jump height
-            cv2.putText(frame, f'Jump: {max_jump_height:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-            
-        out.write(frame)
-        
-    cap.release()
-    out.release()
-    pose.close()
-
-    # --- Final Score and Upload ---
     # Convert pixels to a more meaningful score if possible (requires calibration)
     # For now, we'll use pixel-based score
+    max_jump_height = float(series["max_jump_height"][-1]) if track.frame_count else 0.0
     final_score = round(max_jump_height, 2)
-    analyzed_video_url = upload_to_imagekit(temp_output_video_path)
-    
-    if os.path.exists(temp_output_video_path):
-        os.remove(temp_output_video_path)
 
     return {
         "testType": "Vertical Jump",
         "result": { "jump_height_pixels": final_score },
         "score": final_score,
-        "analyzedVideoUrl": analyzed_video_url
     }
 
+def render_vertical_jump(video_path, track, series=None):
+    """Writes the annotated video for a track to a temp file and returns its path."""
+    if series is None:
+        series = vertical_jump_series(track)
+
+    def draw_overlay(frame, i):
+        # Display the jump height
+        if track.present[i]:
+            cv2.putText(frame, f'Jump: {series["max_jump_height"][i]:.2f} px', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+
+    return render_annotated_video(video_path, track, draw_overlay)
+
+def overlay_vertical_jump(track, series=None):
+    """Compact overlay for drawing this test's annotations on the client (see overlay_track.py)."""
+    if series is None:
+        series = vertical_jump_series(track)
+    return encode_overlay(track, counters={"jump_height": series["max_jump_height"]})
+
+def analyze_vertical_jump(video_path, pose=None, track=None, render=True, overlay=False):
+    if track is None:
+        track = cached_extract_track(video_path, pose=pose, settings=extraction_settings(['Vertical Jump']))
+    if track is None:
+        return {"error": "Could not open video file."}
+
+    series = vertical_jump_series(track)
+    result = score_vertical_jump(track, series)
+    if overlay:
+        result["overlay"] = overlay_vertical_jump(track, series)
+
+    if not render:
+        # Score-only: the annotated video can be rendered later (render_video.py)
+        result["analyzedVideoUrl"] = None
+        return result
+
+    # --- Upload the annotated video in the background (see uploader.py) ---
+    temp_output_video_path = render_vertical_jump(video_path, track, series)
+    result["analyzedVideoUrl"] = None
+    file_name = f"vertical_jump_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
+    result["analyzedVideo"] = uploader.submit(temp_output_video_path, file_name)
+    return result
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         video_path = sys.argv[1]
-        result = analyze_vertical_jump(video_path)
+        # --score-only skips rendering and uploading the annotated video;
+        # --overlay adds a compact overlay track for client-side drawing
+        result = analyze_vertical_jump(video_path, render='--score-only' not in sys.argv[2:],
+                                       overlay='--overlay' in sys.argv[2:])
         print(json.dumps(result))
     else:
         print(json.dumps({"error": "No video path provided"}))
\ No newline at end of file
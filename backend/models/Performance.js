@@ -20,6 +20,15 @@ const PerformanceSchema = new mongoose.Schema({
   analyzedVideoUrl: {
     type: String
   },
+  // The URL of the original upload
+  videoUrl: {
+    type: String
+  },
+  // Compact landmark/counter track the player draws over the original upload
+  // (see ml-services/overlay_track.py); replaces a separately rendered video
+  overlay: {
+    type: Object
+  },
   // The full JSON result from the Python analysis
   result: {
     type: Object,
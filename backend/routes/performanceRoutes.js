@@ -7,10 +7,32 @@ const multer = require('multer');
 const { spawn } = require('child_process');
 const fs = require('fs');
 const path = require('path');
+const { waitForUpload } = require('../lib/uploadService');
 
 // Configure Multer for video file storage
 const upload = multer({ dest: 'uploads/' });
 
+// Fills in a saved record's analyzedVideoUrl once the annotated video the
+// analysis handed to the upload service is uploaded
+function recordUploadWhenDone(performanceId, finalResult) {
+  const handle = finalResult.analyzedVideo;
+  if (!handle || !handle.statusFile || !['pending', 'uploading'].includes(handle.status)) return;
+  waitForUpload(handle)
+    .then(async (status) => {
+      if (!status || status.status !== 'done') {
+        console.error(`Annotated video for ${performanceId} was not uploaded:`, status ? status.error : 'upload lost');
+        return;
+      }
+      const settled = { ...finalResult, analyzedVideoUrl: status.url, analyzedVideo: { ...handle, status: 'done' } };
+      await Performance.findByIdAndUpdate(performanceId, {
+        analyzedVideoUrl: status.url,
+        result: JSON.stringify(settled),
+        analysisData: settled,
+      });
+    })
+    .catch((e) => console.error(`Failed to save the annotated video URL for ${performanceId}:`, e));
+}
+
 // @route POST /api/performance
 // @desc Save a new performance record (old route for direct analysis)
 router.post('/', auth, async (req, res) => {
@@ -65,10 +87,12 @@ router.post('/upload', auth, upload.single('video'), async (req, res) => {
           testType: finalResult.testType,
           result: JSON.stringify(finalResult),
           analysisData: finalResult,
+          analyzedVideoUrl: finalResult.analyzedVideoUrl,
           videoPath,
           verified: true
         });
         await newPerformance.save();
+        recordUploadWhenDone(newPerformance._id, finalResult);
 
         res.json({ msg: 'Video and analysis uploaded successfully', finalResult });
 
@@ -91,13 +115,18 @@ router.post('/upload', auth, upload.single('video'), async (req, res) => {
 // @route POST /api/performance/analyze
 // @desc Trigger server-side analysis from a video URL
 router.post('/analyze', auth, async (req, res) => {
-  const { videoUrl, testType } = req.body;
+  const { videoUrl, testType, scoreOnly } = req.body;
   if (!videoUrl || !testType) {
     return res.status(400).json({ msg: 'Missing video URL or test type.' });
   }
 
   try {
-    const pythonProcess = spawn('python', ['ml-services/analyze_video.py', videoUrl, testType]);
+    // The overlay lets the player draw the analysis over the original upload;
+    // clients that only use it can pass scoreOnly to skip rendering and
+    // uploading a second, annotated copy of the video
+    const args = ['ml-services/analyze_video.py', videoUrl, testType, '--overlay'];
+    if (scoreOnly) args.push('--score-only');
+    const pythonProcess = spawn('python', args);
     let finalAnalysis = '';
     let pythonError = ''; // Add a new variable to capture stderr
 
@@ -117,17 +146,20 @@ router.post('/analyze', auth, async (req, res) => {
       }
 
       try {
-        const finalResult = JSON.parse(finalAnalysis);
+        const { overlay, ...finalResult } = JSON.parse(finalAnalysis);
         
         const newPerformance = new Performance({
           userId: req.user.id,
           testType: finalResult.testType,
           result: JSON.stringify(finalResult),
           analysisData: finalResult,
+          analyzedVideoUrl: finalResult.analyzedVideoUrl,
           videoUrl,
+          overlay,
           verified: true
         });
         await newPerformance.save();
+        recordUploadWhenDone(newPerformance._id, finalResult);
 
         res.json({ msg: 'Analysis completed successfully', finalResult });
       } catch (e) {
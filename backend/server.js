@@ -7,6 +7,8 @@ const mongoose = require('mongoose');
 const cors = require('cors');
 const { spawn } = require('child_process');
 const jwt = require('jsonwebtoken');
+const { encodeFrame, encodeControl, frameFromMessage, createResultParser } = require('./lib/frameProtocol');
+const { startUploadService } = require('./lib/uploadService');
 
 const authRoutes = require('./routes/authRoutes');
 const performanceRoutes = require('./routes/performanceRoutes');
@@ -21,6 +23,60 @@ const server = http.createServer(app);
 const allowedOrigins = ["http://localhost:5173", "http://localhost:3000"];
 const io = new Server(server, { cors: { origin: allowedOrigins, methods: ["GET", "POST"] } });
 const jwtSecret = process.env.JWT_SECRET;
+// REALTIME_PROTOCOL=binary streams raw frames to realtime_analysis.py instead
+// of JSON lines with base64 images (see lib/frameProtocol.js)
+const binaryProtocol = process.env.REALTIME_PROTOCOL === 'binary';
+let nextSessionId = 1;
+
+// REALTIME_SERVICE=1 runs every live session in one realtime_server.py
+// (shared Pose pool, fair scheduling) instead of a process per socket;
+// sessions are multiplexed over the binary protocol
+const realtimeService = process.env.REALTIME_SERVICE === '1';
+const serviceSessions = new Map(); // session id -> socket
+const serviceFinals = new Map(); // session id -> callback for its final result
+let serviceProcess = null;
+// How long end-analysis waits for the analysis's own final result before
+// saving the one the client sent
+const FINAL_RESULT_TIMEOUT_MS = 5000;
+
+function getRealtimeService() {
+    if (serviceProcess) return serviceProcess;
+    serviceProcess = spawn('python', ['ml-services/realtime_server.py']);
+    serviceProcess.stdout.on('data', createResultParser(
+        (analysisResult, { session, timestamp }) => {
+            const socket = serviceSessions.get(session);
+            if (!socket) return;
+            if (analysisResult.error) {
+                socket.emit('error', { msg: analysisResult.error });
+                return;
+            }
+            if (analysisResult.final) {
+                serviceSessions.delete(session);
+                const onFinal = serviceFinals.get(session);
+                serviceFinals.delete(session);
+                if (onFinal) onFinal(analysisResult);
+            }
+            socket.emit('analysis-result', { ...analysisResult, frameTimestamp: timestamp });
+        },
+        (e) => console.error("Failed to parse result from realtime service:", e)
+    ));
+    serviceProcess.stderr.on('data', (data) => console.error(`Realtime service stderr: ${data.toString()}`));
+    serviceProcess.on('close', (code) => {
+        console.log(`Realtime service closed with code ${code}.`);
+        for (const socket of serviceSessions.values()) {
+            socket.emit('error', { msg: 'Realtime analysis service stopped.' });
+        }
+        for (const onFinal of serviceFinals.values()) onFinal(null);
+        serviceSessions.clear();
+        serviceFinals.clear();
+        serviceProcess = null;
+    });
+    return serviceProcess;
+}
+
+function writeParts(stream, parts) {
+    for (const part of parts) stream.write(part);
+}
 
 app.use(cors({ origin: allowedOrigins }));
 app.use(express.json());
@@ -30,6 +86,9 @@ mongoose.connect(process.env.MONGO_URI, { useNewUrlParser: true, useUnifiedTopol
   .then(() => console.log('MongoDB connected'))
   .catch(err => console.error('MongoDB connection error:', err));
 
+// Annotated videos upload in the background through one shared service
+startUploadService();
+
 // API Routes
 app.use('/api/auth', authRoutes);
 app.use('/api/performance', performanceRoutes);
@@ -40,6 +99,41 @@ io.on('connection', (socket) => {
     console.log(`User connected: ${socket.id}`);
     let userId = null;
     let pythonProcess = null;
+    let onFinal = null; // Set while end-analysis waits for the final result
+    const sessionId = nextSessionId++;
+
+    const endServiceSession = () => {
+        if (serviceProcess && serviceSessions.has(sessionId)) {
+            writeParts(serviceProcess.stdin, encodeControl(sessionId, { type: 'end' }));
+        }
+    };
+
+    const emitResult = (analysisResult) => {
+        if (analysisResult.final && onFinal) onFinal(analysisResult);
+        socket.emit('analysis-result', analysisResult);
+    };
+
+    // Ends the analysis and resolves with its final result (sent
+    // regardless of whether it changed), or null if none comes in time
+    const finishAnalysis = () => new Promise((resolve) => {
+        const finish = (result) => {
+            clearTimeout(timer);
+            onFinal = null;
+            serviceFinals.delete(sessionId);
+            resolve(result);
+        };
+        const timer = setTimeout(() => finish(null), FINAL_RESULT_TIMEOUT_MS);
+        if (realtimeService && serviceProcess && serviceSessions.has(sessionId)) {
+            serviceFinals.set(sessionId, finish);
+            endServiceSession();
+        } else if (pythonProcess) {
+            onFinal = finish;
+            pythonProcess.on('close', () => finish(null));
+            pythonProcess.stdin.end(); // Signal the end of the stream
+        } else {
+            finish(null);
+        }
+    });
 
     socket.on('authenticate', (token) => {
         try {
@@ -58,6 +152,13 @@ io.on('connection', (socket) => {
             return;
         }
 
+        if (realtimeService) {
+            console.log(`Starting session ${sessionId} for test type: ${testType}`);
+            serviceSessions.set(sessionId, socket);
+            writeParts(getRealtimeService().stdin, encodeControl(sessionId, { type: 'start', testType }));
+            return;
+        }
+
         if (pythonProcess) {
             console.log('Analysis already running, terminating old process.');
             pythonProcess.kill();
@@ -65,17 +166,32 @@ io.on('connection', (socket) => {
 
         console.log(`Starting analysis for test type: ${testType}`);
         // ✅ CRITICAL: Spawn a single, long-running Python process
-        pythonProcess = spawn('python', ['ml-services/realtime_analysis.py', testType]);
+        const args = ['ml-services/realtime_analysis.py', testType];
+        if (binaryProtocol) args.push('--binary');
+        pythonProcess = spawn('python', args);
 
         // Listen for data from the Python script's stdout
-        pythonProcess.stdout.on('data', (data) => {
-            try {
-                const analysisResult = JSON.parse(data.toString());
-                socket.emit('analysis-result', analysisResult);
-            } catch (e) {
-                console.error("Failed to parse JSON from Python script:", e);
-            }
-        });
+        if (binaryProtocol) {
+            pythonProcess.stdout.on('data', createResultParser(
+                (analysisResult, { timestamp }) => emitResult({ ...analysisResult, frameTimestamp: timestamp }),
+                (e) => console.error("Failed to parse result from Python script:", e)
+            ));
+        } else {
+            // One JSON result per line; a chunk can hold several, or part of one
+            let buffered = '';
+            pythonProcess.stdout.on('data', (data) => {
+                const lines = (buffered + data.toString()).split('\n');
+                buffered = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    try {
+                        emitResult(JSON.parse(line));
+                    } catch (e) {
+                        console.error("Failed to parse JSON from Python script:", e);
+                    }
+                }
+            });
+        }
 
         // Listen for errors from the Python script
         pythonProcess.stderr.on('data', (data) => {
@@ -91,20 +207,35 @@ io.on('connection', (socket) => {
     });
 
     socket.on('video-stream', (frameData) => {
+        if (realtimeService) {
+            const frame = userId && serviceSessions.has(sessionId) && frameFromMessage(frameData);
+            if (frame) writeParts(serviceProcess.stdin, encodeFrame({ ...frame, session: sessionId }));
+            return;
+        }
         if (!userId || !pythonProcess) {
             // Drop the frame if not authenticated or if analysis isn't running
             return;
         }
+        if (binaryProtocol) {
+            // Binary frames ({ data, encoding, width, height, timestamp }) or
+            // legacy base64 JPEGs, framed without base64 or JSON
+            const frame = frameFromMessage(frameData);
+            if (!frame) return;
+            writeParts(pythonProcess.stdin, encodeFrame({ ...frame, session: sessionId }));
+            return;
+        }
         // ✅ CRITICAL: Stream each frame directly to the Python process's stdin
         pythonProcess.stdin.write(frameData);
     });
 
-    socket.on('end-analysis', async (finalResult) => {
+    socket.on('end-analysis', async (clientResult) => {
         if (!userId) return;
 
         console.log('Finalizing analysis and saving results.');
+        // The analysis's own final result; the client only has the results
+        // it was sent, and unchanged ones are skipped
+        const finalResult = (await finishAnalysis()) || clientResult;
         if (pythonProcess) {
-            pythonProcess.stdin.end(); // Signal the end of the stream
             pythonProcess.kill();
         }
 
@@ -127,6 +258,8 @@ io.on('connection', (socket) => {
 
     socket.on('disconnect', () => {
         console.log(`User disconnected: ${socket.id}`);
+        endServiceSession();
+        serviceSessions.delete(sessionId);
         if (pythonProcess) {
             pythonProcess.kill(); // Clean up the Python process on disconnect
         }
@@ -13,6 +13,7 @@ import {
   Legend,
 } from 'chart.js';
 import { Line } from 'react-chartjs-2';
+import OverlayPlayer from './OverlayPlayer.jsx';
 
 ChartJS.register(
   CategoryScale,
@@ -30,7 +31,7 @@ const Dashboard = () => {
   const [performanceData, setPerformanceData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
-  const [modalVideoUrl, setModalVideoUrl] = useState(null);
+  const [modalTest, setModalTest] = useState(null);
   const [leaderboard, setLeaderboard] = useState([]);
   const [leaderboardTestType, setLeaderboardTestType] = useState('Sit Ups');
   const [loadingLeaderboard, setLoadingLeaderboard] = useState(false);
@@ -121,8 +122,11 @@ const Dashboard = () => {
 
   const hasAchievedSitUpBadge = sitUpData.some(p => (p.score || (p.result && p.result.count)) >= 50);
 
-  const openModal = (url) => setModalVideoUrl(url);
-  const closeModal = () => setModalVideoUrl(null);
+  // Tests analysed with an overlay are drawn over the original upload;
+  // older ones have a separately rendered annotated video.
+  const hasOverlay = (test) => Boolean(test.overlay && test.videoUrl);
+  const openModal = (test) => setModalTest(test);
+  const closeModal = () => setModalTest(null);
 
   const allTestTypes = ['Sit Ups', 'Vertical Jump', 'Shuttle Run', 'Endurance Run', 'Broad Jump'];
 
@@ -199,9 +203,9 @@ const Dashboard = () => {
                         </p>
                       </td>
                       <td className="px-5 py-5 border-b border-gray-200 bg-white text-sm">
-                        {test.analyzedVideoUrl && (
+                        {(test.analyzedVideoUrl || hasOverlay(test)) && (
                           <button
-                            onClick={() => openModal(test.analyzedVideoUrl)}
+                            onClick={() => openModal(test)}
                             className="text-blue-600 hover:text-blue-900"
                           >
                             View Video
@@ -282,7 +286,7 @@ const Dashboard = () => {
         )}
       </div>
 
-      {modalVideoUrl && (
+      {modalTest && (
         <div className="fixed inset-0 z-50 flex items-center justify-center bg-black bg-opacity-75">
           <div className="bg-white p-4 rounded-lg shadow-xl relative max-w-4xl w-full">
             <button
@@ -292,7 +296,11 @@ const Dashboard = () => {
               &times;
             </button>
             <div className="mt-4">
-              <video controls src={modalVideoUrl} className="w-full h-auto" />
+              {hasOverlay(modalTest) ? (
+                <OverlayPlayer videoUrl={modalTest.videoUrl} overlay={modalTest.overlay} />
+              ) : (
+                <video controls src={modalTest.analyzedVideoUrl} className="w-full h-auto" />
+              )}
             </div>
           </div>
         </div>
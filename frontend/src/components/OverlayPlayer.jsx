@@ -0,0 +1,57 @@
+import React, { useState, useEffect, useRef } from 'react';
+import { decodeOverlay, drawOverlay, frameAt } from '../utils/overlayTrack.js';
+
+// Counter names from the analyzers and how to label them on screen
+const COUNTER_LABELS = {
+  reps: 'Reps',
+  cheat: 'Cheating detected',
+  jump_height: 'Jump',
+  distance: 'Distance',
+  laps: 'Laps',
+};
+
+// Plays the original upload and draws the analysis overlay on top of it,
+// instead of streaming a second, annotated copy of the video.
+const OverlayPlayer = ({ videoUrl, overlay }) => {
+  const videoRef = useRef(null);
+  const canvasRef = useRef(null);
+  const [decoded, setDecoded] = useState(null);
+  const [error, setError] = useState('');
+
+  useEffect(() => {
+    let cancelled = false;
+    decodeOverlay(overlay)
+      .then((result) => { if (!cancelled) setDecoded(result); })
+      .catch((err) => {
+        console.error('Failed to decode overlay:', err);
+        if (!cancelled) setError('Could not load the analysis overlay.');
+      });
+    return () => { cancelled = true; };
+  }, [overlay]);
+
+  useEffect(() => {
+    if (!decoded) return undefined;
+    const canvas = canvasRef.current;
+    const ctx = canvas.getContext('2d');
+    canvas.width = decoded.width;
+    canvas.height = decoded.height;
+
+    let handle;
+    const draw = () => {
+      drawOverlay(ctx, decoded, frameAt(decoded, videoRef.current.currentTime), COUNTER_LABELS);
+      handle = requestAnimationFrame(draw);
+    };
+    draw();
+    return () => cancelAnimationFrame(handle);
+  }, [decoded]);
+
+  return (
+    <div className="relative">
+      <video ref={videoRef} controls src={videoUrl} className="w-full h-auto" />
+      <canvas ref={canvasRef} className="absolute top-0 left-0 w-full h-full pointer-events-none" />
+      {error && <p className="text-red-500 text-sm mt-2">{error}</p>}
+    </div>
+  );
+};
+
+export default OverlayPlayer;
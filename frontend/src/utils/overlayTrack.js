@@ -0,0 +1,126 @@
+// Decoder and renderer for the compact overlay tracks produced by
+// backend/ml-services/overlay_track.py. See that file for the format.
+
+// MediaPipe's POSE_CONNECTIONS
+const POSE_CONNECTIONS = [
+  [0, 1], [0, 4], [1, 2], [2, 3], [3, 7], [4, 5], [5, 6], [6, 8], [9, 10],
+  [11, 12], [11, 13], [11, 23], [12, 14], [12, 24], [13, 15], [14, 16],
+  [15, 17], [15, 19], [15, 21], [16, 18], [16, 20], [16, 22], [17, 19],
+  [18, 20], [23, 24], [23, 25], [24, 26], [25, 27], [26, 28], [27, 29],
+  [27, 31], [28, 30], [28, 32], [29, 31], [30, 32],
+];
+const NUM_LANDMARKS = 33;
+const VALUES_PER_FRAME = NUM_LANDMARKS * 3; // x, y, visibility
+const MIN_VISIBILITY = 0.5;
+
+// base64(zlib(bytes)) -> DataView over the inflated bytes
+const inflate = async (data) => {
+  const bytes = Uint8Array.from(atob(data), (c) => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new DataView(await new Response(stream).arrayBuffer());
+};
+
+// Running sum over frame-to-frame deltas. Typed array stores wrap the same
+// way the encoder's int16/int32 arithmetic did.
+const undelta = (view, ArrayType, stride) => {
+  const size = ArrayType.BYTES_PER_ELEMENT;
+  const values = new ArrayType(view.byteLength / size);
+  for (let i = 0; i < values.length; i++) {
+    const delta = size === 2 ? view.getInt16(i * 2, true) : view.getInt32(i * 4, true);
+    values[i] = (i >= stride ? values[i - stride] : 0) + delta;
+  }
+  return values;
+};
+
+// Value of a [[frame, value], ...] change-point list at a frame
+const valueAt = (points, frame) => {
+  let lo = 0;
+  let hi = points.length - 1;
+  let value = 0;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    if (points[mid][0] <= frame) {
+      value = points[mid][1];
+      lo = mid + 1;
+    } else {
+      hi = mid - 1;
+    }
+  }
+  return value;
+};
+
+export const decodeOverlay = async (overlay) => {
+  const [landmarkView, timestampView] = await Promise.all([
+    inflate(overlay.landmarks),
+    inflate(overlay.timestamps),
+  ]);
+  return {
+    ...overlay,
+    landmarks: undelta(landmarkView, Int16Array, VALUES_PER_FRAME),
+    timestamps: undelta(timestampView, Int32Array, 1), // milliseconds
+  };
+};
+
+// Index of the last frame shown at `seconds` into the video
+export const frameAt = (decoded, seconds) => {
+  const ms = seconds * 1000;
+  let lo = 0;
+  let hi = decoded.frames - 1;
+  let frame = 0;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    if (decoded.timestamps[mid] <= ms) {
+      frame = mid;
+      lo = mid + 1;
+    } else {
+      hi = mid - 1;
+    }
+  }
+  return frame;
+};
+
+export const countersAt = (decoded, frame) => Object.fromEntries(
+  Object.entries(decoded.counters).map(([name, points]) => [name, valueAt(points, frame)])
+);
+
+// Draws one frame's skeleton and counters onto a canvas the size of the video
+export const drawOverlay = (ctx, decoded, frame, labels = {}) => {
+  const { width, height } = ctx.canvas;
+  ctx.clearRect(0, 0, width, height);
+
+  if (valueAt(decoded.present, frame)) {
+    const offset = frame * VALUES_PER_FRAME;
+    const point = (i) => ({
+      x: (decoded.landmarks[offset + i * 3] / decoded.scale) * width,
+      y: (decoded.landmarks[offset + i * 3 + 1] / decoded.scale) * height,
+      visible: decoded.landmarks[offset + i * 3 + 2] / decoded.scale >= MIN_VISIBILITY,
+    });
+
+    ctx.strokeStyle = 'rgb(224, 224, 224)';
+    ctx.lineWidth = 2;
+    for (const [a, b] of POSE_CONNECTIONS) {
+      const start = point(a);
+      const end = point(b);
+      if (!start.visible || !end.visible) continue;
+      ctx.beginPath();
+      ctx.moveTo(start.x, start.y);
+      ctx.lineTo(end.x, end.y);
+      ctx.stroke();
+    }
+    ctx.fillStyle = 'rgb(255, 0, 0)';
+    for (let i = 0; i < NUM_LANDMARKS; i++) {
+      const p = point(i);
+      if (!p.visible) continue;
+      ctx.beginPath();
+      ctx.arc(p.x, p.y, 3, 0, 2 * Math.PI);
+      ctx.fill();
+    }
+  }
+
+  ctx.font = `${Math.max(16, Math.round(height / 24))}px sans-serif`;
+  ctx.fillStyle = 'rgb(0, 0, 255)';
+  Object.entries(countersAt(decoded, frame)).forEach(([name, value], i) => {
+    const label = labels[name] || name;
+    ctx.fillText(`${label}: ${value}`, 10, 30 + i * 30);
+  });
+};